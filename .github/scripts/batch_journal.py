@@ -0,0 +1,56 @@
+import os
+import json
+import time
+import threading
+
+# ==============================================================================
+# Hàng đợi yêu cầu dạng JSON Lines + nhật ký trạng thái để chạy lại từ chỗ bị dừng
+# ==============================================================================
+
+
+def iter_requests(path):
+    """Đọc file JSONL theo từng dòng (không nạp toàn bộ file), trả về (số dòng, request)."""
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                yield line_no, json.loads(line)
+            except ValueError as e:
+                yield line_no, {"_error": f"Dòng {line_no} không phải JSON hợp lệ: {e}"}
+
+
+class Journal:
+    """Nhật ký append-only: mỗi dòng là trạng thái mới nhất của một request (done/failed) kèm thời gian chạy."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Dòng cuối có thể bị cắt ngang nếu batch trước bị kill
+                    self.entries[entry["id"]] = entry
+
+    def status(self, request_id):
+        return self.entries.get(request_id, {}).get("status")
+
+    def is_done(self, request_id):
+        return self.status(request_id) == "done"
+
+    def record(self, request_id, status, latency, error=None):
+        entry = {"id": request_id, "status": status, "latency": round(latency, 3), "finished_at": time.time()}
+        if error:
+            entry["error"] = str(error)[:500]
+        with self.lock:
+            self.entries[request_id] = entry
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        return entry
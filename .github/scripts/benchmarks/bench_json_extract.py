@@ -0,0 +1,104 @@
+import re
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+# ==============================================================================
+# Benchmark tách JSON từ phản hồi model nhiều MB: regex + json.loads cũ so với json_extract (một lượt quét + sửa lỗi)
+# ==============================================================================
+BENCH_DIR = Path(__file__).resolve().parent
+SCRIPTS_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(SCRIPTS_DIR))
+sys.path.insert(0, str(BENCH_DIR))
+from fakes import synthetic_file_tree
+from json_extract import JsonExtractor, extract_json
+
+TRAILING_COMMA_RE = re.compile(r'(["}])(\n\s*\})')
+# Kích thước ~1MB của synthetic_file_tree (số file); nhân theo số MB cần đo
+FILES_PER_MB = 620
+CHUNK_SIZE = 64 * 1024
+
+
+def legacy_extract(text):
+    """Cách cũ của genesis.parse_json_response: khối ```json (lazy) rồi `{.*}` (greedy), json.loads(strict=False)."""
+    match = re.search(r'```json\s*(\{.*?\})\s*```', text, re.DOTALL) or re.search(r'(\{.*\})', text, re.DOTALL)
+    if not match:
+        raise ValueError("không có JSON")
+    return json.loads(match.group(1), strict=False)
+
+
+def count_files(node):
+    return sum(count_files(value) if isinstance(value, dict) else 1 for value in node.values())
+
+
+def make_responses(size_mb):
+    """Các kiểu phản hồi hay gặp; mỗi kiểu có cùng cây file khoảng `size_mb` MB."""
+    body = json.dumps(synthetic_file_tree(int(size_mb * FILES_PER_MB)), indent=2)
+    fenced = lambda payload: f"Đây là cấu trúc dự án:\n```json\n{payload}\n```\nGhi chú: cập nhật {{state}} trong main.dart."
+    return {
+        "clean": fenced(body),
+        "raw_newlines": fenced(body.replace("\\n", "\n")),
+        "trailing_commas": fenced(TRAILING_COMMA_RE.sub(r"\1,\2", body)),
+        "stray_braces": f"Dùng {{state}} cho widget, cấu trúc như sau:\n{body}\nXong {{}}.",
+        # `{` lẻ trong văn xuôi trước fence (không đóng), kể cả khi nằm trong dấu nháy
+        "unbalanced_prose": f"Sửa lỗi dấu `{{` bị thiếu:\n```json\n{body}\n```",
+        "quoted_brace": f'Sửa lỗi dấu "{{" bị thiếu:\n```json\n{body}\n```',
+        "truncated": fenced(body)[: int(len(body) * 0.97)],
+    }
+
+
+def timed(call, repeat):
+    """(kết quả hoặc exception, thời gian nhỏ nhất giây)."""
+    best, outcome = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        try:
+            outcome = call()
+        except ValueError as e:
+            outcome = e
+        best = min(best, time.perf_counter() - started)
+    return outcome, best
+
+
+def describe(outcome):
+    if isinstance(outcome, Exception):
+        return "lỗi"
+    value = outcome[0] if isinstance(outcome, tuple) else outcome
+    return f"{count_files(value)} file"
+
+
+def chunked(text):
+    extractor = JsonExtractor()
+    for start in range(0, len(text), CHUNK_SIZE):
+        extractor.feed(text[start:start + CHUNK_SIZE])
+    return extractor.finish()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark tách JSON từ phản hồi model")
+    parser.add_argument("--sizes", default="1,4,16", help="Kích thước phản hồi (MB), phân tách bằng dấu phẩy")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{'kiểu':<18}{'MB':>6}{'cũ (ms)':>10}{'cũ':>12}{'mới (ms)':>10}{'mới':>12}{'stream (ms)':>13}{'mới MB/s':>10}")
+    for size in [float(s) for s in args.sizes.split(",")]:
+        for kind, text in make_responses(size).items():
+            mb = len(text.encode("utf-8")) / 1e6
+            old, old_s = timed(lambda: legacy_extract(text), args.repeat)
+            new, new_s = timed(lambda: extract_json(text), args.repeat)
+            streamed, stream_s = timed(lambda: chunked(text), args.repeat)
+            print(f"{kind:<18}{mb:>6.1f}{old_s * 1000:>10.1f}{describe(old):>12}{new_s * 1000:>10.1f}{describe(new):>12}{stream_s * 1000:>13.1f}{mb / new_s:>10.1f}")
+            if isinstance(new, Exception) or describe(new) != describe(streamed):
+                failures.append(f"{kind}/{size:g}MB")
+
+    if failures:
+        print(f"❌ json_extract không tách được (hoặc stream cho kết quả khác): {', '.join(failures)}")
+        sys.exit(1)
+    print("✅ json_extract tách được mọi kiểu phản hồi.")
+
+
+if __name__ == "__main__":
+    main()
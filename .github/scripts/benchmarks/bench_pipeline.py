@@ -0,0 +1,184 @@
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import tempfile
+import contextlib
+import subprocess
+from pathlib import Path
+
+# ==============================================================================
+# Benchmark các giai đoạn của pipeline trên GitHub/Gemini giả lập (không cần mạng, không tốn quota)
+# Mỗi (giai đoạn, kích thước) chạy trong một tiến trình riêng để đo peak RSS độc lập.
+# ==============================================================================
+BENCH_DIR = Path(__file__).resolve().parent
+SCRIPTS_DIR = BENCH_DIR.parent
+STAGES = ["flatten", "parse", "commit", "update", "secrets", "debugger_log", "factory_log"]
+FILE_STAGES = {"flatten", "parse", "commit", "update"}
+# Tỉ lệ file bị sửa mỗi lần sinh lại trong giai đoạn update (ngoài ra luôn thêm 1 file và xóa 1 file)
+UPDATE_CHANGE_RATIO = 0.01
+LOG_STAGES = {"debugger_log", "factory_log"}
+# Các biến môi trường phải được đặt trước khi import script: tắt cache/trace/thống kê model, nới quota của rate limiter
+BENCH_ENV = {"GEMINI_CACHE_MODE": "off", "TRACE_FILE": "", "MODEL_STATS_FILE": "", "GEMINI_RPM": "100000", "GEMINI_TPM": "1000000000"}
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+# ------------------------------------------------------------------------------
+# Phần chạy trong tiến trình con
+# ------------------------------------------------------------------------------
+def run_stage(args):
+    sys.path.insert(0, str(SCRIPTS_DIR))
+    sys.path.insert(0, str(BENCH_DIR))
+    from fakes import FakeGenai, FakeGitHub, FaultConfig, synthetic_file_tree, synthetic_public_key, uncompressed_mb
+    import gemini_client
+    import genesis
+    from github_client import GitHubClient
+
+    faults = FaultConfig(args.latency, args.jitter, args.error_rate, args.rate_limit_rate)
+    latencies, units = [], args.size
+    result = {"stage": args.stage, "size": args.size}
+
+    def timed(call):
+        started = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - started)
+
+    with contextlib.redirect_stdout(sys.stderr if args.verbose else open(os.devnull, "w")), FakeGitHub(faults) as server:
+        gh = GitHubClient("bench-token", base_url=server.base_url, pool_size=32)
+        if args.stage == "flatten":
+            tree = synthetic_file_tree(args.size)
+            for _ in range(args.repeat):
+                timed(lambda: genesis.flatten_file_tree(tree))
+        elif args.stage == "parse":
+            tree = synthetic_file_tree(args.size)
+            gemini_client._genai = FakeGenai(f"Đây là dự án:\n```json\n{json.dumps(tree)}\n```", FaultConfig(args.gemini_latency, rate_limit_rate=args.rate_limit_rate))
+            for _ in range(args.repeat):
+                timed(lambda: genesis.call_gemini_for_code("bench app", "Flutter", "gemini-1.5-flash-latest"))
+        elif args.stage == "commit":
+            genesis.gh, genesis.REPO_OWNER, genesis.COMMIT_AUTHOR = gh, "octocat", {"name": "Bench", "email": "bench@example.com"}
+            files = genesis.flatten_file_tree(synthetic_file_tree(args.size))
+            for i in range(args.repeat):
+                timed(lambda: genesis.create_and_commit_project(f"bench-{args.size}-{i}", files))
+        elif args.stage == "update":
+            genesis.gh, genesis.REPO_OWNER, genesis.COMMIT_AUTHOR = gh, "octocat", {"name": "Bench", "email": "bench@example.com"}
+            files = genesis.flatten_file_tree(synthetic_file_tree(args.size))
+            genesis.create_and_commit_project(f"bench-update-{args.size}", files)
+            # Client mới để số lời gọi HTTP chỉ tính các lần cập nhật, không tính lần tạo repo ban đầu
+            gh = genesis.gh = GitHubClient("bench-token", base_url=server.base_url, pool_size=32)
+            changed = max(1, int(args.size * UPDATE_CHANGE_RATIO))
+            for i in range(args.repeat):
+                paths = list(files)
+                files = {**files, **{path: files[path] + f"// rev {i}\n" for path in paths[:changed]}, f"lib/new_{i}.dart": f"// new {i}\n"}
+                del files[paths[-1]]
+                timed(lambda: genesis.update_project(f"bench-update-{args.size}", files))
+        elif args.stage == "secrets":
+            key = synthetic_public_key()
+            if key is None:
+                result["skipped"] = "thiếu pynacl"
+                latencies.append(0.0)
+            server.state.public_key = ("bench-key", key)
+            genesis.gh, genesis.REPO_OWNER, genesis.secret_uploader = gh, "octocat", None
+            # size = số repo; mỗi repo nhận 4 secret như genesis thật
+            for i in range(args.repeat if key else 0):
+                timed(lambda: [genesis.upload_secrets(f"bench-{i}-{n}", "a2V5c3RvcmU=", "pass", "alias", "keypass") for n in range(args.size)])
+        elif args.stage in LOG_STAGES:
+            server.state.log_zip_path = args.log_zip
+            units = uncompressed_mb(args.log_zip)
+            if args.stage == "debugger_log":
+                import debugger
+                debugger.gh = gh
+                run = lambda: debugger.get_failed_job_log("octocat/bench-app", "1")
+            else:
+                import factory_debugger_script as factory
+                factory.gh, factory.REPO_FULL_NAME, factory.FAILED_RUN_ID = gh, "octocat/ai-factory", "1"
+                run = factory.download_and_extract_logs
+            for _ in range(args.repeat):
+                timed(run)
+
+    summary = gh.metrics.summary()
+    p50 = percentile(latencies, 0.5)
+    result.update({
+        "repeat": len(latencies), "p50": p50, "p95": percentile(latencies, 0.95),
+        "throughput": units / p50 if p50 else float("inf"), "unit": "MB" if args.stage in LOG_STAGES else ("repo" if args.stage == "secrets" else "file"),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "http_calls": summary["calls"], "retries": summary["retries"], "injected_faults": server.state.injected,
+    })
+    print(json.dumps(result))
+
+
+# ------------------------------------------------------------------------------
+# Phần điều phối
+# ------------------------------------------------------------------------------
+def child_command(args, stage, size, log_zip=None):
+    command = [sys.executable, __file__, "--stage", stage, "--size", str(size), "--repeat", str(args.repeat),
+               "--latency", str(args.latency), "--jitter", str(args.jitter), "--error-rate", str(args.error_rate),
+               "--rate-limit-rate", str(args.rate_limit_rate), "--gemini-latency", str(args.gemini_latency)]
+    if log_zip:
+        command += ["--log-zip", log_zip]
+    if args.verbose:
+        command.append("--verbose")
+    return command
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline factory trên GitHub/Gemini giả lập")
+    parser.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES)
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10, 100, 1000, 5000], help="Số file của cây dự án tổng hợp")
+    parser.add_argument("--secret-repos", nargs="+", type=int, default=[1, 10])
+    parser.add_argument("--log-mb", nargs="+", type=float, default=[1, 50], help="Kích thước log chưa nén (MB), ví dụ 300 cho log lớn")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.005, help="Độ trễ mỗi request GitHub giả lập (giây)")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Tỉ lệ request trả về 502")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Tỉ lệ request trả về 429")
+    parser.add_argument("--gemini-latency", type=float, default=0.0)
+    parser.add_argument("--json-out", help="Ghi kết quả ra file JSON")
+    parser.add_argument("--verbose", action="store_true")
+    parser.add_argument("--stage", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument("--log-zip", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.stage:
+        return run_stage(args)
+
+    env = {**os.environ, **BENCH_ENV}
+    results = []
+    print(f"{'giai đoạn':<14}{'kích thước':>11}{'p50 (s)':>10}{'p95 (s)':>10}{'thông lượng':>18}{'peak RSS':>11}{'HTTP':>7}{'retry':>7}")
+    with tempfile.TemporaryDirectory(prefix="factory-bench-") as workdir:
+        log_zips = {}
+        for stage in args.stages:
+            sizes = args.sizes if stage in FILE_STAGES else args.secret_repos if stage == "secrets" else args.log_mb
+            for size in sizes:
+                log_zip = None
+                if stage in LOG_STAGES:
+                    if size not in log_zips:
+                        sys.path[:0] = [str(SCRIPTS_DIR), str(BENCH_DIR)]
+                        from fakes import write_log_zip
+                        log_zips[size] = write_log_zip(os.path.join(workdir, f"logs-{size}.zip"), size)
+                    log_zip = log_zips[size]
+                completed = subprocess.run(child_command(args, stage, int(size) if stage not in LOG_STAGES else 0, log_zip),
+                                           capture_output=True, text=True, env=env)
+                if completed.returncode != 0:
+                    print(f"{stage:<14}{size:>11}  ❌ lỗi:\n{completed.stderr[-2000:]}")
+                    continue
+                result = json.loads(completed.stdout.strip().splitlines()[-1])
+                result["size"] = size
+                results.append(result)
+                if "skipped" in result:
+                    print(f"{stage:<14}{size:>11}  bỏ qua: {result['skipped']}")
+                    continue
+                throughput = f"{result['throughput']:.1f} {result['unit']}/s"
+                print(f"{stage:<14}{size:>11}{result['p50']:>10.3f}{result['p95']:>10.3f}{throughput:>18}"
+                      f"{result['peak_rss_mb']:>8.1f} MB{result['http_calls']:>7}{result['retries']:>7}")
+    if args.json_out:
+        Path(args.json_out).write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
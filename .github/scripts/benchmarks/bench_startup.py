@@ -0,0 +1,77 @@
+import os
+import re
+import sys
+import time
+import argparse
+import subprocess
+from pathlib import Path
+
+# ==============================================================================
+# Benchmark thời gian khởi động: import từng script và chạy đường --check với ngân sách thời gian cố định
+# ==============================================================================
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = ["google.generativeai", "requests", "nacl", "zipfile"]
+IMPORT_BUDGET_MS = float(os.environ.get("IMPORT_BUDGET_MS", "150"))
+CHECK_BUDGET_MS = float(os.environ.get("CHECK_BUDGET_MS", "300"))
+
+DUMMY_ENV = {
+    "GEMINI_API_KEY": "dummy", "GOOGLE_API_KEY": "dummy", "GITHUB_TOKEN": "dummy", "GH_USER": "octocat",
+    "COMMIT_NAME": "Bench", "COMMIT_EMAIL": "bench@example.com", "GITHUB_USERNAME": "octocat",
+    "ISSUE_TITLE": "bench-app", "ISSUE_BODY": "- **Repo:** `octocat/bench-app`\n- **Workflow Run URL:** https://github.com/octocat/bench-app/actions/runs/1",
+    "ISSUE_NUMBER": "1", "FAILED_RUN_ID": "1", "REPO_TO_FIX": "octocat/ai-factory", "FILE_TO_FIX": ".github/scripts/genesis.py",
+}
+CHECK_COMMANDS = {
+    "genesis": ["--check", "--repo-name", "bench-app", "--language", "Flutter", "--model", "gemini-1.5-flash-latest", "--prompt", "bench"],
+    "debugger": ["--check"],
+    "factory_debugger_script": ["--check"],
+    "generate_app": ["--check"],
+    "dispatcher": ["--check"],
+}
+
+
+def measure_import(module):
+    """Import module trong một tiến trình mới với -X importtime; trả về (ms, các module nặng đã bị nạp)."""
+    code = f"import sys; sys.path.insert(0, {str(SCRIPTS_DIR)!r}); import {module}; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, env={**os.environ, **DUMMY_ENV})
+    if result.returncode != 0:
+        raise RuntimeError(f"Import {module} thất bại:\n{result.stderr}")
+    # Dòng importtime: "import time: self [us] | cumulative | name"; lấy cumulative của chính module
+    match = re.search(rf"^import time:\s+\d+ \|\s+(\d+) \|\s*{module}$", result.stderr, re.MULTILINE)
+    loaded = [m for m in result.stdout.strip().split(",") if m]
+    return (int(match.group(1)) / 1000 if match else float("nan")), loaded
+
+
+def measure_check(module, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, str(SCRIPTS_DIR / f"{module}.py"), *CHECK_COMMANDS[module]],
+                                capture_output=True, text=True, env={**os.environ, **DUMMY_ENV})
+        timings.append((time.perf_counter() - started) * 1000)
+        if result.returncode != 0:
+            raise RuntimeError(f"{module} --check thất bại:\n{result.stdout}{result.stderr}")
+    return sorted(timings)[len(timings) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark thời gian khởi động của các script factory")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    over_budget = []
+    print(f"{'script':<26}{'import (ms)':>12}{'--check p50 (ms)':>18}  module nặng đã nạp")
+    for module in CHECK_COMMANDS:
+        import_ms, loaded = measure_import(module)
+        check_ms = measure_check(module, args.repeat)
+        print(f"{module:<26}{import_ms:>12.1f}{check_ms:>18.1f}  {', '.join(loaded) or '-'}")
+        if import_ms > IMPORT_BUDGET_MS or check_ms > CHECK_BUDGET_MS or loaded:
+            over_budget.append(module)
+
+    if over_budget:
+        print(f"❌ Vượt ngân sách khởi động (import {IMPORT_BUDGET_MS:.0f}ms, --check {CHECK_BUDGET_MS:.0f}ms, không nạp {', '.join(HEAVY_MODULES)}): {', '.join(over_budget)}")
+        sys.exit(1)
+    print("✅ Tất cả script nằm trong ngân sách khởi động.")
+
+
+if __name__ == "__main__":
+    main()
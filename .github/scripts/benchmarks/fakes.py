@@ -0,0 +1,348 @@
+import io
+import os
+import re
+import json
+import time
+import random
+import shutil
+import hashlib
+import zipfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from git_data import git_blob_sha
+
+# ==============================================================================
+# GitHub API và Gemini SDK giả lập cho benchmark: chạy đúng code path thật, độ trễ/lỗi có thể cấu hình
+# ==============================================================================
+
+
+class FaultConfig:
+    """Độ trễ mỗi request (giây) và xác suất trả về 429/5xx."""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit_rate=0.0, retry_after="0"):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+
+    def delay(self):
+        return self.latency + random.uniform(0, self.jitter)
+
+
+def fake_sha(*parts):
+    return hashlib.sha1("\0".join(map(str, parts)).encode("utf-8")).hexdigest()
+
+
+class FakeGitHubState:
+    def __init__(self, faults, rate_limit=5000):
+        self.faults = faults
+        self.lock = threading.Lock()
+        self.counter = 0
+        self.refs = {}           # (repo, branch) -> commit sha
+        self.commits = {}        # commit sha -> tree sha
+        self.trees = {}          # tree sha -> {path: {sha, size, mode}}
+        self.repo_ids = {}
+        self.rate_limit = rate_limit
+        self.remaining = rate_limit
+        self.log_zip_path = None
+        self.public_key = None   # (key_id, base64 key) khi benchmark secrets
+        self.requests = 0
+        self.injected = 0
+
+    def next_sha(self, *parts):
+        with self.lock:
+            self.counter += 1
+            return fake_sha(self.counter, *parts)
+
+
+class FakeGitHubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    ROUTES = []
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def _send(self, status, payload=None, headers=None):
+        body = b"" if payload is None else json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        with self.state.lock:
+            self.state.remaining = max(0, self.state.remaining - 1)
+            remaining = self.state.remaining
+        self.send_header("X-RateLimit-Limit", str(self.state.rate_limit))
+        self.send_header("X-RateLimit-Remaining", str(remaining))
+        self.send_header("X-RateLimit-Reset", str(int(time.time()) + 3600))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _dispatch(self, method):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else {}
+        faults = self.state.faults
+        with self.state.lock:
+            self.state.requests += 1
+        time.sleep(faults.delay())
+        roll = random.random()
+        if roll < faults.rate_limit_rate:
+            with self.state.lock:
+                self.state.injected += 1
+            return self._send(429, {"message": "API rate limit exceeded"}, {"Retry-After": faults.retry_after})
+        if roll < faults.rate_limit_rate + faults.error_rate:
+            with self.state.lock:
+                self.state.injected += 1
+            return self._send(502, {"message": "Bad Gateway"})
+        path = self.path.split("?")[0]
+        for route_method, pattern, handler in self.ROUTES:
+            match = pattern.fullmatch(path)
+            if route_method == method and match:
+                return handler(self, body, **match.groupdict())
+        self._send(404, {"message": f"Not Found: {method} {path}"})
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_PATCH(self):
+        self._dispatch("PATCH")
+
+    # --- Các endpoint ---
+    def create_repo(self, body):
+        repo = f"octocat/{body['name']}"
+        commit_sha = self.state.next_sha(repo, "init")
+        tree_sha = self.state.next_sha(repo, "tree")
+        with self.state.lock:
+            self.state.commits[commit_sha] = tree_sha
+            self.state.refs[(repo, "main")] = commit_sha
+            self.state.repo_ids[repo] = len(self.state.repo_ids) + 1
+        self._send(201, {"full_name": repo, "id": self.state.repo_ids[repo]})
+
+    def get_user(self, body, owner):
+        self._send(200, {"login": owner, "type": "User"})
+
+    def get_repo(self, body, repo):
+        with self.state.lock:
+            repo_id = self.state.repo_ids.setdefault(repo, len(self.state.repo_ids) + 1)
+        self._send(200, {"full_name": repo, "id": repo_id})
+
+    def get_ref(self, body, repo, branch):
+        sha = self.state.refs.get((repo, branch))
+        if sha is None:
+            return self._send(404, {"message": "Not Found"})
+        host = f"http://{self.server.server_address[0]}:{self.server.server_address[1]}"
+        self._send(200, {"ref": f"refs/heads/{branch}", "object": {"sha": sha, "type": "commit", "url": f"{host}/repos/{repo}/git/commits/{sha}"}})
+
+    def update_ref(self, body, repo, branch):
+        with self.state.lock:
+            self.state.refs[(repo, branch)] = body["sha"]
+        self.get_ref(body, repo, branch)
+
+    def get_commit(self, body, repo, sha):
+        self._send(200, {"sha": sha, "tree": {"sha": self.state.commits.get(sha, fake_sha("tree", sha))}})
+
+    def create_blob(self, body, repo):
+        self._send(201, {"sha": git_blob_sha(body.get("content", ""))})
+
+    def create_tree(self, body, repo):
+        # Ghép base_tree với các phần tử mới như GitHub: `content` -> blob mới, `sha: null` -> xóa path
+        sha = self.state.next_sha(repo, "tree")
+        with self.state.lock:
+            entries = dict(self.state.trees.get(body.get("base_tree"), {}))
+            for element in body.get("tree", []):
+                if "content" in element:
+                    entries[element["path"]] = {"sha": git_blob_sha(element["content"]), "size": len(element["content"].encode("utf-8")), "mode": element["mode"]}
+                elif element.get("sha") is None:
+                    entries.pop(element["path"], None)
+                else:
+                    entries[element["path"]] = {"sha": element["sha"], "size": 0, "mode": element["mode"]}
+            self.state.trees[sha] = entries
+        self._send(201, {"sha": sha})
+
+    def get_tree(self, body, repo, sha):
+        entries = self.state.trees.get(sha, {})
+        self._send(200, {"sha": sha, "truncated": False, "tree": [{"path": path, "type": "blob", **entry} for path, entry in entries.items()]})
+
+    def create_commit(self, body, repo):
+        sha = self.state.next_sha(repo, "commit")
+        with self.state.lock:
+            self.state.commits[sha] = body["tree"]
+        self._send(201, {"sha": sha})
+
+    def public_key(self, body, scope):
+        key_id, key = self.state.public_key
+        self._send(200, {"key_id": key_id, "key": key})
+
+    def put_secret(self, body, scope, name):
+        self._send(201)
+
+    def run_logs(self, body, repo, run_id):
+        size = os.path.getsize(self.state.log_zip_path)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/zip")
+        self.send_header("Content-Length", str(size))
+        self.end_headers()
+        with open(self.state.log_zip_path, "rb") as f:
+            shutil.copyfileobj(f, self.wfile, 1 << 20)
+
+
+REPO = r"(?P<repo>[^/]+/[^/]+)"
+FakeGitHubHandler.ROUTES = [
+    ("POST", re.compile(r"/(user|orgs/[^/]+)/repos"), lambda h, body: h.create_repo(body)),
+    ("GET", re.compile(r"/users/(?P<owner>[^/]+)"), FakeGitHubHandler.get_user),
+    ("GET", re.compile(rf"/repos/{REPO}/git/refs/heads/(?P<branch>.+)"), FakeGitHubHandler.get_ref),
+    ("PATCH", re.compile(rf"/repos/{REPO}/git/refs/heads/(?P<branch>.+)"), FakeGitHubHandler.update_ref),
+    ("GET", re.compile(rf"/repos/{REPO}/git/commits/(?P<sha>\w+)"), FakeGitHubHandler.get_commit),
+    ("POST", re.compile(rf"/repos/{REPO}/git/blobs"), FakeGitHubHandler.create_blob),
+    ("POST", re.compile(rf"/repos/{REPO}/git/trees"), FakeGitHubHandler.create_tree),
+    ("GET", re.compile(rf"/repos/{REPO}/git/trees/(?P<sha>\w+)"), FakeGitHubHandler.get_tree),
+    ("POST", re.compile(rf"/repos/{REPO}/git/commits"), FakeGitHubHandler.create_commit),
+    ("GET", re.compile(r"/(?P<scope>(repos/[^/]+/[^/]+|orgs/[^/]+))/actions/secrets/public-key"), FakeGitHubHandler.public_key),
+    ("PUT", re.compile(r"/(?P<scope>(repos/[^/]+/[^/]+|orgs/[^/]+))/actions/secrets/(?P<name>[^/]+)"), FakeGitHubHandler.put_secret),
+    ("GET", re.compile(rf"/repos/{REPO}/actions/runs/(?P<run_id>\d+)/logs"), FakeGitHubHandler.run_logs),
+    ("GET", re.compile(rf"/repos/{REPO}"), FakeGitHubHandler.get_repo),
+]
+
+
+class FakeGitHub:
+    """Server HTTP cục bộ (đa luồng) mô phỏng các endpoint GitHub mà factory dùng."""
+
+    def __init__(self, faults=None):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGitHubHandler)
+        self.server.daemon_threads = True
+        self.server.state = FakeGitHubState(faults or FaultConfig())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def state(self):
+        return self.server.state
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# ==============================================================================
+# Gemini SDK giả lập: được gán vào gemini_client._genai thay cho google.generativeai
+# ==============================================================================
+class ResourceExhausted(Exception):
+    pass
+
+
+class FakeUsage:
+    def __init__(self, prompt_token_count, candidates_token_count):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+
+
+class FakeResponse:
+    def __init__(self, text, prompt):
+        self.text = text
+        self.usage_metadata = FakeUsage(len(prompt) // 4, len(text) // 4)
+
+
+class FakeGenai:
+    """Trả về `response_text` sau độ trễ cấu hình; tỉ lệ `faults.rate_limit_rate` lời gọi ném 429."""
+
+    def __init__(self, response_text="", faults=None):
+        self.response_text = response_text
+        self.faults = faults or FaultConfig()
+        self.calls = 0
+
+    def configure(self, **kwargs):
+        pass
+
+    def GenerativeModel(self, model_name, generation_config=None):
+        return FakeModel(self)
+
+
+class FakeModel:
+    def __init__(self, genai):
+        self.genai = genai
+
+    def generate_content(self, prompt, stream=False, request_options=None):
+        self.genai.calls += 1
+        time.sleep(self.genai.faults.delay())
+        if random.random() < self.genai.faults.rate_limit_rate:
+            raise ResourceExhausted("429 Resource has been exhausted")
+        response = FakeResponse(self.genai.response_text, prompt)
+        return iter([response]) if stream else response
+
+
+# ==============================================================================
+# Dữ liệu tổng hợp: cây file dự án và archive log CI
+# ==============================================================================
+def synthetic_file_tree(file_count, large_every=50, large_bytes=48_000):
+    """Cây file lồng nhau kiểu dự án Flutter; cứ `large_every` file có một file lớn (phải upload blob riêng)."""
+    tree = {}
+    for i in range(file_count):
+        parts = ["lib", f"feature_{i % 37}", f"layer_{i % 5}", f"file_{i}.dart"]
+        node = tree
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        size = large_bytes if large_every and i % large_every == large_every - 1 else 600
+        line = f"// file {i}: Widget build(BuildContext context) => Text('{i}');\n"
+        node[parts[-1]] = line * (size // len(line) + 1)
+    return tree
+
+
+def write_log_zip(path, total_mb, jobs=4, error_every_mb=25):
+    """Ghi archive log (deflate) khoảng `total_mb` MB chưa nén, có rải các khối lỗi; không giữ toàn bộ trong RAM."""
+    filler = "2026-01-01T00:00:00.0000000Z [        ] Running Gradle task 'assembleRelease'... compiling module\n"
+    error_block = ("2026-01-01T00:00:00.0000000Z lib/main.dart:42:7: Error: The getter 'foo' isn't defined for the class 'Bar'.\n"
+                   "2026-01-01T00:00:00.0000000Z FAILURE: Build failed with an exception.\n"
+                   "2026-01-01T00:00:00.0000000Z * What went wrong:\n"
+                   "2026-01-01T00:00:00.0000000Z Execution failed for task ':app:compileFlutterBuildRelease'.\n")
+    per_job = max(1, int(total_mb * (1 << 20)) // jobs)
+    chunk = filler * ((1 << 20) // len(filler))
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for job in range(jobs):
+            with archive.open(f"{job}_build-job-{job}.txt", "w") as member:
+                stream = io.TextIOWrapper(member, encoding="utf-8")
+                written = since_error = 0
+                while written < per_job:
+                    stream.write(chunk)
+                    written += len(chunk)
+                    since_error += len(chunk)
+                    if since_error >= error_every_mb << 20:
+                        stream.write(error_block)
+                        since_error = 0
+                stream.write(error_block)
+                stream.flush()
+                stream.detach()
+    return path
+
+
+def uncompressed_mb(zip_path):
+    with zipfile.ZipFile(zip_path) as archive:
+        return sum(info.file_size for info in archive.infolist()) / (1 << 20)
+
+
+def synthetic_public_key():
+    """Public key Curve25519 thật để SecretUploader mã hóa được; None nếu chưa cài pynacl."""
+    try:
+        from nacl import encoding, public
+    except ImportError:
+        return None
+    return public.PrivateKey.generate().public_key.encode(encoding.Base64Encoder()).decode()
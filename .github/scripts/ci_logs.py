@@ -0,0 +1,66 @@
+import io
+import time
+import shutil
+import tempfile
+from collections import deque
+from contextlib import contextmanager
+
+# ==============================================================================
+# Tải log GitHub Actions theo kiểu streaming, bộ nhớ chỉ tỉ lệ với cửa sổ cần giữ lại
+# ==============================================================================
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+# Giới hạn độ dài mỗi dòng khi đọc để một dòng khổng lồ không phá vỡ giới hạn bộ nhớ
+MAX_LINE_CHARS = 16_384
+# Archive nhỏ hơn ngưỡng này được giữ trong RAM, lớn hơn sẽ được ghi ra đĩa
+SPOOL_MAX_MEMORY = 8 << 20
+
+
+@contextmanager
+def open_run_logs(gh, repo_full_name, run_id, attempts=3, wait_seconds=10):
+    """Tải archive log của một workflow run vào file tạm và trả về ZipFile mở trên file đó."""
+    logs_path = f"/repos/{repo_full_name}/actions/runs/{run_id}/logs"
+    for i in range(attempts):
+        response = gh.get(logs_path, stream=True)
+        if response.status_code == 200:
+            break
+        response.close()
+        print(f"Log chưa sẵn sàng (status: {response.status_code}), đợi {wait_seconds} giây... (lần {i+1})")
+        time.sleep(wait_seconds)
+    else:
+        raise Exception("Không thể tải log lỗi sau nhiều lần thử.")
+
+    import zipfile
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY, suffix=".zip") as spool:
+        with response:
+            response.raw.decode_content = True
+            shutil.copyfileobj(response.raw, spool, DOWNLOAD_CHUNK_SIZE)
+        spool.seek(0)
+        with zipfile.ZipFile(spool) as archive:
+            yield archive
+
+
+def pick_log_member(archive, name_hint):
+    """Chọn file log khớp `name_hint` chỉ dựa trên central directory, không giải nén file nào."""
+    names = archive.namelist()
+    return next((name for name in names if name_hint in name and name.endswith('.txt')), names[0])
+
+
+def iter_member_lines(archive, member_name):
+    """Đọc từng dòng của một file trong archive, giải nén dần theo luồng."""
+    with archive.open(member_name) as raw:
+        text = io.TextIOWrapper(raw, encoding="utf-8", errors="ignore")
+        while True:
+            line = text.readline(MAX_LINE_CHARS)
+            if not line:
+                return
+            yield line.rstrip("\r\n")
+
+
+def tail_member(archive, member_name, max_lines):
+    # deque có maxlen đóng vai trò ring buffer: chỉ giữ `max_lines` dòng cuối
+    return "\n".join(deque(iter_member_lines(archive, member_name), maxlen=max_lines))
+
+
+def fetch_log_tail(gh, repo_full_name, run_id, name_hint, max_lines):
+    with open_run_logs(gh, repo_full_name, run_id) as archive:
+        return tail_member(archive, pick_log_member(archive, name_hint), max_lines)
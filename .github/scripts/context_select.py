@@ -0,0 +1,210 @@
+import os
+import re
+import posixpath
+import threading
+from collections import defaultdict
+
+from rate_limit import estimate_tokens
+from tracing import traced
+
+# ==============================================================================
+# Chọn ngữ cảnh mã nguồn cho prompt sửa lỗi: file/dòng nhắc tới trong log + láng giềng import
+# ==============================================================================
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "12000"))
+SPAN_RADIUS = 25
+WHOLE_FILE_MAX_LINES = 120
+NEIGHBOUR_HEAD_LINES = 60
+# File cấu hình luôn hữu ích khi log không chỉ ra được gì (giữ hành vi cũ của debugger)
+FALLBACK_FILES = ("pubspec.yaml", "lib/main.dart")
+MANIFEST_FILES = ("pubspec.yaml", "android/app/build.gradle", "android/app/build.gradle.kts", "android/build.gradle",
+                  "android/app/src/main/AndroidManifest.xml", "requirements.txt")
+
+# `lib/main.dart:12:5`, `/home/runner/work/x/x/app/src/Foo.kt:10:3`, `File "a.py", line 7`, `build.gradle' line: 12`
+LOCATION_RES = [
+    re.compile(r"(?:file://)?((?:[\w.\-]+/)*[\w.\-]+\.(?:dart|kt|kts|java|py|gradle|xml|yaml|yml|json|swift|js|ts)):(\d+)(?::\d+)?"),
+    re.compile(r'File "([^"]+)", line (\d+)'),
+    re.compile(r"((?:[\w.\-]+/)*[\w.\-]+\.(?:gradle|kts|xml|yaml))'? line:? (\d+)"),
+]
+# Tên file không kèm số dòng (ví dụ `Could not find pubspec.yaml`)
+BARE_PATH_RE = re.compile(r"((?:[\w.\-]+/)*[\w\-]+\.(?:dart|kt|kts|java|py|gradle|xml|yaml|yml))\b")
+
+DART_IMPORT_RE = re.compile(r"^\s*(?:import|export|part)\s+['\"]([^'\"]+)['\"]", re.MULTILINE)
+KOTLIN_IMPORT_RE = re.compile(r"^\s*import\s+([\w.]+)", re.MULTILINE)
+PY_IMPORT_RE = re.compile(r"^\s*(?:from\s+([\w.]+)\s+import|import\s+([\w.]+))", re.MULTILINE)
+PUBSPEC_NAME_RE = re.compile(r"^name:\s*([\w\-]+)", re.MULTILINE)
+
+
+def extract_locations(log_text):
+    """Trả về (danh sách (path trong log, số dòng), tập path không kèm số dòng) theo thứ tự xuất hiện."""
+    located, seen = [], set()
+    for pattern in LOCATION_RES:
+        for match in pattern.finditer(log_text):
+            key = (match.group(1), int(match.group(2)))
+            if key not in seen:
+                seen.add(key)
+                located.append(key)
+    bare = {match.group(1) for match in BARE_PATH_RE.finditer(log_text)} - {path for path, _ in located}
+    return located, bare
+
+
+class RepoIndex:
+    """Chỉ mục trong bộ nhớ của một snapshot: tra path theo hậu tố và đồ thị import hai chiều."""
+
+    def __init__(self, snapshot):
+        self.files = snapshot["files"]
+        self.lines = {}
+        self.by_basename = defaultdict(list)
+        for path in self.files:
+            self.by_basename[posixpath.basename(path)].append(path)
+        pubspec = self.files.get("pubspec.yaml", "")
+        match = PUBSPEC_NAME_RE.search(pubspec)
+        self.dart_package = match.group(1) if match else None
+        self.imports = {path: self._resolve_imports(path, content) for path, content in self.files.items()}
+        self.importers = defaultdict(set)
+        for path, targets in self.imports.items():
+            for target in targets:
+                self.importers[target].add(path)
+
+    def file_lines(self, path):
+        if path not in self.lines:
+            self.lines[path] = self.files[path].split("\n")
+        return self.lines[path]
+
+    def resolve(self, log_path):
+        """Ánh xạ path trong log (thường là path tuyệt đối trên runner) về path trong repo bằng hậu tố dài nhất."""
+        log_path = log_path.replace("\\", "/")
+        if log_path.startswith("./"):
+            log_path = log_path[2:]
+        if log_path in self.files:
+            return log_path
+        candidates = [path for path in self.by_basename.get(posixpath.basename(log_path), [])
+                      if log_path.endswith("/" + path) or path.endswith("/" + log_path) or path == log_path]
+        if not candidates:
+            candidates = self.by_basename.get(posixpath.basename(log_path), [])
+            return candidates[0] if len(candidates) == 1 else None
+        return max(candidates, key=len)
+
+    def _resolve_imports(self, path, content):
+        targets = set()
+        if path.endswith(".dart"):
+            for spec in DART_IMPORT_RE.findall(content):
+                if spec.startswith("dart:"):
+                    continue
+                if spec.startswith("package:"):
+                    package, _, rest = spec[len("package:"):].partition("/")
+                    target = f"lib/{rest}" if package == self.dart_package else None
+                else:
+                    target = posixpath.normpath(posixpath.join(posixpath.dirname(path), spec))
+                if target in self.files:
+                    targets.add(target)
+        elif path.endswith((".kt", ".java")):
+            for name in KOTLIN_IMPORT_RE.findall(content):
+                suffix = name.replace(".", "/")
+                targets.update(p for ext in (".kt", ".java") for p in self.by_basename.get(suffix.rsplit("/", 1)[-1] + ext, [])
+                               if p.endswith(suffix + ext))
+        elif path.endswith(".py"):
+            for groups in PY_IMPORT_RE.findall(content):
+                module = (groups[0] or groups[1]).replace(".", "/")
+                targets.update(p for p in (f"{module}.py", f"{module}/__init__.py",
+                                           posixpath.join(posixpath.dirname(path), f"{module}.py")) if p in self.files)
+        targets.discard(path)
+        return targets
+
+    def neighbours(self, path):
+        return self.imports.get(path, set()) | self.importers.get(path, set())
+
+
+_INDEX_CACHE = {}
+_INDEX_LOCK = threading.Lock()
+
+
+def get_index(snapshot):
+    """Chỉ mục được cache theo commit SHA: nhiều lần thử sửa trên cùng commit không phải dựng lại."""
+    with _INDEX_LOCK:
+        index = _INDEX_CACHE.get(snapshot["commit_sha"])
+        if index is None:
+            index = _INDEX_CACHE[snapshot["commit_sha"]] = RepoIndex(snapshot)
+        return index
+
+
+def merge_spans(spans):
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def rank_candidates(index, log_text):
+    """Trả về dict path -> {score, lines}: file có dòng lỗi > file được nhắc tên > láng giềng import > manifest."""
+    located, bare = extract_locations(log_text)
+    ranked = defaultdict(lambda: {"score": 0.0, "lines": []})
+    for order, (log_path, line_no) in enumerate(located):
+        path = index.resolve(log_path)
+        if path:
+            # Lỗi xuất hiện trước trong log đã rút gọn thường là nguyên nhân gốc
+            ranked[path]["score"] += 100.0 / (1 + order * 0.1)
+            ranked[path]["lines"].append(line_no)
+    for log_path in bare:
+        path = index.resolve(log_path)
+        if path:
+            ranked[path]["score"] += 40.0
+    direct = list(ranked)
+    for path in direct:
+        for neighbour in index.neighbours(path):
+            ranked[neighbour]["score"] += 0.3 * ranked[path]["score"] / max(1, len(index.neighbours(path)))
+            for second in index.neighbours(neighbour) - {path}:
+                ranked[second]["score"] += 0.05 * ranked[path]["score"]
+    for path in MANIFEST_FILES:
+        if path in index.files:
+            ranked[path]["score"] += 5.0
+    if not direct:
+        for path in FALLBACK_FILES:
+            if path in index.files:
+                ranked[path]["score"] += 50.0
+    return dict(ranked)
+
+
+def file_spans(index, path, hit_lines):
+    lines = index.file_lines(path)
+    if len(lines) <= WHOLE_FILE_MAX_LINES:
+        return [[1, len(lines)]]
+    if not hit_lines:
+        return [[1, min(len(lines), NEIGHBOUR_HEAD_LINES)]]
+    return merge_spans([max(1, n - SPAN_RADIUS), min(len(lines), n + SPAN_RADIUS)] for n in hit_lines)
+
+
+def render_span(index, path, start, end):
+    body = "\n".join(index.file_lines(path)[start - 1:end])
+    total = len(index.file_lines(path))
+    where = "toàn bộ file" if start == 1 and end >= total else f"dòng {start}-{end} / {total}"
+    return f"--- `{path}` ({where}) ---\n```\n{body}\n```"
+
+
+@traced("context.select")
+def select_context(snapshot, log_text, token_budget=CONTEXT_TOKEN_BUDGET):
+    """Đóng gói các đoạn mã liên quan nhất vào ngân sách token; trả về (text cho prompt, danh sách path đã chọn)."""
+    index = get_index(snapshot)
+    ranked = sorted(rank_candidates(index, log_text).items(), key=lambda item: -item[1]["score"])
+    sections, chosen, used = [], [], 0
+    for path, info in ranked:
+        for start, end in file_spans(index, path, info["lines"]):
+            text = render_span(index, path, start, end)
+            cost = estimate_tokens(text)
+            if used + cost > token_budget:
+                # Đoạn quá lớn: thu hẹp quanh dòng lỗi thay vì bỏ hẳn file quan trọng nhất
+                if sections or not info["lines"]:
+                    continue
+                center = info["lines"][0]
+                start, end = max(1, center - 5), min(len(index.file_lines(path)), center + 5)
+                text = render_span(index, path, start, end)
+                cost = estimate_tokens(text)
+            sections.append(text)
+            used += cost
+            if path not in chosen:
+                chosen.append(path)
+        if used >= token_budget:
+            break
+    return "\n\n".join(sections), chosen
@@ -1,43 +1,48 @@
 import os
 import re
-import json
-import base64
-import time
 import sys
-import requests
-import google.generativeai as genai
-import zipfile
-import io
+import argparse
 import traceback
+from github_client import GitHubClient
+from context_select import select_context
+from log_analysis import fetch_condensed_log
+from model_router import generate
+from json_extract import parse_model_json
+from git_data import commit_changes, fetch_repo_snapshot
+from patching import PatchError, apply_unified_diff
+from validation import format_problems, validate_files
+from fix_loop import FixLoop
+from fix_store import failure_fingerprint, fix_store
+from tracing import traced, tracer
 
 # ==============================================================================
 # I. CẤU HÌNH
 # ==============================================================================
-print("--- 🤖 AI Auto-Debugger v1.0 Initializing ---")
-try:
-    ISSUE_BODY = os.environ["ISSUE_BODY"]
-    ISSUE_NUMBER = os.environ["ISSUE_NUMBER"]
-    GEMINI_API_KEY = os.environ["GEMINI_API_KEY"]
-    GITHUB_TOKEN = os.environ["GITHUB_TOKEN"]
-    REPO_OWNER = os.environ["GH_USER"]
-    COMMIT_EMAIL = os.environ["COMMIT_EMAIL"]
-    COMMIT_NAME = os.environ["COMMIT_NAME"]
-except KeyError as e:
-    print(f"❌ LỖI: Thiếu biến môi trường: {e}")
-    sys.exit(1)
-
-COMMIT_AUTHOR = {"name": COMMIT_NAME, "email": COMMIT_EMAIL}
-API_BASE_URL = "https://api.github.com"
-HEADERS = {"Authorization": f"Bearer {GITHUB_TOKEN}", "Accept": "application/vnd.github.v3+json"}
-genai.configure(api_key=GEMINI_API_KEY)
+# Được gán trong load_config(); SDK Gemini và requests chỉ được nạp khi thật sự cần
+ISSUE_BODY = ISSUE_NUMBER = GITHUB_TOKEN = REPO_OWNER = COMMIT_AUTHOR = None
+gh = None
+
+def load_config():
+    global ISSUE_BODY, ISSUE_NUMBER, GITHUB_TOKEN, REPO_OWNER, COMMIT_AUTHOR, gh
+    print("--- 🤖 AI Auto-Debugger v1.0 Initializing ---")
+    try:
+        ISSUE_BODY = os.environ["ISSUE_BODY"]
+        ISSUE_NUMBER = os.environ["ISSUE_NUMBER"]
+        os.environ["GEMINI_API_KEY"]
+        GITHUB_TOKEN = os.environ["GITHUB_TOKEN"]
+        REPO_OWNER = os.environ["GH_USER"]
+        COMMIT_AUTHOR = {"name": os.environ["COMMIT_NAME"], "email": os.environ["COMMIT_EMAIL"]}
+    except KeyError as e:
+        print(f"❌ LỖI: Thiếu biến môi trường: {e}")
+        sys.exit(1)
+    gh = GitHubClient(GITHUB_TOKEN)
 
 # ==============================================================================
 # II. CÁC HÀM TIỆN ÍCH
 # ==============================================================================
 
 def post_issue_comment(message):
-    url = f"{API_BASE_URL}/repos/{REPO_OWNER}/ai-factory/issues/{ISSUE_NUMBER}/comments"
-    requests.post(url, headers=HEADERS, json={"body": message})
+    gh.post(f"/repos/{REPO_OWNER}/ai-factory/issues/{ISSUE_NUMBER}/comments", json={"body": message})
 
 def parse_bug_report(body):
     print("--- 🕵️  Đang phân tích báo cáo lỗi ---")
@@ -51,68 +56,115 @@ def parse_bug_report(body):
 
 def get_failed_job_log(repo_name, run_id):
     print(f"--- 📥 Đang tải log lỗi từ Run ID: {run_id} ---")
-    logs_url = f"{API_BASE_URL}/repos/{repo_name}/actions/runs/{run_id}/logs"
-    for _ in range(3):
-        response = requests.get(logs_url, headers=HEADERS, stream=True, timeout=60)
-        if response.status_code == 200:
-            with zipfile.ZipFile(io.BytesIO(response.content)) as z:
-                log_file_name = next((name for name in z.namelist() if 'build' in name and name.endswith('.txt')), z.namelist()[0])
-                with z.open(log_file_name) as f:
-                    log_content = f.read().decode('utf-8', errors='ignore')
-            return "\n".join(log_content.splitlines()[-200:])
-        print(f"Log chưa sẵn sàng (status: {response.status_code}), đợi 10 giây...")
-        time.sleep(10)
-    raise Exception("Không thể tải log lỗi sau nhiều lần thử.")
-
-def get_file_content(repo_name, file_path):
-    print(f"--- 📄 Đang đọc nội dung file: {file_path} ---")
+    return fetch_condensed_log(gh, repo_name, run_id, 'build', 200)
+
+def get_repo_snapshot(repo_name):
+    print(f"--- 📄 Đang đọc cây file của repo: {repo_name} ---")
+    snapshot = fetch_repo_snapshot(gh, repo_name)
+    print(f"   - Đã đọc {len(snapshot['files'])}/{len(snapshot['entries'])} file text tại commit {snapshot['commit_sha'][:7]}.")
+    return snapshot
+
+@traced("gemini.fix")
+def call_gemini_for_fix(error_log, context_files, all_paths, feedback=None):
+    print("--- 🧠 Đang gửi thông tin cho Gemini (ưu tiên model Pro) để phân tích và sửa lỗi ---")
+    file_list = "\n".join(all_paths)
+    if feedback:
+        context_files += f"\n\n--- BẢN VÁ TRƯỚC KHÔNG HỢP LỆ ---\n{feedback}\nHãy viết lại bản vá (tính trên code gốc ở trên) để khắc phục các lỗi này."
+    debug_prompt = f"Một build Flutter đã thất bại. Phân tích log và code để sửa lỗi.\n\n--- LOG LỖI ---\n```\n{error_log}\n```\n\n--- DANH SÁCH FILE TRONG REPO ---\n{file_list}\n\n--- MÃ NGUỒN LIÊN QUAN ---\n{context_files}\n\n**NHIỆM VỤ:**\n1. Phân tích nguyên nhân.\n2. Viết bản vá dưới dạng UNIFIED DIFF (`--- a/path`, `+++ b/path`, `@@ -l,n +l,n @@`, 3 dòng context), có thể sửa nhiều file; dùng `/dev/null` để tạo hoặc xóa file.\n3. Trả về MỘT JSON duy nhất có cấu trúc: `{{\"analysis\": \"...\", \"patch\": \"<unified diff>\", \"commit_message\": \"...\"}}`. Nếu không sửa được, `patch` là `null`."
+    response_text = generate("debug", debug_prompt, timeout=400)
+    return parse_model_json(response_text, "AI Debugger")
+
+@traced("validate")
+def prepare_patch(snapshot, diff_text):
+    """Áp dụng diff cục bộ và kiểm tra kết quả; trả về (changes, danh sách lỗi). Không gọi mạng."""
     try:
-        url = f"{API_BASE_URL}/repos/{repo_name}/contents/{file_path}"
-        response = requests.get(url, headers=HEADERS, timeout=30).json()
-        return base64.b64decode(response['content']).decode('utf-8'), response['sha']
-    except Exception: return None, None
-
-def call_gemini_for_fix(error_log, files_content):
-    print("--- 🧠 Đang gửi thông tin cho Gemini Pro để phân tích và sửa lỗi ---")
-    context_files = "".join([f"\n\n--- Content of `{path}` ---\n```\n{content}\n```" for path, content in files_content.items() if content])
-    debug_prompt = f"Một build Flutter đã thất bại. Phân tích log và code để sửa lỗi.\n\n--- LOG LỖI ---\n```\n{error_log}\n```\n{context_files}\n\n**NHIỆM VỤ:**\n1. Phân tích nguyên nhân.\n2. Viết lại TOÀN BỘ nội dung của file cần sửa.\n3. Trả về MỘT JSON duy nhất có cấu trúc: `{{\"analysis\": \"...\", \"file_to_patch\": \"...\", \"corrected_code\": \"...\", \"commit_message\": \"...\"}}`. Nếu không sửa được, `file_to_patch` là `null`."
-    model = genai.GenerativeModel("gemini-1.5-pro-latest")
-    response = model.generate_content(debug_prompt, request_options={'timeout': 400})
-    match = re.search(r'\{.*\}', response.text, re.DOTALL)
-    if not match: raise ValueError(f"AI Debugger không trả về JSON hợp lệ.")
-    return json.loads(match.group(0), strict=False)
-
-def apply_patch(repo_name, file_path, new_content, commit_message, current_sha):
-    print(f"--- 🩹 Đang áp dụng bản vá cho file: {file_path} ---")
-    url = f"{API_BASE_URL}/repos/{repo_name}/contents/{file_path}"
-    data = {"message": commit_message, "content": base64.b64encode(new_content.encode('utf-8')).decode('utf-8'), "sha": current_sha, "author": COMMIT_AUTHOR}
-    requests.put(url, headers=HEADERS, json=data).raise_for_status()
+        changes = apply_unified_diff(diff_text, snapshot["files"])
+        if not changes:
+            raise PatchError("Bản vá không tạo ra thay đổi nào.")
+    except PatchError as e:
+        return None, [("(patch)", str(e))]
+    # File nhị phân không có nội dung trong snapshot nhưng vẫn cần để đối chiếu tham chiếu
+    baseline = {path: snapshot["files"].get(path, b"") for path in snapshot["entries"]}
+    updated = {**baseline, **changes}
+    updated = {path: content for path, content in updated.items() if content is not None}
+    return changes, validate_files(updated, [path for path, content in changes.items() if content is not None], baseline)
+
+@traced("git.commit_patch")
+def apply_patch(repo_name, snapshot, changes, commit_message):
+    """Commit mọi file thay đổi trong một tree/commit duy nhất."""
+    print(f"--- 🩹 Đang áp dụng bản vá cho {len(changes)} file: {', '.join(changes)} ---")
+    commit_changes(gh, repo_name, snapshot, changes, commit_message, author=COMMIT_AUTHOR)
     print("   - ✅ Bản vá đã được commit!")
+    return changes
+
+def try_known_fix(snapshot, failure_key, repo_name):
+    """Áp dụng bản vá đã từng sửa được cùng lỗi (không gọi model); trả về suggestion đã kiểm tra hoặc None."""
+    known = fix_store.lookup(failure_key, repo_name)
+    if not known:
+        return None
+    print(f"--- ♻️ Đã có bản vá cho lỗi `{failure_key}` (thành công {known['successes']} lần), đang thử áp dụng ---")
+    known["changes"], problems = prepare_patch(snapshot, known["patch"])
+    if problems:
+        print(f"   - ⚠️ Bản vá đã biết không dùng được cho repo này, chuyển sang hỏi AI:\n{format_problems(problems)}")
+        fix_store.record_failure(failure_key)
+        return None
+    return known
 
 # ==============================================================================
 # III. HÀM THỰC THI CHÍNH
 # ==============================================================================
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AI Auto-Debugger")
+    parser.add_argument("--check", "--dry-run", dest="check", action="store_true", help="Chỉ kiểm tra cấu hình và báo cáo lỗi rồi thoát")
+    args = parser.parse_args()
+    load_config()
+    if args.check:
+        try:
+            repo_to_fix, failed_run_id = parse_bug_report(ISSUE_BODY)
+        except ValueError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        print(f"✅ Báo cáo hợp lệ: repo `{repo_to_fix}`, run {failed_run_id}.")
+        sys.exit(0)
+
     try:
         repo_to_fix, failed_run_id = parse_bug_report(ISSUE_BODY)
         post_issue_comment(f"✅ **AI Debugger đã bắt đầu làm việc** trên repo `{repo_to_fix}`.")
         
         log = get_failed_job_log(repo_to_fix, failed_run_id)
         
-        files_to_read = ["pubspec.yaml", "lib/main.dart"]
-        files_content_map = {path: get_file_content(repo_to_fix, path) for path in files_to_read}
+        snapshot = get_repo_snapshot(repo_to_fix)
+        context_files, chosen = select_context(snapshot, log)
+        print(f"   - Ngữ cảnh đã chọn: {', '.join(chosen) or '(không có)'}")
             
-        fix_suggestion = call_gemini_for_fix(log, {p: c[0] for p, c in files_content_map.items()})
+        failure_key = failure_fingerprint(log, "flutter-app")
+        known = try_known_fix(snapshot, failure_key, repo_to_fix)
+        last_suggestion = {}
+
+        def propose(attempt, feedback):
+            suggestion = call_gemini_for_fix(log, context_files, sorted(snapshot["entries"]), feedback)
+            last_suggestion.update(suggestion)
+            return suggestion if suggestion.get("patch") else None
+
+        def check(suggestion):
+            suggestion["changes"], problems = prepare_patch(snapshot, suggestion["patch"])
+            return problems
+
+        if known:
+            result = {"status": "fixed", "candidate": known, "problems": [], "attempts": []}
+        else:
+            result = FixLoop("Debugger").run(propose, check, lambda suggestion, problems: f"```diff\n{suggestion['patch']}\n```\nLỗi:\n{format_problems(problems)}")
+        fix_suggestion = result["candidate"] or last_suggestion
         
-        file_to_patch = fix_suggestion.get("file_to_patch")
-        if file_to_patch and file_to_patch in files_content_map:
-            current_sha = files_content_map[file_to_patch][1]
-            if not current_sha: raise ValueError(f"Không tìm thấy SHA của file cần vá: {file_to_patch}")
-            
+        if result["status"] == "fixed":
             commit_message = f"fix(ai): {fix_suggestion['commit_message']}"
-            apply_patch(repo_to_fix, file_to_patch, fix_suggestion["corrected_code"], commit_message, current_sha)
+            changes = apply_patch(repo_to_fix, snapshot, fix_suggestion["changes"], commit_message)
+            fix_store.record_applied(failure_key, fix_suggestion["patch"], repo_to_fix, analysis=fix_suggestion["analysis"], commit_message=fix_suggestion["commit_message"])
+            attempts = f"0 (bản vá đã biết `{failure_key}`)" if known else len(result["attempts"])
             
-            post_issue_comment(f"🎉 **Đã áp dụng bản vá tự động!**\n\n- **Phân tích:** {fix_suggestion['analysis']}\n- **Commit:** `{commit_message}`\n\nMột build mới sẽ được tự động kích hoạt trong repo `{repo_to_fix}`.")
+            post_issue_comment(f"🎉 **Đã áp dụng bản vá tự động!**\n\n- **Phân tích:** {fix_suggestion['analysis']}\n- **File đã sửa:** {', '.join(f'`{p}`' for p in changes)}\n- **Commit:** `{commit_message}`\n- **Số lần thử:** {attempts}\n\nMột build mới sẽ được tự động kích hoạt trong repo `{repo_to_fix}`.")
+        elif result["status"] != "gave_up":
+            post_issue_comment(f"**Phân tích của AI:** {fix_suggestion.get('analysis', 'Không có.')}\n\n⚠️ Bản vá không qua kiểm tra cục bộ sau {len(result['attempts'])} lần thử (`{result['status']}`) nên không được commit:\n{format_problems(result['problems'])}\n\nCần sự can thiệp của con người.")
         else:
             post_issue_comment(f"**Phân tích của AI:** {fix_suggestion.get('analysis', 'Không có.')}\n\nAI cho rằng không thể sửa lỗi tự động. Cần sự can thiệp của con người.")
 
@@ -121,3 +173,6 @@ if __name__ == "__main__":
         error_message = f"❌ **[Debugger] Đã xảy ra lỗi:**\n\n**Lỗi:**\n```{e}```\n\n**Traceback:**\n```{error_trace}```"
         post_issue_comment(error_message)
         sys.exit(1)
+    finally:
+        gh.metrics.print_summary("Debugger")
+        tracer.write_summary("Debugger")
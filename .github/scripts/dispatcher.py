@@ -0,0 +1,203 @@
+import os
+import re
+import sys
+import runpy
+import argparse
+import traceback
+from pathlib import Path
+from github_client import GitHubClient
+from issue_form import parse_app_request
+
+# ==============================================================================
+# I. CẤU HÌNH
+# ==============================================================================
+# Điểm vào duy nhất cho sự kiện issue: mỗi issue chạy đúng một pipeline, đúng một lần
+SCRIPTS_DIR = Path(__file__).resolve().parent
+# pipeline -> (script, biến môi trường riêng của pipeline)
+PIPELINES = {
+    "genesis": ("genesis.py", {}),
+    "debugger": ("debugger.py", {"COMMIT_NAME": "AI Debugger Bot"}),
+    "android": ("generate_app.py", {}),
+}
+BUG_REPORT_LABEL = "bug-report"
+# Marker ẩn trong comment của issue; status `failed` cho phép chạy lại, `started`/`done` thì bỏ qua
+# (xóa comment marker để buộc chạy lại khi runner bị hủy giữa chừng)
+MARKER_RE = re.compile(r"<!-- ai-factory-dispatch key=(\S+) status=(\w+) -->")
+REPO_NAME_RE = re.compile(r"[A-Za-z0-9._-]{1,100}")
+
+# Được gán trong load_config(); không gọi mạng lúc import
+CONTROLLER_REPO = ISSUE_NUMBER = ISSUE_TITLE = ISSUE_BODY = None
+ISSUE_LABELS = []
+gh = None
+
+def load_config():
+    global CONTROLLER_REPO, ISSUE_NUMBER, ISSUE_TITLE, ISSUE_BODY, ISSUE_LABELS, gh
+    print("--- 🚦 [Dispatcher] Đang tải cấu hình ---")
+    try:
+        ISSUE_BODY = os.environ["ISSUE_BODY"]
+        gh = GitHubClient(os.environ["GITHUB_TOKEN"])
+    except KeyError as e:
+        print(f"❌ [Dispatcher] LỖI: Thiếu biến môi trường: {e}", file=sys.stderr)
+        sys.exit(1)
+    CONTROLLER_REPO = os.environ.get("GITHUB_REPOSITORY")
+    ISSUE_NUMBER = os.environ.get("ISSUE_NUMBER") or None
+    ISSUE_TITLE = os.environ.get("ISSUE_TITLE", "")
+    ISSUE_LABELS = [label.strip() for label in os.environ.get("ISSUE_LABELS", "").split(",") if label.strip()]
+
+# ==============================================================================
+# II. ĐỊNH TUYẾN VÀ IDEMPOTENCY
+# ==============================================================================
+
+def route(title, body, labels):
+    """Chọn đúng một pipeline; trả về (pipeline, repo đích hoặc None, request của form hoặc None)."""
+    if BUG_REPORT_LABEL in labels:
+        return "debugger", None, None
+    request = parse_app_request(body)
+    if request is not None:
+        return "genesis", request["repo_name"], request
+    # Issue tự do (không theo form): tiêu đề là tên repo, body là mô tả app Android
+    return "android", title.strip().replace(" ", "-"), None
+
+def check_route(pipeline, repo_name, request):
+    """Kiểm tra đầu vào của pipeline đã chọn (không gọi mạng); trả về danh sách vấn đề."""
+    if pipeline == "genesis":
+        from genesis import check_request
+        return check_request(request)
+    if pipeline == "debugger":
+        from debugger import parse_bug_report
+        try:
+            parse_bug_report(ISSUE_BODY)
+        except ValueError as e:
+            return [str(e)]
+        return []
+    if not REPO_NAME_RE.fullmatch(repo_name or "") or not ISSUE_BODY.strip():
+        return [f"tên repo `{repo_name}` không hợp lệ hoặc nội dung issue trống"]
+    return []
+
+def idempotency_key(pipeline, repo_name):
+    return f"{pipeline}/{ISSUE_NUMBER or '-'}/{repo_name or '-'}"
+
+def find_marker(key):
+    """Comment marker của key trên issue: (comment id, status) hoặc (None, None)."""
+    if not (CONTROLLER_REPO and ISSUE_NUMBER):
+        return None, None
+    page = 1
+    while True:
+        comments = gh.json("GET", f"/repos/{CONTROLLER_REPO}/issues/{ISSUE_NUMBER}/comments", params={"per_page": 100, "page": page})
+        for comment in comments:
+            match = MARKER_RE.search(comment.get("body") or "")
+            if match and match.group(1) == key:
+                return comment["id"], match.group(2)
+        if len(comments) < 100:
+            return None, None
+        page += 1
+
+def write_marker(key, status, message, comment_id=None):
+    if not (CONTROLLER_REPO and ISSUE_NUMBER):
+        return None
+    body = f"<!-- ai-factory-dispatch key={key} status={status} -->\n{message}"
+    if comment_id:
+        gh.json("PATCH", f"/repos/{CONTROLLER_REPO}/issues/comments/{comment_id}", json={"body": body})
+        return comment_id
+    return gh.json("POST", f"/repos/{CONTROLLER_REPO}/issues/{ISSUE_NUMBER}/comments", json={"body": body})["id"]
+
+def repo_exists(owner, repo_name):
+    return gh.get(f"/repos/{owner}/{repo_name}").status_code == 200
+
+def target_owner(pipeline):
+    return os.environ.get("GH_USER") if pipeline == "genesis" else os.environ.get("GITHUB_USERNAME")
+
+def already_handled(key, pipeline, repo_name):
+    """(comment marker, lý do bỏ qua hoặc None nếu cần chạy, có tiếp tục vào repo đã tồn tại không)."""
+    comment_id, status = find_marker(key)
+    if status in ("started", "done"):
+        return comment_id, f"issue đã được xử lý (`{key}`, trạng thái `{status}`)", False
+    owner = target_owner(pipeline)
+    exists = bool(repo_name and owner and repo_exists(owner, repo_name))
+    # Lần chạy `failed` của chính issue này thường đã tạo repo: chạy lại và tiếp tục vào repo đó
+    if exists and status != "failed":
+        return comment_id, f"repo `{owner}/{repo_name}` đã tồn tại", False
+    return comment_id, None, exists
+
+def reject(pipeline, problems):
+    """Issue không hợp lệ không phải lỗi của factory: trả lời trên issue thay vì làm workflow thất bại."""
+    message = f"Issue không hợp lệ cho pipeline `{pipeline}`: {'; '.join(problems)}. Hãy sửa issue và tạo lại."
+    print(f"⚠️ [Dispatcher] {message}")
+    if CONTROLLER_REPO and ISSUE_NUMBER:
+        gh.json("POST", f"/repos/{CONTROLLER_REPO}/issues/{ISSUE_NUMBER}/comments", json={"body": f"⚠️ {message}"})
+
+def set_output(name, value):
+    if os.environ.get("GITHUB_OUTPUT"):
+        with open(os.environ["GITHUB_OUTPUT"], "a", encoding="utf-8") as f:
+            f.write(f"{name}={value}\n")
+
+# ==============================================================================
+# III. CHẠY PIPELINE
+# ==============================================================================
+
+def pipeline_argv(pipeline, request, resume=False):
+    if pipeline != "genesis":
+        return []
+    argv = ["--repo-name", request["repo_name"], "--language", request["language"], "--model", request["model"], "--prompt", request["prompt"]]
+    return argv + ["--update"] if resume else argv
+
+def run_pipeline(pipeline, request, resume=False):
+    """Chạy script của pipeline trong cùng tiến trình (như `python <script>`); trả về exit code.
+
+    `resume`: repo đích còn lại từ lần chạy thất bại trước; genesis chạy với --update, generate_app bỏ bước tạo repo.
+    """
+    script, env = PIPELINES[pipeline]
+    os.environ.update(env)
+    if resume:
+        os.environ["RESUME_EXISTING_REPO"] = "1"
+    sys.argv = [str(SCRIPTS_DIR / script), *pipeline_argv(pipeline, request, resume)]
+    print(f"--- 🚦 [Dispatcher] Chuyển issue sang pipeline `{pipeline}` ({script}) ---")
+    try:
+        runpy.run_path(sys.argv[0], run_name="__main__")
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except Exception:
+        traceback.print_exc()
+        return 1
+    return 0
+
+# ==============================================================================
+# IV. HÀM THỰC THI CHÍNH
+# ==============================================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AI Factory Issue Dispatcher")
+    parser.add_argument("--check", "--dry-run", dest="check", action="store_true", help="Chỉ phân tích issue và kiểm tra đầu vào của pipeline rồi thoát")
+    parser.add_argument("--route", action="store_true", help="Như --check nhưng ghi pipeline đã chọn ra GITHUB_OUTPUT (`rejected` nếu issue không hợp lệ) và trả lời issue không hợp lệ")
+    args = parser.parse_args()
+    load_config()
+    pipeline, repo_name, request = route(ISSUE_TITLE, ISSUE_BODY, ISSUE_LABELS)
+    problems = check_route(pipeline, repo_name, request)
+    if problems and args.check:
+        print(f"❌ [Dispatcher] Issue không hợp lệ cho pipeline `{pipeline}`: {'; '.join(problems)}")
+        sys.exit(1)
+    if problems:
+        reject(pipeline, problems)
+        set_output("pipeline", "rejected")
+        sys.exit(0)
+    key = idempotency_key(pipeline, repo_name)
+    if args.check or args.route:
+        if args.route:
+            set_output("pipeline", pipeline)
+        print(f"✅ [Dispatcher] Issue sẽ được chuyển sang pipeline `{pipeline}` (key `{key}`).")
+        sys.exit(0)
+
+    exit_code = 1
+    try:
+        comment_id, skip_reason, resume = already_handled(key, pipeline, repo_name)
+        if skip_reason:
+            print(f"⏭️ [Dispatcher] Bỏ qua: {skip_reason}.")
+            exit_code = 0
+        else:
+            comment_id = write_marker(key, "started", f"🚦 Đang xử lý bằng pipeline `{pipeline}`{' (tiếp tục vào repo có sẵn)' if resume else ''}.", comment_id)
+            exit_code = run_pipeline(pipeline, request, resume)
+            status = "done" if exit_code == 0 else "failed"
+            write_marker(key, status, f"🚦 Pipeline `{pipeline}`: {'✅ hoàn tất' if status == 'done' else '❌ thất bại, có thể chạy lại workflow'}.", comment_id)
+    finally:
+        # Bảng trace do script của pipeline ghi; ở đây chỉ in số lời gọi API của riêng dispatcher
+        gh.metrics.print_summary("Dispatcher")
+    sys.exit(exit_code)
@@ -1,33 +1,40 @@
 import os
-import re
-import json
 import base64
 import sys
-import requests
-import google.generativeai as genai
-import zipfile
-import io
+import argparse
 import traceback
 from pathlib import Path
+from github_client import GitHubClient
+from log_analysis import fetch_condensed_log
+from model_router import generate
+from json_extract import parse_model_json
+from validation import format_problems, validate_files
+from fix_loop import FixLoop
+from fix_store import failure_fingerprint, fix_store, make_file_patch
+from patching import PatchError, apply_unified_diff
+from tracing import traced, tracer
 
 # ==============================================================================
 # I. CẤU HÌNH VÀ LẤY BIẾN MÔI TRƯỜNG
 # ==============================================================================
-print("--- 🤖 Factory Self-Debugger v1.0 Initializing ---")
-try:
-    FAILED_RUN_ID = os.environ["FAILED_RUN_ID"]
-    GEMINI_API_KEY = os.environ["GEMINI_API_KEY"]
-    GITHUB_TOKEN = os.environ["GITHUB_TOKEN"] # Đây là GH_PAT
-    REPO_FULL_NAME = os.environ["REPO_TO_FIX"] # ví dụ "tanvu2607/ai-factory"
-    FILE_TO_FIX_PATH = os.environ["FILE_TO_FIX"] # ví dụ ".github/scripts/genesis.py"
-    REPO_OWNER, REPO_NAME = REPO_FULL_NAME.split('/')
-except KeyError as e:
-    print(f"❌ LỖI: Thiếu biến môi trường: {e}")
-    sys.exit(1)
-
-API_BASE_URL = "https://api.github.com"
-HEADERS = {"Authorization": f"Bearer {GITHUB_TOKEN}", "Accept": "application/vnd.github.v3+json"}
-genai.configure(api_key=GEMINI_API_KEY)
+# Được gán trong load_config(); SDK Gemini và requests chỉ được nạp khi thật sự cần
+FAILED_RUN_ID = GITHUB_TOKEN = REPO_FULL_NAME = FILE_TO_FIX_PATH = REPO_OWNER = REPO_NAME = None
+gh = None
+
+def load_config():
+    global FAILED_RUN_ID, GITHUB_TOKEN, REPO_FULL_NAME, FILE_TO_FIX_PATH, REPO_OWNER, REPO_NAME, gh
+    print("--- 🤖 Factory Self-Debugger v1.0 Initializing ---")
+    try:
+        FAILED_RUN_ID = os.environ["FAILED_RUN_ID"]
+        os.environ["GEMINI_API_KEY"]
+        GITHUB_TOKEN = os.environ["GITHUB_TOKEN"] # Đây là GH_PAT
+        REPO_FULL_NAME = os.environ["REPO_TO_FIX"] # ví dụ "tanvu2607/ai-factory"
+        FILE_TO_FIX_PATH = os.environ["FILE_TO_FIX"] # ví dụ ".github/scripts/genesis.py"
+        REPO_OWNER, REPO_NAME = REPO_FULL_NAME.split('/')
+    except KeyError as e:
+        print(f"❌ LỖI: Thiếu biến môi trường: {e}")
+        sys.exit(1)
+    gh = GitHubClient(GITHUB_TOKEN)
 
 # ==============================================================================
 # II. CÁC HÀM TIỆN ÍCH
@@ -35,35 +42,24 @@ genai.configure(api_key=GEMINI_API_KEY)
 
 def download_and_extract_logs():
     print(f"--- 📥 Đang tải log của lần chạy thất bại: {FAILED_RUN_ID} ---")
-    logs_url = f"{API_BASE_URL}/repos/{REPO_FULL_NAME}/actions/runs/{FAILED_RUN_ID}/logs"
-    for i in range(3):
-        response = requests.get(logs_url, headers=HEADERS, stream=True, timeout=60)
-        if response.status_code == 200:
-            with zipfile.ZipFile(io.BytesIO(response.content)) as z:
-                # Tìm file log của job có khả năng bị lỗi nhất
-                log_file_name = next((name for name in z.namelist() if 'generate-app' in name and name.endswith('.txt')), z.namelist()[0])
-                with z.open(log_file_name) as f:
-                    log_content = f.read().decode('utf-8', errors='ignore')
-            # Lấy 300 dòng cuối để có đủ ngữ cảnh
-            return "\n".join(log_content.splitlines()[-300:])
-        print(f"Log chưa sẵn sàng (status: {response.status_code}), đợi 10 giây... (lần {i+1})")
-        time.sleep(10)
-    raise Exception("Không thể tải log lỗi sau nhiều lần thử.")
+    # Quét mọi file log để lấy đoạn quanh lỗi; nếu không thấy lỗi thì lấy 300 dòng cuối của job khả nghi nhất
+    return fetch_condensed_log(gh, REPO_FULL_NAME, FAILED_RUN_ID, 'genesis', 300)
 
+@traced("github.read_file")
 def get_file_to_fix_content():
     print(f"--- 📄 Đang đọc nội dung của file bị lỗi: {FILE_TO_FIX_PATH} ---")
-    url = f"{API_BASE_URL}/repos/{REPO_FULL_NAME}/contents/{FILE_TO_FIX_PATH}"
-    response = requests.get(url, headers=HEADERS, timeout=30).json()
+    response = gh.get(f"/repos/{REPO_FULL_NAME}/contents/{FILE_TO_FIX_PATH}", timeout=30).json()
     return base64.b64decode(response['content']).decode('utf-8')
 
-def call_gemini_for_fix(error_log, original_code):
-    print("--- 🧠 Đang gửi thông tin cho Gemini 1.5 Pro để phân tích và sửa lỗi ---")
+@traced("gemini.fix")
+def call_gemini_for_fix(error_log, original_code, feedback=None):
+    print("--- 🧠 Đang gửi thông tin cho Gemini (ưu tiên model Pro) để phân tích và sửa lỗi ---")
     
     debug_prompt = f"""
     Bạn là một kỹ sư phần mềm Python Senior chuyên gỡ lỗi các hệ thống tự động hóa trên GitHub Actions.
     Một workflow đã thất bại. Nhiệm vụ của bạn là phân tích log lỗi, tìm ra nguyên nhân trong mã nguồn Python và viết lại toàn bộ file để sửa lỗi đó.
 
-    --- LOG LỖI (300 dòng cuối) ---
+    --- LOG LỖI (đã rút gọn quanh các dòng lỗi) ---
     ```
     {error_log}
     ```
@@ -83,16 +79,43 @@ def call_gemini_for_fix(error_log, original_code):
           "commit_message": "Một commit message mô tả bản vá lỗi (ví dụ: fix(genesis): Improve JSON parsing to handle control characters)"
         }}`
     """
+    if feedback:
+        debug_prompt += f"\n    **LẦN SỬA TRƯỚC KHÔNG HỢP LỆ** (kiểm tra cục bộ báo lỗi), hãy khắc phục:\n{feedback}\n"
     
-    # Dùng model Pro để có khả năng suy luận tốt nhất
-    model = genai.GenerativeModel("gemini-1.5-pro-latest")
-    response = model.generate_content(debug_prompt, request_options={'timeout': 600})
-    
-    match = re.search(r'\{.*\}', response.text, re.DOTALL)
-    if not match: raise ValueError(f"AI Debugger không trả về JSON hợp lệ. Phản hồi thô:\n{response.text}")
+    # Router ưu tiên model Pro để có khả năng suy luận tốt nhất, chuyển sang Flash khi Pro chậm hoặc lỗi
+    response_text = generate("debug", debug_prompt, timeout=600)
     
+    suggestion = parse_model_json(response_text, "AI Debugger")
     print("   - ✅ AI đã đề xuất một bản vá.")
-    return json.loads(match.group(0), strict=False)
+    return suggestion
+
+def check_fix(original_code, suggestion):
+    """Kiểm tra cục bộ bản sửa (compile Python, JSON/YAML...) trước khi mở PR."""
+    corrected_code = suggestion.get("corrected_code")
+    if not corrected_code:
+        return [(FILE_TO_FIX_PATH, "AI không cung cấp code đã sửa")]
+    if corrected_code.strip() == original_code.strip():
+        return [(FILE_TO_FIX_PATH, "code đề xuất giống hệt code gốc")]
+    return validate_files({FILE_TO_FIX_PATH: corrected_code})
+
+def try_known_fix(failure_key, original_code):
+    """Dựng lại bản sửa từ diff đã lưu cho cùng lỗi (không gọi model); trả về suggestion đã kiểm tra hoặc None."""
+    # Phạm vi là repo factory: lỗi lặp lại khi bản vá còn đang chờ xác nhận được tính là thất bại
+    known = fix_store.lookup(failure_key, REPO_FULL_NAME)
+    if not known:
+        return None
+    print(f"--- ♻️ Đã có bản vá cho lỗi `{failure_key}` (thành công {known['successes']} lần), đang thử áp dụng ---")
+    try:
+        corrected_code = apply_unified_diff(known["patch"], {FILE_TO_FIX_PATH: original_code}).get(FILE_TO_FIX_PATH)
+        suggestion = {**known, "corrected_code": corrected_code}
+        problems = check_fix(original_code, suggestion)
+    except PatchError as e:
+        problems = [(FILE_TO_FIX_PATH, str(e))]
+    if problems:
+        print(f"   - ⚠️ Bản vá đã biết không còn dùng được, chuyển sang hỏi AI:\n{format_problems(problems)}")
+        fix_store.record_failure(failure_key)
+        return None
+    return suggestion
 
 def set_action_output(name, value):
     """Ghi giá trị vào GITHUB_OUTPUT để các step sau có thể sử dụng."""
@@ -105,23 +128,41 @@ def set_action_output(name, value):
 # III. HÀM THỰC THI CHÍNH
 # ==============================================================================
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AI Factory Self-Debugger")
+    parser.add_argument("--check", "--dry-run", dest="check", action="store_true", help="Chỉ kiểm tra cấu hình rồi thoát")
+    args = parser.parse_args()
+    load_config()
+    if args.check:
+        print(f"✅ Cấu hình hợp lệ: run {FAILED_RUN_ID} của `{REPO_FULL_NAME}`, file cần sửa `{FILE_TO_FIX_PATH}`.")
+        sys.exit(0)
+
     try:
         error_log = download_and_extract_logs()
         original_code = get_file_to_fix_content()
-        fix_suggestion = call_gemini_for_fix(error_log, original_code)
+        failure_key = failure_fingerprint(error_log, FILE_TO_FIX_PATH)
+        known = try_known_fix(failure_key, original_code)
+        if known:
+            result = {"status": "fixed", "candidate": known, "problems": [], "attempts": []}
+        else:
+            result = FixLoop("Factory Debugger").run(
+                lambda attempt, feedback: call_gemini_for_fix(error_log, original_code, feedback),
+                lambda suggestion: check_fix(original_code, suggestion),
+                lambda suggestion, problems: format_problems(problems))
+        fix_suggestion = result["candidate"] or {}
+        if result["status"] != "fixed":
+            raise ValueError(f"Không tạo được bản sửa hợp lệ sau {len(result['attempts'])} lần thử ({result['status']}):\n{format_problems(result['problems'])}")
+        # Lưu dạng diff để lần sau áp dụng được cả khi phần khác của file đã thay đổi
+        fix_store.record_applied(failure_key, known["patch"] if known else make_file_patch(FILE_TO_FIX_PATH, original_code, fix_suggestion["corrected_code"]), REPO_FULL_NAME,
+                                 analysis=fix_suggestion.get("analysis", ""), commit_message=fix_suggestion.get("commit_message", ""))
 
         # Ghi các kết quả ra GITHUB_OUTPUT
         set_action_output("analysis", fix_suggestion.get("analysis", "No analysis provided."))
         set_action_output("commit_message", fix_suggestion.get("commit_message", "fix(ai): Automated fix attempt"))
         
         # Lưu code đã sửa vào một file tạm
-        corrected_code = fix_suggestion.get("corrected_code")
-        if corrected_code:
-            Path(FILE_TO_FIX_PATH).parent.mkdir(parents=True, exist_ok=True)
-            Path(FILE_TO_FIX_PATH).write_text(corrected_code, encoding="utf-8")
-            print(f"   - ✅ Đã ghi code đã sửa vào file cục bộ: {FILE_TO_FIX_PATH}")
-        else:
-            raise ValueError("AI không cung cấp code đã sửa.")
+        Path(FILE_TO_FIX_PATH).parent.mkdir(parents=True, exist_ok=True)
+        Path(FILE_TO_FIX_PATH).write_text(fix_suggestion["corrected_code"], encoding="utf-8")
+        print(f"   - ✅ Đã ghi code đã sửa vào file cục bộ: {FILE_TO_FIX_PATH}")
 
     except Exception as e:
         print("--- ❌ Đã xảy ra lỗi trong quá trình gỡ lỗi ---")
@@ -130,3 +171,6 @@ if __name__ == "__main__":
         set_action_output("analysis", f"An error occurred in the debugger:\n```\n{e}\n```")
         set_action_output("commit_message", "chore: Debugger failed to generate a fix")
         sys.exit(1)
+    finally:
+        gh.metrics.print_summary("Factory Debugger")
+        tracer.write_summary("Factory Debugger")
@@ -0,0 +1,89 @@
+import os
+import time
+import hashlib
+
+from gemini_client import token_usage
+from log_analysis import signature_key
+from tracing import span
+
+# ==============================================================================
+# Vòng lặp sửa lỗi trong tiến trình: giới hạn số lần/thời gian, dừng sớm khi lỗi lặp lại
+# ==============================================================================
+FIX_MAX_ITERATIONS = int(os.environ.get("FIX_MAX_ITERATIONS", "3"))
+FIX_TIME_BUDGET = float(os.environ.get("FIX_TIME_BUDGET", "900"))
+
+
+def fingerprint(problems):
+    """Dấu vân tay của một tập lỗi: bỏ số dòng/cột và thứ tự để cùng một lỗi luôn cho cùng một giá trị."""
+    keys = sorted({f"{path}|{signature_key(message)}" for path, message in problems})
+    return hashlib.sha1("\n".join(keys).encode("utf-8")).hexdigest()[:12]
+
+
+def candidate_key(candidate):
+    return hashlib.sha1(repr(candidate).encode("utf-8")).hexdigest()[:12]
+
+
+class FixLoop:
+    """Lặp propose -> check cho đến khi hết lỗi, hết lượt, hết thời gian hoặc không còn tiến triển.
+
+    propose(attempt, feedback) trả về ứng viên (None nếu model bỏ cuộc); check(ứng viên) trả về danh sách
+    (path, thông báo) lỗi, rỗng nghĩa là đã sửa xong. Mỗi lần thử được ghi lại độ trễ và token Gemini đã dùng.
+    """
+
+    def __init__(self, name, max_iterations=FIX_MAX_ITERATIONS, time_budget=FIX_TIME_BUDGET):
+        self.name = name
+        self.max_iterations = max(1, max_iterations)
+        self.time_budget = time_budget
+        self.attempts = []
+
+    def run(self, propose, check, feedback_for):
+        started = time.monotonic()
+        seen_failures, seen_candidates = set(), set()
+        candidate, problems, feedback = None, [], None
+        status = "exhausted"
+        for attempt in range(1, self.max_iterations + 1):
+            elapsed = time.monotonic() - started
+            average = elapsed / len(self.attempts) if self.attempts else 0.0
+            # Không bắt đầu lần thử mới nếu theo tốc độ hiện tại chắc chắn sẽ vượt ngân sách thời gian
+            if self.attempts and elapsed + average > self.time_budget:
+                status = "timeout"
+                break
+            usage_before = token_usage.snapshot()
+            attempt_started = time.monotonic()
+            with span("fix.attempt", loop=self.name, attempt=attempt) as attrs:
+                candidate = propose(attempt, feedback)
+                problems = check(candidate) if candidate is not None else []
+                attrs["problems"] = len(problems)
+            usage_after = token_usage.snapshot()
+            record = {
+                "attempt": attempt,
+                "latency": round(time.monotonic() - attempt_started, 3),
+                "prompt_tokens": usage_after["prompt_tokens"] - usage_before["prompt_tokens"],
+                "output_tokens": usage_after["output_tokens"] - usage_before["output_tokens"],
+                "problems": len(problems),
+                "fingerprint": fingerprint(problems) if problems else None,
+            }
+            self.attempts.append(record)
+            if candidate is None:
+                status = "gave_up"
+                break
+            if not problems:
+                status = "fixed"
+                break
+            print(f"   - ⚠️ [{self.name}] Lần thử {attempt} còn {len(problems)} lỗi ({record['fingerprint']}).")
+            # Cùng một tập lỗi hoặc cùng một bản vá lặp lại nghĩa là vòng lặp không hội tụ, dừng để tiết kiệm lời gọi
+            key = candidate_key(candidate)
+            if record["fingerprint"] in seen_failures or key in seen_candidates:
+                status = "repeated"
+                break
+            seen_failures.add(record["fingerprint"])
+            seen_candidates.add(key)
+            feedback = feedback_for(candidate, problems)
+        self.print_summary(status, time.monotonic() - started)
+        return {"status": status, "candidate": candidate, "problems": problems, "attempts": self.attempts}
+
+    def print_summary(self, status, elapsed):
+        tokens = sum(a["prompt_tokens"] + a["output_tokens"] for a in self.attempts)
+        print(f"--- 🔁 [{self.name}] Kết thúc: {status} sau {len(self.attempts)} lần thử, {elapsed:.1f}s, {tokens} token ---")
+        for a in self.attempts:
+            print(f"   - Lần {a['attempt']}: {a['latency']:.1f}s, {a['prompt_tokens']}+{a['output_tokens']} token, {a['problems']} lỗi")
@@ -0,0 +1,146 @@
+import os
+import re
+import json
+import time
+import hashlib
+import difflib
+import threading
+
+from log_analysis import error_priority, strip_timestamp
+from tracing import span
+
+# ==============================================================================
+# Kho bản vá đã biết: dấu vân tay lỗi (bỏ path, số dòng, hash) -> bản vá từng sửa được lỗi đó
+# ==============================================================================
+# Để trống FIX_STORE_FILE để tắt kho (luôn hỏi model)
+FIX_STORE_FILE = os.environ.get("FIX_STORE_FILE", ".cache/fixes/fixes.json")
+FIX_STORE_MAX_ENTRIES = int(os.environ.get("FIX_STORE_MAX_ENTRIES", "500"))
+# Bản vá đã áp dụng chỉ được tính là thành công khi lỗi không lặp lại ở repo đó trong khoảng thời gian này (giây)
+FIX_CONFIRM_SECONDS = float(os.environ.get("FIX_CONFIRM_SECONDS", str(24 * 3600)))
+# Số dòng cuối log dùng làm dấu vân tay khi không nhận ra dòng lỗi nào
+FALLBACK_TAIL_LINES = 20
+
+HEADER_RE = re.compile(r"^=== .+ ===$")
+PATH_RE = re.compile(r"(?:file://)?(?:[\w.@~\-]*/)+([\w.\-]+)")
+HASH_RE = re.compile(r"\b(?=[0-9a-f]*\d)(?=[0-9a-f]*[a-f])[0-9a-f]{7,64}\b")
+NUMBER_RE = re.compile(r"\d+")
+SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_line(line):
+    """Bỏ thư mục (giữ tên file), hash và số để cùng một lỗi ở các repo/lần chạy khác nhau cho cùng một chuỗi."""
+    line = PATH_RE.sub(r"\1", strip_timestamp(line).strip())
+    line = HASH_RE.sub("H", line)
+    return SPACE_RE.sub(" ", NUMBER_RE.sub("N", line))
+
+
+def failure_signature(log_text):
+    """Các dòng lỗi đã chuẩn hóa (không trùng, đã sắp xếp) của log."""
+    lines = [line for line in log_text.splitlines() if line.strip() and not HEADER_RE.match(line.strip())]
+    errors = [line for line in lines if error_priority(strip_timestamp(line))]
+    return sorted({normalize_line(line) for line in (errors or lines[-FALLBACK_TAIL_LINES:])})
+
+
+def failure_fingerprint(log_text, scope):
+    """`scope` tách các loại bản vá không dùng lẫn được (vd. app Flutter và script của factory)."""
+    payload = "\n".join([scope, *failure_signature(log_text)])
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def make_file_patch(path, original, updated):
+    """Unified diff cho một file; lưu diff thay vì toàn bộ file để áp dụng được khi phần còn lại của file đã đổi."""
+    return "".join(difflib.unified_diff(original.splitlines(keepends=True), updated.splitlines(keepends=True), f"a/{path}", f"b/{path}"))
+
+
+class FixStore:
+    """File JSON: fingerprint -> {patch, successes, failures, pending (repo -> thời điểm áp dụng), ...}.
+
+    Bản vá vừa commit/mở PR chỉ ở trạng thái chờ: nó được tính là thành công khi qua `confirm_after` giây mà cùng
+    lỗi không xuất hiện lại ở repo đó, và là thất bại nếu lỗi lặp lại trong khoảng đó hoặc bản vá không còn áp
+    dụng/kiểm tra được. Bản vá được coi là đã chứng minh khi số lần thành công lớn hơn số lần thất bại.
+    """
+
+    def __init__(self, path=FIX_STORE_FILE, max_entries=FIX_STORE_MAX_ENTRIES, confirm_after=FIX_CONFIRM_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.confirm_after = confirm_after
+        self.lock = threading.Lock()
+        self._entries = None
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError, TypeError):
+                self._entries = {}
+        return self._entries
+
+    def save(self):
+        if not self.path:
+            return
+        # Giữ các mục được dùng gần nhất khi vượt giới hạn
+        if len(self.entries) > self.max_entries:
+            for key in sorted(self.entries, key=lambda k: self.entries[k]["last_used"])[: len(self.entries) - self.max_entries]:
+                del self.entries[key]
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.path)
+
+    def _settle(self, entry):
+        """Các lần áp dụng đã chờ đủ lâu mà lỗi không lặp lại được tính là thành công; trả về True nếu có thay đổi."""
+        now = time.time()
+        settled = [repo for repo, applied_at in entry.setdefault("pending", {}).items() if now - applied_at >= self.confirm_after]
+        for repo in settled:
+            del entry["pending"][repo]
+            entry["successes"] += 1
+        return bool(settled)
+
+    def lookup(self, key, repo):
+        """Bản vá đã chứng minh cho fingerprint, hoặc None. Lỗi lặp lại ở `repo` trong lúc bản vá đang chờ là thất bại."""
+        if not self.path:
+            return None
+        with self.lock, span("fix_store.lookup", key=key) as attrs:
+            entry = self.entries.get(key)
+            if entry:
+                changed = self._settle(entry)
+                if repo in entry["pending"]:
+                    del entry["pending"][repo]
+                    entry["failures"] += 1
+                    changed = True
+                    print(f"   - ⚠️ Lỗi `{key}` lặp lại ở `{repo}` sau khi đã áp dụng bản vá; đánh dấu bản vá là thất bại.")
+                if changed:
+                    self.save()
+            attrs["hit"] = bool(entry and entry["successes"] > entry["failures"])
+            return dict(entry) if attrs["hit"] else None
+
+    def record_applied(self, key, patch, repo, **meta):
+        """Ghi bản vá vừa được commit/mở PR cho `repo` ở trạng thái chờ; `patch` khác bản cũ thì thay và đặt lại bộ đếm."""
+        if not self.path:
+            return
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or patch != entry["patch"]:
+                entry = self.entries[key] = {"patch": patch, "successes": 0, "failures": 0, "pending": {}, "created": time.time()}
+            self._settle(entry)
+            entry["last_used"] = entry["pending"][repo] = time.time()
+            entry.update(meta)
+            self.save()
+
+    def record_failure(self, key):
+        """Bản vá đã biết không còn áp dụng/kiểm tra được."""
+        if not self.path:
+            return
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return
+            entry["failures"] += 1
+            entry["last_used"] = time.time()
+            self.save()
+
+
+fix_store = FixStore()
@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+
+from rate_limit import call_with_rate_limit, estimate_tokens
+from tracing import tracer
+
+# ==============================================================================
+# Gọi Gemini qua một điểm duy nhất, có cache phản hồi trên đĩa theo nội dung đầu vào
+# ==============================================================================
+# readwrite: đọc + ghi cache | replay: chỉ dùng cache, miss là lỗi | refresh: luôn gọi model rồi ghi đè | off: tắt
+CACHE_MODE = os.environ.get("GEMINI_CACHE_MODE", "readwrite").lower()
+CACHE_DIR = Path(os.environ.get("GEMINI_CACHE_DIR", ".cache/gemini"))
+CACHE_TTL_SECONDS = int(os.environ.get("GEMINI_CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_MAX_BYTES = int(os.environ.get("GEMINI_CACHE_MAX_MB", "200")) << 20
+
+
+class CacheMiss(Exception):
+    pass
+
+
+_genai = None
+_genai_lock = threading.Lock()
+
+
+def get_genai():
+    """Import và cấu hình google.generativeai ở lần gọi model đầu tiên (SDK mất vài giây để import)."""
+    global _genai
+    with _genai_lock:
+        if _genai is None:
+            import google.generativeai as genai
+            genai.configure(api_key=os.environ.get("GEMINI_API_KEY") or os.environ["GOOGLE_API_KEY"])
+            _genai = genai
+        return _genai
+
+
+class ResponseCache:
+    """Cache content-addressed: key = sha256(model, prompt, generation config); loại bỏ theo TTL và dung lượng (LRU)."""
+
+    def __init__(self, directory=CACHE_DIR, ttl=CACHE_TTL_SECONDS, max_bytes=CACHE_MAX_BYTES):
+        self.directory = Path(directory)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(model_name, prompt, generation_config=None):
+        payload = json.dumps([model_name, prompt, generation_config or {}], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry["created"] > self.ttl:
+            path.unlink(missing_ok=True)
+            return None
+        os.utime(path)  # Đánh dấu vừa dùng để eviction theo LRU
+        return entry["text"]
+
+    def delete(self, key):
+        self._path(key).unlink(missing_ok=True)
+
+    def put(self, key, model_name, text):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps({"model": model_name, "created": time.time(), "text": text}, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+        self.evict()
+
+    def evict(self):
+        with self.lock:
+            entries = []
+            now = time.time()
+            for path in self.directory.glob("*/*.json"):
+                stat = path.stat()
+                if now - stat.st_mtime > self.ttl:
+                    path.unlink(missing_ok=True)
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+
+
+response_cache = ResponseCache()
+
+
+class TokenUsage:
+    """Đếm lời gọi và token Gemini trong tiến trình; lấy từ usage_metadata, ước lượng nếu SDK không trả về."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.cache_hits = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+
+    def record(self, model_name, response, prompt, text, latency):
+        usage = getattr(response, "usage_metadata", None)
+        prompt_tokens = getattr(usage, "prompt_token_count", 0) or estimate_tokens(prompt)
+        output_tokens = getattr(usage, "candidates_token_count", 0) or estimate_tokens(text)
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.output_tokens += output_tokens
+        tracer.record_model(model_name, prompt_tokens, output_tokens, latency)
+
+    def record_cache_hit(self, model_name):
+        with self._lock:
+            self.cache_hits += 1
+        tracer.record_model(model_name, 0, 0, 0.0, cached=True)
+
+    def snapshot(self):
+        with self._lock:
+            return {"calls": self.calls, "cache_hits": self.cache_hits, "prompt_tokens": self.prompt_tokens, "output_tokens": self.output_tokens}
+
+
+token_usage = TokenUsage()
+
+# sha256(phản hồi) -> các key cache đã ghi/trả về phản hồi đó trong tiến trình; forget_response() dùng để xóa đúng entry
+MAX_SERVED_KEYS = 256
+_served_keys = {}
+_served_lock = threading.Lock()
+
+
+def _text_digest(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _remember(key, text):
+    with _served_lock:
+        _served_keys.setdefault(_text_digest(text), set()).add(key)
+        while len(_served_keys) > MAX_SERVED_KEYS:
+            _served_keys.pop(next(iter(_served_keys)))
+
+
+def forget_response(text):
+    """Xóa khỏi cache phản hồi mà phía gọi không dùng được (JSON hỏng, bị cắt), để lần chạy lại gọi model thật."""
+    with _served_lock:
+        keys = _served_keys.pop(_text_digest(text), ())
+    for key in keys:
+        response_cache.delete(key)
+        print(f"   - 🗑️ Đã xóa phản hồi Gemini không dùng được khỏi cache ({key[:12]}).")
+
+
+def lookup_cache(key, model_name, required=False):
+    """Phản hồi đã cache hoặc None; `required` ở chế độ replay biến cache miss thành lỗi CacheMiss."""
+    if CACHE_MODE not in ("readwrite", "replay"):
+        return None
+    cached = response_cache.get(key)
+    if cached is not None:
+        print(f"   - ⚡ Dùng phản hồi Gemini đã cache ({key[:12]}).")
+        token_usage.record_cache_hit(model_name)
+        _remember(key, cached)
+        return cached
+    if required and CACHE_MODE == "replay":
+        raise CacheMiss(f"Không có phản hồi trong cache cho {model_name} ({key[:12]}) ở chế độ replay.")
+    return None
+
+
+def cached_text(model_name, prompt, generation_config=None):
+    """Phản hồi đã cache cho đúng model/prompt/config (không gọi model), hoặc None."""
+    return lookup_cache(ResponseCache.key(model_name, prompt, generation_config), model_name)
+
+
+def generate_text(model_name, prompt, timeout=None, generation_config=None):
+    """Sinh văn bản với Gemini; trả về ngay từ cache nếu cùng model/prompt/config đã được sinh trước đó."""
+    key = ResponseCache.key(model_name, prompt, generation_config)
+    cached = lookup_cache(key, model_name, required=True)
+    if cached is not None:
+        return cached
+
+    model = get_genai().GenerativeModel(model_name, generation_config=generation_config)
+    request_options = {'timeout': timeout} if timeout else None
+    started = time.monotonic()
+    response = call_with_rate_limit(model_name, prompt, lambda: model.generate_content(prompt, request_options=request_options))
+    text = response.text
+    token_usage.record(model_name, response, prompt, text, time.monotonic() - started)
+    if CACHE_MODE in ("readwrite", "refresh"):
+        response_cache.put(key, model_name, text)
+        _remember(key, text)
+    return text
+
+
+def stream_text(model_name, prompt, timeout=None, generation_config=None):
+    """Giống generate_text nhưng trả về từng đoạn văn bản ngay khi model sinh ra; ghi cache khi stream kết thúc."""
+    key = ResponseCache.key(model_name, prompt, generation_config)
+    cached = lookup_cache(key, model_name, required=True)
+    if cached is not None:
+        yield cached
+        return
+
+    model = get_genai().GenerativeModel(model_name, generation_config=generation_config)
+    request_options = {'timeout': timeout} if timeout else None
+    started = time.monotonic()
+    response = call_with_rate_limit(model_name, prompt, lambda: model.generate_content(prompt, stream=True, request_options=request_options))
+    parts = []
+    for chunk in response:
+        try:
+            text = chunk.text
+        except ValueError:
+            continue  # Chunk không có phần văn bản (ví dụ chunk kết thúc)
+        parts.append(text)
+        yield text
+    token_usage.record(model_name, response, prompt, "".join(parts), time.monotonic() - started)
+    if CACHE_MODE in ("readwrite", "refresh"):
+        text = "".join(parts)
+        response_cache.put(key, model_name, text)
+        _remember(key, text)
@@ -1,37 +1,50 @@
 import os
+import re
 import sys
-import time
 import base64
-import google.generativeai as genai
-from github import Github
+import argparse
+from github_client import GitHubClient
+from git_data import commit_files, wait_for_ref
+from model_router import generate
+from tracing import span, traced, tracer
+from template_store import load_template
+from concurrent.futures import ThreadPoolExecutor
 
 # --- Lấy thông tin từ biến môi trường do GitHub Actions cung cấp ---
-try:
-    google_api_key = os.environ["GOOGLE_API_KEY"]
-    github_token = os.environ["GITHUB_TOKEN"]
-    github_username = os.environ["GITHUB_USERNAME"]
-    repo_name = os.environ["ISSUE_TITLE"].strip().replace(" ", "-") # Lấy tên repo từ tiêu đề issue
-    user_prompt = os.environ["ISSUE_BODY"]
-    issue_number = int(os.environ["ISSUE_NUMBER"])
-except KeyError as e:
-    print(f"Lỗi: Biến môi trường {e} chưa được thiết lập!")
-    sys.exit(1)
-
-# --- Cấu hình API ---
-genai.configure(api_key=google_api_key)
-g = Github(github_token)
-user = g.get_user(github_username)
-repo_controller = g.get_repo(f"{github_username}/ai-app-factory") # Repo điều khiển
-issue = repo_controller.get_issue(issue_number)
+# Được gán trong load_config(); không gọi mạng hay import SDK lúc import module
+github_token = github_username = repo_name = user_prompt = issue_number = None
+gh = None
+CONTROLLER_REPO = None
+
+def load_config():
+    global github_token, github_username, repo_name, user_prompt, issue_number, gh, CONTROLLER_REPO
+    try:
+        os.environ["GOOGLE_API_KEY"]  # SDK Gemini được cấu hình ở lời gọi model đầu tiên
+        github_token = os.environ["GITHUB_TOKEN"]
+        github_username = os.environ["GITHUB_USERNAME"]
+        repo_name = os.environ["ISSUE_TITLE"].strip().replace(" ", "-") # Lấy tên repo từ tiêu đề issue
+        user_prompt = os.environ["ISSUE_BODY"]
+        issue_number = int(os.environ["ISSUE_NUMBER"])
+    except KeyError as e:
+        print(f"Lỗi: Biến môi trường {e} chưa được thiết lập!")
+        sys.exit(1)
+    gh = GitHubClient(github_token)
+    CONTROLLER_REPO = f"{github_username}/ai-app-factory" # Repo điều khiển
+
+def comment_on_issue(message):
+    gh.post(f"/repos/{CONTROLLER_REPO}/issues/{issue_number}/comments", json={"body": message})
+
+def close_issue():
+    gh.patch(f"/repos/{CONTROLLER_REPO}/issues/{issue_number}", json={"state": "closed"})
 
 # --- Các hàm gọi Gemini API ---
+@traced("gemini.generate")
 def generate_from_gemini(prompt_text, model_name="gemini-1.5-flash"):
     """Hàm chung để gọi Gemini và xử lý lỗi cơ bản."""
     try:
-        model = genai.GenerativeModel(model_name)
-        response = model.generate_content(prompt_text)
+        response_text = generate("generate", prompt_text, preferred=model_name)
         # Loại bỏ các ký tự markdown thừa mà AI có thể trả về
-        return response.text.strip().replace("```kotlin", "").replace("```xml", "").replace("```groovy", "").replace("```", "")
+        return response_text.strip().replace("```kotlin", "").replace("```xml", "").replace("```groovy", "").replace("```", "")
     except Exception as e:
         print(f"Lỗi khi gọi Gemini API: {e}")
         return None
@@ -97,131 +110,82 @@ jobs:
         GITHUB_TOKEN: ${{{{ secrets.GH_PAT }}}}
 """
 
-def get_fix_workflow():
-    return """
-name: Auto Fix Build Errors
-
-on:
-  workflow_dispatch:
-
-jobs:
-  fix-it:
-    runs-on: ubuntu-latest
-    steps:
-      - name: Checkout code
-        uses: actions/checkout@v4
-        with:
-          token: ${{ secrets.GH_PAT }}
-
-      - name: Get latest failed build log
-        id: get_log
-        uses: dawidd6/action-get-previous-run-log@v1.2.0
-        with:
-          workflow: build.yml
-          token: ${{ secrets.GH_PAT }}
-
-      - name: Setup Python
-        uses: actions/setup-python@v5
-        with:
-          python-version: '3.10'
-      
-      - name: Install dependencies for fix script
-        run: pip install google-generativeai requests
-
-      - name: Run Auto-Fix Script
-        id: run_fix
-        env:
-          GOOGLE_API_KEY: ${{ secrets.GOOGLE_API_KEY_FOR_FIX }}
-          FAILED_LOG: ${{ steps.get_log.outputs.log }}
-        # Script này sẽ phải được tạo trong repo sản phẩm
-        run: |
-          # Logic sửa lỗi sẽ được thực hiện bởi một script riêng
-          # (Đây là phần thử nghiệm và phức tạp nhất)
-          echo "FIX_SCRIPT_PLACEHOLDER"
-
-      - name: Commit and push the fix
-        if: steps.run_fix.outputs.fix_applied == 'true'
-        run: |
-          git config --global user.name 'AI Factory Bot'
-          git config --global user.email 'bot@example.com'
-          git add .
-          git commit -m "chore: Attempting auto-fix for build error"
-          git push
-"""
-
 # --- Cấu trúc file Android cơ bản ---
-# (Đây là một ví dụ đơn giản, thực tế có thể phức tạp hơn)
-ANDROID_PROJECT_STRUCTURE = {
-    # Các file sẽ được tạo bởi Gemini
-    "app/src/main/java/com/example/aifactoryapp/MainActivity.kt": "",
-    "app/src/main/res/layout/activity_main.xml": "",
-    # Các file cấu hình cố định
-    "app/build.gradle.kts": """plugins{id("com.android.application");id("org.jetbrains.kotlin.android")}
-android{namespace="com.example.aifactoryapp";compileSdk=34;defaultConfig{applicationId="com.example.aifactoryapp";minSdk=24;targetSdk=34;versionCode=1;versionName="1.0"};buildTypes{release{isMinifyEnabled=false;proguardFiles(getDefaultProguardFile("proguard-android-optimize.txt"),"proguard-rules.pro")}};compileOptions{sourceCompatibility=JavaVersion.VERSION_1_8;targetCompatibility=JavaVersion.VERSION_1_8};kotlinOptions{jvmTarget="1.8"}}
-dependencies{implementation("androidx.core:core-ktx:1.12.0");implementation("androidx.appcompat:appcompat:1.6.1");implementation("com.google.android.material:material:1.11.0");implementation("androidx.constraintlayout:constraintlayout:2.1.4")}""",
-    "build.gradle.kts": """plugins { id("com.android.application") version "8.2.0" apply false; id("org.jetbrains.kotlin.android") version "1.9.20" apply false }""",
-    "settings.gradle.kts": """pluginManagement { repositories { google(); mavenCentral(); gradlePluginPortal() } }
-dependencyResolutionManagement { repositoriesMode.set(RepositoriesMode.FAIL_ON_PROJECT_REPOS); repositories { google(); mavenCentral() } }
-rootProject.name = "AI Factory App"
-include(":app")""",
-    "app/src/main/AndroidManifest.xml": """<manifest xmlns:android="http://schemas.android.com/apk/res/android" package="com.example.aifactoryapp"><application android:allowBackup="true" android:icon="@mipmap/ic_launcher" android:label="@string/app_name" android:roundIcon="@mipmap/ic_launcher_round" android:supportsRtl="true" android:theme="@style/Theme.AppCompat.Light"><activity android:name=".MainActivity" android:exported="true"><intent-filter><action android:name="android.intent.action.MAIN" /><category android:name="android.intent.category.LAUNCHER" /></intent-filter></activity></application></manifest>""",
-    "app/src/main/res/values/strings.xml": """<resources><string name="app_name">AI Factory App</string></resources>""",
-    # Workflows
-    ".github/workflows/build.yml": get_build_workflow(),
-    ".github/workflows/fix.yml": get_fix_workflow(),
-}
+# File cấu hình cố định lấy từ kho template (.github/templates/android); hai file dưới đây do Gemini tạo
+GENERATED_FILES = [
+    "app/src/main/java/com/example/aifactoryapp/MainActivity.kt",
+    "app/src/main/res/layout/activity_main.xml",
+]
 
 # --- Main Logic ---
 def main():
-    issue.create_comment(f"🚀 Bắt đầu quá trình tạo ứng dụng cho repo `{repo_name}`...")
+    # build.yml phụ thuộc tên repo nên không nằm trong template
+    project_files = dict(load_template("android").files)
+    project_files[".github/workflows/build.yml"] = get_build_workflow()
+    comment_on_issue(f"🚀 Bắt đầu quá trình tạo ứng dụng cho repo `{repo_name}`...")
     
-    # 1. Tạo repo mới trên GitHub
+    # 1. Tạo repo mới trên GitHub (dispatcher đặt RESUME_EXISTING_REPO khi chạy lại vào repo do lần thất bại trước tạo)
     try:
-        new_repo = user.create_repo(repo_name, description=f"App generated by AI Factory from prompt: {user_prompt[:50]}...", private=False)
-        print(f"Repo '{repo_name}' đã được tạo.")
-        issue.create_comment(f"✅ Đã tạo thành công repo: [{repo_name}](https://github.com/{github_username}/{repo_name})")
+        if os.environ.get("RESUME_EXISTING_REPO") == "1":
+            print(f"Repo '{repo_name}' đã có từ lần chạy trước, tiếp tục commit vào repo này.")
+        else:
+            with span("repo.create"):
+                gh.json("POST", "/user/repos", json={"name": repo_name, "description": f"App generated by AI Factory from prompt: {user_prompt[:50]}...", "private": False, "auto_init": True})
+            print(f"Repo '{repo_name}' đã được tạo.")
+        comment_on_issue(f"✅ Đã tạo thành công repo: [{repo_name}](https://github.com/{github_username}/{repo_name})")
     except Exception as e:
         print(f"Lỗi khi tạo repo: {e}")
-        issue.create_comment(f"❌ Lỗi! Không thể tạo repo `{repo_name}`. Có thể nó đã tồn tại.")
+        comment_on_issue(f"❌ Lỗi! Không thể tạo repo `{repo_name}`. Có thể nó đã tồn tại.")
         sys.exit(1)
 
-    time.sleep(2) # Đợi một chút để repo sẵn sàng
-    
     # 2. Dùng Gemini tạo spec chi tiết
     print("Đang tạo spec chi tiết...")
     detailed_spec = generate_detailed_prompt(user_prompt)
     if not detailed_spec:
-        issue.create_comment("❌ Lỗi! Không thể tạo spec chi tiết từ Gemini.")
+        comment_on_issue("❌ Lỗi! Không thể tạo spec chi tiết từ Gemini.")
         sys.exit(1)
 
     # 3. Tạo các file mã nguồn và đẩy lên repo mới
-    files_to_generate = [
-        "app/src/main/java/com/example/aifactoryapp/MainActivity.kt",
-        "app/src/main/res/layout/activity_main.xml"
-    ]
-
-    for file_path in files_to_generate:
-        print(f"Đang tạo nội dung cho {file_path}...")
-        content = generate_file_content(detailed_spec, file_path)
-        if content:
-            ANDROID_PROJECT_STRUCTURE[file_path] = content
-        else:
-            print(f"Không thể tạo nội dung cho {file_path}, sẽ sử dụng file trống.")
-        time.sleep(5) # Thêm độ trễ để tránh lỗi rate limit của Gemini
-
-    # 4. Commit tất cả các file vào repo mới
-    print("Đang commit các file vào repo mới...")
-    for file_path, content in ANDROID_PROJECT_STRUCTURE.items():
-        if content:
-            try:
-                new_repo.create_file(file_path, f"feat: Create {os.path.basename(file_path)}", content)
-                print(f" -> Đã tạo file: {file_path}")
-                time.sleep(1) # Tránh rate limit của GitHub API
-            except Exception as e:
-                print(f"Lỗi khi tạo file {file_path}: {e}")
-
-    issue.create_comment("✅ Hoàn tất! Mã nguồn đã được đẩy lên repo mới. Quá trình build sẽ tự động bắt đầu. Hãy kiểm tra tab 'Actions' của repo đó.")
-    issue.edit(state="closed") # Đóng issue lại khi đã hoàn thành
+    files_to_generate = GENERATED_FILES
+
+    # Các file được sinh song song; rate limiter của model lo việc điều tiết quota thay cho sleep cố định
+    print(f"Đang tạo nội dung cho {len(files_to_generate)} file song song...")
+    with ThreadPoolExecutor(max_workers=len(files_to_generate)) as executor:
+        generated = executor.map(lambda path: generate_file_content(detailed_spec, path), files_to_generate)
+        for file_path, content in zip(files_to_generate, generated):
+            if content:
+                project_files[file_path] = content
+            else:
+                print(f"Không thể tạo nội dung cho {file_path}, sẽ sử dụng file trống.")
+
+    # 4. Commit tất cả các file vào repo mới trong một commit duy nhất (chỉ kích hoạt một lần build)
+    files_to_commit = {path: content for path, content in project_files.items() if content}
+    print(f"Đang commit {len(files_to_commit)} file vào repo mới...")
+    try:
+        # Repo đã được khởi tạo trong lúc Gemini sinh code; thường ref đã có sẵn ngay lần poll đầu tiên
+        main_ref = wait_for_ref(gh, f"{github_username}/{repo_name}")
+        commit_files(gh, f"{github_username}/{repo_name}", files_to_commit, "feat: Initial Android project by AI Factory", branch_ref=main_ref)
+    except Exception as e:
+        print(f"Lỗi khi commit các file: {e}")
+        comment_on_issue(f"❌ Lỗi! Không thể commit mã nguồn vào repo `{repo_name}`: {e}")
+        sys.exit(1)
+
+    comment_on_issue("✅ Hoàn tất! Mã nguồn đã được đẩy lên repo mới. Quá trình build sẽ tự động bắt đầu. Hãy kiểm tra tab 'Actions' của repo đó.")
+    close_issue() # Đóng issue lại khi đã hoàn thành
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="AI App Generator")
+    parser.add_argument("--check", "--dry-run", dest="check", action="store_true", help="Chỉ kiểm tra cấu hình và tên repo rồi thoát")
+    args = parser.parse_args()
+    load_config()
+    if args.check:
+        if not re.fullmatch(r"[A-Za-z0-9._-]{1,100}", repo_name) or not user_prompt.strip():
+            print(f"❌ Yêu cầu không hợp lệ: tên repo `{repo_name}` hoặc nội dung issue trống.")
+            sys.exit(1)
+        print(f"✅ Yêu cầu hợp lệ: sẽ tạo repo `{repo_name}`.")
+        sys.exit(0)
+    try:
+        main()
+    finally:
+        gh.metrics.print_summary("App Generator")
+        tracer.write_summary("App Generator")
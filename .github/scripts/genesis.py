@@ -1,63 +1,119 @@
-import os, re, json, base64, time, sys, requests, google.generativeai as genai, traceback, argparse
+import os, re, time, sys, threading, traceback, argparse
+from github_client import GitHubClient
+from git_data import TreeBuilder, commit_changes, commit_files, commit_tree, diff_against_snapshot, fetch_repo_snapshot, wait_for_ref
+from gemini_client import forget_response, stream_text
+from model_router import generate
+from json_stream import FileTreeStreamParser
+from json_extract import parse_model_json
+from batch_journal import Journal, iter_requests
+from secrets_upload import SecretUploader
+from validation import VALIDATION_RETRIES, format_problems, validate_files
+from tracing import traced, tracer
+from template_store import load_template
+from concurrent.futures import ThreadPoolExecutor
 
 # ==============================================================================
 # I. CẤU HÌNH
 # ==============================================================================
-print("--- [Genesis] Bước 1: Đang tải cấu hình ---")
-try:
-    GEMINI_API_KEY = os.environ["GEMINI_API_KEY"]
-    GITHUB_TOKEN = os.environ["GITHUB_TOKEN"]
-    REPO_OWNER = os.environ["GH_USER"]
-    COMMIT_AUTHOR = {"name": os.environ["COMMIT_NAME"], "email": os.environ["COMMIT_EMAIL"]}
-except KeyError as e:
-    print(f"❌ [Genesis] LỖI: Thiếu biến môi trường: {e}", file=sys.stderr)
-    sys.exit(1)
-
-API_BASE_URL = "https://api.github.com"
-HEADERS = {"Authorization": f"Bearer {GITHUB_TOKEN}", "Accept": "application/vnd.github.v3+json"}
-genai.configure(api_key=GEMINI_API_KEY)
-
-FLUTTER_WORKFLOW_CONTENT = r"""
-name: Build and Release Flutter APK
-on: [push, workflow_dispatch]
-jobs:
-  build:
-    runs-on: ubuntu-latest
-    steps:
-      - uses: actions/checkout@v4
-      - uses: actions/setup-java@v4
-        with: { java-version: '17', distribution: 'temurin' }
-      - uses: subosito/flutter-action@v2
-        with: { channel: 'stable' }
-      - run: flutter pub get
-      - name: Decode Keystore and Create Properties
-        run: |
-          mkdir -p android/app
-          echo "${{ secrets.RELEASE_KEYSTORE_BASE64 }}" | base64 --decode > android/app/upload-keystore.jks
-          echo "storePassword=${{ secrets.RELEASE_KEYSTORE_PASSWORD }}" > android/key.properties
-          echo "keyPassword=${{ secrets.RELEASE_KEY_PASSWORD }}" >> android/key.properties
-          echo "keyAlias=${{ secrets.RELEASE_KEY_ALIAS }}" >> android/key.properties
-          echo "storeFile=../app/upload-keystore.jks" >> android/key.properties
-      - name: Build APK
-        run: flutter build apk --release
-      - uses: actions/upload-artifact@v4
-        with: { name: release-apk, path: build/app/outputs/flutter-apk/app-release.apk }
-"""
+# Được gán trong load_config(); không đọc môi trường hay tạo client lúc import để khởi động nhanh
+GITHUB_TOKEN = REPO_OWNER = COMMIT_AUTHOR = None
+gh = None
+REQUIRED_REQUEST_FIELDS = ("repo_name", "language", "model", "prompt")
+
+def load_config():
+    global GITHUB_TOKEN, REPO_OWNER, COMMIT_AUTHOR, gh
+    print("--- [Genesis] Bước 1: Đang tải cấu hình ---")
+    try:
+        os.environ["GEMINI_API_KEY"]  # SDK Gemini chỉ được import và cấu hình ở lời gọi model đầu tiên
+        GITHUB_TOKEN = os.environ["GITHUB_TOKEN"]
+        REPO_OWNER = os.environ["GH_USER"]
+        COMMIT_AUTHOR = {"name": os.environ["COMMIT_NAME"], "email": os.environ["COMMIT_EMAIL"]}
+    except KeyError as e:
+        print(f"❌ [Genesis] LỖI: Thiếu biến môi trường: {e}", file=sys.stderr)
+        sys.exit(1)
+    gh = GitHubClient(GITHUB_TOKEN)
+
+# Số lời gọi sinh file đồng thời trong chế độ --chunked (quota thực tế do rate limiter của model điều tiết)
+CHUNK_WORKERS = int(os.environ.get("CHUNK_WORKERS", "8"))
 
 # ==============================================================================
 # II. CÁC HÀM TIỆN ÍCH
 # ==============================================================================
 
-def call_gemini_for_code(user_prompt, language, model_name):
+def template_note(template):
+    return f"\n\n{template.prompt_note()}" if template else ""
+
+def build_code_prompt(user_prompt, language, template=None):
+    return f'Bạn là một kỹ sư phần mềm chuyên về {language}. Dựa trên yêu cầu: "{user_prompt}", hãy tạo cấu trúc file và thư mục hoàn chỉnh. Trả về dưới dạng một đối tượng JSON lồng nhau duy nhất, bao bọc trong khối ```json ... ```.' + template_note(template)
+
+def parse_json_response(response_text):
+    # Cây file bị cắt cụt thì thiếu file: lỗi để lần chạy lại gọi model lại, không commit dự án không đầy đủ
+    return parse_model_json(response_text, complete=True)
+
+@traced("gemini.generate_code")
+def call_gemini_for_code(user_prompt, language, model_name, template=None):
     print(f"--- [Genesis] Bước 2: Đang gọi AI ({model_name}) ---")
-    model = genai.GenerativeModel(model_name)
-    final_prompt = f'Bạn là một kỹ sư phần mềm chuyên về {language}. Dựa trên yêu cầu: "{user_prompt}", hãy tạo cấu trúc file và thư mục hoàn chỉnh. Trả về dưới dạng một đối tượng JSON lồng nhau duy nhất, bao bọc trong khối ```json ... ```.'
-    response = model.generate_content(final_prompt, request_options={'timeout': 300})
-    match = re.search(r'```json\s*(\{.*?\})\s*```', response.text, re.DOTALL)
-    if not match: match = re.search(r'\{.*\}', response.text, re.DOTALL)
-    if not match: raise ValueError(f"AI không trả về JSON hợp lệ. Phản hồi thô:\n{response.text}")
+    final_prompt = build_code_prompt(user_prompt, language, template)
+    response_text = generate("generate", final_prompt, timeout=300, preferred=model_name)
+    file_tree = parse_json_response(response_text)
+    print("   - ✅ AI đã tạo code thành công.")
+    return file_tree
+
+OUTER_FENCE_RE = re.compile(r'\A\s*```[\w.+-]*[ \t]*\n(.*)\n```\s*\Z', re.DOTALL)
+INNER_FENCE_RE = re.compile(r'^[ \t]*```([\w.+-]*)', re.MULTILINE)
+
+def fences_balanced(body):
+    """Các khối ``` bên trong đóng mở đủ; dòng ```<ngôn ngữ> chỉ có thể mở khối, không thể đóng."""
+    inside = False
+    for info in INNER_FENCE_RE.findall(body):
+        if inside and info:
+            return False
+        inside = not inside
+    return not inside
+
+def strip_code_fence(text):
+    """Bỏ khối ```...``` chỉ khi nó bọc toàn bộ phản hồi; khối code bên trong (vd. trong README) được giữ nguyên."""
+    match = OUTER_FENCE_RE.match(text)
+    # Phản hồi gồm nhiều khối liền nhau cũng bắt đầu và kết thúc bằng ```, nhưng phần giữa không cân bằng
+    if match and fences_balanced(match.group(1)):
+        return match.group(1) + "\n"
+    return text.strip() + "\n"
+
+@traced("gemini.plan_files")
+def plan_project_files(user_prompt, language, model_name, template=None):
+    print(f"--- [Genesis] Bước 2a: Đang lập danh sách file với AI ({model_name}) ---")
+    plan_prompt = f'Bạn là một kiến trúc sư phần mềm chuyên về {language}. Dựa trên yêu cầu: "{user_prompt}", hãy liệt kê TẤT CẢ các file cần có của dự án (chưa viết nội dung). Trả về MỘT JSON duy nhất dạng `{{"files": [{{"path": "lib/main.dart", "description": "Vai trò và nội dung chính của file"}}]}}`, bao bọc trong khối ```json ... ```.' + template_note(template)
+    manifest = parse_json_response(generate("plan", plan_prompt, timeout=120, preferred=model_name)).get("files") or []
+    # File boilerplate đã có trong template thì không tốn lời gọi model để sinh lại
+    locked = set(template.locked_paths()) if template else set()
+    manifest = [entry for entry in manifest if isinstance(entry, dict) and entry.get("path") and entry["path"].strip("/") not in locked]
+    if not manifest: raise ValueError("AI không trả về danh sách file nào cho dự án.")
+    print(f"   - ✅ Đã lập kế hoạch cho {len(manifest)} file.")
+    return manifest
+
+@traced("gemini.generate_file")
+def generate_project_file(user_prompt, language, model_name, manifest_text, entry):
+    file_prompt = f'Bạn là một kỹ sư phần mềm chuyên về {language}. Dự án được mô tả như sau: "{user_prompt}".\n\nDanh sách file của dự án:\n{manifest_text}\n\nHãy viết nội dung HOÀN CHỈNH cho file `{entry["path"]}` ({entry.get("description", "")}). Đảm bảo nhất quán với các file khác trong danh sách (tên class, import, package). Chỉ trả về nội dung file trong một khối code duy nhất, không giải thích.'
+    return strip_code_fence(generate("file", file_prompt, timeout=300, preferred=model_name))
+
+def call_gemini_for_code_chunked(user_prompt, language, model_name, template=None, workers=CHUNK_WORKERS):
+    """Planner/worker: một lời gọi lập manifest, sau đó sinh từng file song song và ghép lại thành cây file lồng nhau."""
+    manifest = plan_project_files(user_prompt, language, model_name, template)
+    manifest_text = "\n".join(f"- {entry['path']}: {entry.get('description', '')}" for entry in manifest)
+    if template:
+        manifest_text += "\n" + "\n".join(f"- {path}: (có sẵn từ template)" for path in template.locked_paths())
+    print(f"--- [Genesis] Bước 2b: Đang sinh {len(manifest)} file song song ({workers} worker) ---")
+    file_tree = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        contents = executor.map(lambda entry: generate_project_file(user_prompt, language, model_name, manifest_text, entry), manifest)
+        for entry, content in zip(manifest, contents):
+            *directories, file_name = [part for part in entry["path"].strip("/").split("/") if part]
+            node = file_tree
+            for directory in directories:
+                node = node.setdefault(directory, {})
+            node[file_name] = content
     print("   - ✅ AI đã tạo code thành công.")
-    return json.loads(match.group(0), strict=False)
+    return file_tree
 
 def flatten_file_tree(file_tree, path=''):
     items = {}
@@ -69,32 +125,156 @@ def flatten_file_tree(file_tree, path=''):
             items[new_path] = value
     return items
 
+def repair_invalid_files(user_prompt, language, model_name, files, problems):
+    """Gửi lại cho AI đúng các file bị lỗi kèm thông báo lỗi; trả về dict path -> nội dung đã sửa."""
+    broken = {path for path, _ in problems if isinstance(files.get(path), str)}
+    broken_files = "".join(f"\n\n--- `{path}` ---\n```\n{files[path]}\n```" for path in sorted(broken))
+    repair_prompt = f'Bạn là một kỹ sư phần mềm chuyên về {language}. Dự án "{user_prompt}" có các lỗi sau khi kiểm tra cục bộ:\n{format_problems(problems)}\n\nDanh sách file của dự án:\n' + "\n".join(sorted(files)) + f'{broken_files}\n\nHãy sửa các lỗi trên (có thể tạo file còn thiếu). Trả về MỘT JSON duy nhất dạng `{{"files": {{"path": "nội dung HOÀN CHỈNH của file"}}}}` chỉ gồm các file cần thay đổi, bao bọc trong khối ```json ... ```.'
+    fixed = parse_json_response(generate("repair", repair_prompt, timeout=300, preferred=model_name)).get("files") or {}
+    return {path: content for path, content in fixed.items() if isinstance(content, str)}
+
+@traced("validate")
+def validate_and_repair(files, user_prompt, language, model_name, retries=VALIDATION_RETRIES):
+    """Kiểm tra cục bộ trước khi commit; file lỗi được gửi lại cho AI sửa tối đa `retries` lần."""
+    print(f"--- [Genesis] 🔍 Đang kiểm tra cục bộ {len(files)} file trước khi commit ---")
+    for attempt in range(retries + 1):
+        problems = validate_files(files)
+        if not problems:
+            print("   - ✅ Không phát hiện lỗi.")
+            return files
+        print(f"   - ⚠️ Phát hiện {len(problems)} lỗi:\n{format_problems(problems)}")
+        if attempt == retries:
+            print("   - ⚠️ Vẫn còn lỗi sau khi AI sửa, tiếp tục commit để CI báo lỗi chi tiết.")
+            return files
+        print(f"   - 🔁 Gửi lại cho AI sửa (lần {attempt + 1}/{retries})...")
+        try:
+            files.update(repair_invalid_files(user_prompt, language, model_name, files, problems))
+        except Exception as e:
+            # Lỗi khi sửa (JSON hỏng, model lỗi) không được làm hỏng cả lần tạo app: vẫn commit để CI báo lỗi
+            print(f"   - ⚠️ AI sửa lỗi thất bại ({e.__class__.__name__}: {str(e)[:200]}), tiếp tục commit để CI báo lỗi chi tiết.")
+            return files
+    return files
+
+@traced("repo.create")
+def create_repo(repo_name):
+    # Git Data API trả về 409 với repo rỗng nên vẫn cần auto_init; chỉ chờ đến khi branch main xuất hiện
+    # GH_USER là org thì repo phải thuộc org (/user/repos luôn tạo dưới user của token)
+    path = f"/orgs/{REPO_OWNER}/repos" if gh.owner_is_org(REPO_OWNER) else "/user/repos"
+    gh.json("POST", path, json={"name": repo_name, "private": False, "auto_init": True})
+    started = time.monotonic()
+    main_ref = wait_for_ref(gh, f"{REPO_OWNER}/{repo_name}")
+    print(f"   - Repo đã được tạo và sẵn sàng sau {time.monotonic() - started:.1f} giây.")
+    return main_ref
+
+def repo_exists(repo_name):
+    return gh.get(f"/repos/{REPO_OWNER}/{repo_name}").status_code == 200
+
+def delete_repo(repo_name):
+    """Xóa repo do chính lần chạy này tạo khi pipeline thất bại giữa chừng, để lần chạy lại không gặp lỗi repo đã tồn tại."""
+    response = gh.delete(f"/repos/{REPO_OWNER}/{repo_name}")
+    if response.status_code in (204, 404):
+        print(f"   - 🧹 Đã xóa repo dở dang `{repo_name}`.")
+    else:
+        print(f"   - ⚠️ Không xóa được repo dở dang `{repo_name}` (HTTP {response.status_code}, token cần quyền delete_repo).", file=sys.stderr)
+
+@traced("git.commit_project")
 def create_and_commit_project(repo_name, file_tree):
     print(f"--- [Genesis] Bước 3: Đang tạo repo và commit {len(file_tree)} file ---")
-    requests.post(f"{API_BASE_URL}/user/repos", headers=HEADERS, json={"name": repo_name, "private": False, "auto_init": True}).raise_for_status()
-    print("   - Repo đã được tạo. Đợi 5 giây...")
-    time.sleep(5)
-    
-    ref_url = f"{API_BASE_URL}/repos/{REPO_OWNER}/{repo_name}/git/refs/heads/main"
-    main_ref = requests.get(ref_url, headers=HEADERS).json()
-    latest_commit_sha = main_ref['object']['sha']
-    base_tree_sha = requests.get(main_ref['object']['url'], headers=HEADERS).json()['tree']['sha']
-    
-    tree_elements = []
-    for path, content in file_tree.items():
-        if not isinstance(content, str): continue
-        blob = requests.post(f"{API_BASE_URL}/repos/{REPO_OWNER}/{repo_name}/git/blobs", headers=HEADERS, json={"content": content, "encoding": "utf-8"}).json()
-        tree_elements.append({"path": path, "mode": "100644", "type": "blob", "sha": blob['sha']})
-        
-    new_tree = requests.post(f"{API_BASE_URL}/repos/{REPO_OWNER}/{repo_name}/git/trees", headers=HEADERS, json={"base_tree": base_tree_sha, "tree": tree_elements}).json()
-    new_commit = requests.post(f"{API_BASE_URL}/repos/{REPO_OWNER}/{repo_name}/git/commits", headers=HEADERS, json={"message": "feat: Initial project structure by AI Factory", "author": COMMIT_AUTHOR, "parents": [latest_commit_sha], "tree": new_tree['sha']}).json()
-    requests.patch(ref_url, headers=HEADERS, json={"sha": new_commit['sha']}).raise_for_status()
+    main_ref = create_repo(repo_name)
+    try:
+        commit_files(gh, f"{REPO_OWNER}/{repo_name}", file_tree, "feat: Initial project structure by AI Factory", author=COMMIT_AUTHOR, branch_ref=main_ref)
+    except BaseException:
+        delete_repo(repo_name)
+        raise
     print("   - ✅ Đã commit tất cả file thành công!")
 
+@traced("git.update_project")
+def update_project(repo_name, files):
+    """Cập nhật repo đã có: chỉ upload file có SHA blob khác và xóa file không còn, trong một commit."""
+    print(f"--- [Genesis] Bước 3: Đang cập nhật repo có sẵn `{repo_name}` ({len(files)} file) ---")
+    repo_full_name = f"{REPO_OWNER}/{repo_name}"
+    # Chỉ cần danh sách path + SHA (một lời gọi git/trees đệ quy), không đọc nội dung blob nào
+    snapshot = fetch_repo_snapshot(gh, repo_full_name, paths=())
+    changes = diff_against_snapshot(snapshot, files)
+    deleted = sum(1 for content in changes.values() if content is None)
+    added = sum(1 for path, content in changes.items() if content is not None and path not in snapshot["entries"])
+    print(f"   - {len(changes) - deleted - added} file sửa, {added} file mới, {deleted} file xóa, {len(files) - len(changes) + deleted} file giữ nguyên.")
+    if not changes:
+        print("   - ✅ Repo đã khớp với bản sinh mới, không cần commit.")
+        return
+    commit_changes(gh, repo_full_name, snapshot, changes, "feat: Regenerate project by AI Factory", author=COMMIT_AUTHOR)
+    print("   - ✅ Đã commit các thay đổi thành công!")
+
+@traced("gemini.stream_and_commit")
+def stream_and_commit_project(repo_name, user_prompt, language, model_name, template=None):
+    """Chế độ streaming: mỗi file được upload ngay khi model sinh xong nội dung của nó.
+
+    Repo chỉ được tạo khi model trả về file đầu tiên; nếu pipeline thất bại sau đó, repo vừa tạo bị xóa.
+    """
+    print(f"--- [Genesis] Bước 2+3: Đang stream code từ AI ({model_name}) và tạo repo khi có file đầu tiên ---")
+    main_ref = builder = None
+    parser = FileTreeStreamParser()
+    generated = {}
+    chunks = []
+
+    def add_file(path, content):
+        nonlocal main_ref, builder
+        if builder is None:
+            main_ref = create_repo(repo_name)
+            builder = TreeBuilder(gh, f"{REPO_OWNER}/{repo_name}")
+        builder.add(path, content)
+
+    try:
+        locked = set(template.locked_paths()) if template else set()
+        prompt = build_code_prompt(user_prompt, language, template)
+        # Stream không hedge/fallback được (file đã upload dần) nên luôn dùng đúng model người dùng chọn
+        for chunk in stream_text(model_name, prompt, timeout=300):
+            chunks.append(chunk)
+            for path, content in parser.feed(chunk):
+                if path in locked:
+                    continue
+                add_file(path, content)
+                generated[path] = content
+        if not parser.done:
+            forget_response("".join(chunks))
+            raise ValueError("AI trả về JSON không hoàn chỉnh (stream kết thúc trước khi đóng object gốc).")
+        print(f"   - ✅ AI đã tạo code thành công ({len(generated)} file).")
+        # File template (trừ file overridable AI đã sinh lại) được thêm sau; đều nhỏ nên gửi thẳng trong tree, không upload blob
+        for path, content in (template.files.items() if template else ()):
+            if path not in generated:
+                add_file(path, content)
+                generated[path] = content
+        # Chỉ các file được AI sửa lại mới phải upload lại; blob của các file còn lại đã upload xong
+        for path, content in validate_and_repair(dict(generated), user_prompt, language, model_name).items():
+            if generated.get(path) != content:
+                add_file(path, content)
+        if builder is None:
+            raise ValueError("AI không trả về file nào.")
+        commit_tree(gh, f"{REPO_OWNER}/{repo_name}", builder.elements(), "feat: Initial project structure by AI Factory", author=COMMIT_AUTHOR, branch_ref=main_ref)
+    except BaseException:
+        if main_ref is not None:
+            delete_repo(repo_name)
+        raise
+    finally:
+        if builder is not None:
+            builder.executor.shutdown(wait=False, cancel_futures=True)
+    print("   - ✅ Đã commit tất cả file thành công!")
+
+secret_uploader = None
+secret_uploader_lock = threading.Lock()
+
+def get_secret_uploader():
+    # Dùng chung một uploader cho mọi repo trong tiến trình để cache public key / SealedBox
+    global secret_uploader
+    with secret_uploader_lock:
+        if secret_uploader is None:
+            secret_uploader = SecretUploader(gh)
+        return secret_uploader
+
 def upload_secrets(repo_name, keystore_b64, keystore_pass, key_alias, key_pass):
     print(f"--- [Genesis] 🔑 Đang tự động thêm secrets vào repo {repo_name} ---")
     try:
-        from nacl import encoding, public
+        uploader = get_secret_uploader()
     except ImportError:
         print("   - Cảnh báo: Thư viện 'pynacl' chưa được cài đặt trong môi trường. Sẽ bỏ qua bước thêm secrets.", file=sys.stderr)
         return
@@ -105,57 +285,147 @@ def upload_secrets(repo_name, keystore_b64, keystore_pass, key_alias, key_pass):
         "RELEASE_KEY_ALIAS": key_alias,
         "RELEASE_KEY_PASSWORD": key_pass
     }
-    
-    key_url = f"{API_BASE_URL}/repos/{REPO_OWNER}/{repo_name}/actions/secrets/public-key"
-    key_data = requests.get(key_url, headers=HEADERS).json()
-    public_key = public.PublicKey(key_data['key'], encoding.Base64Encoder())
-    sealed_box = public.SealedBox(public_key)
-
-    for name, value in secrets_to_upload.items():
-        encrypted = base64.b64encode(sealed_box.encrypt(value.encode("utf-8"))).decode("utf-8")
-        requests.put(f"{API_BASE_URL}/repos/{REPO_OWNER}/{repo_name}/actions/secrets/{name}", headers=HEADERS, json={"encrypted_value": encrypted, "key_id": key_data['key_id']}).raise_for_status()
-    
+    uploader.upload(f"{REPO_OWNER}/{repo_name}", secrets_to_upload)
     print(f"   - ✅ Đã thêm thành công {len(secrets_to_upload)} secrets.")
 
 
+@traced("genesis.app")
+def generate_project(repo_name, language, model_name, prompt, secrets=None, stream=False, chunked=False, update=False):
+    """Toàn bộ pipeline cho một app: sinh code, tạo repo + commit (hoặc cập nhật repo có sẵn), thêm secrets (nếu có)."""
+    print(f"✅ Đã nhận yêu cầu cho repo `{repo_name}`.")
+    if update and stream:
+        print("   - ℹ️  Chế độ cập nhật cần toàn bộ cây file để so sánh nên không dùng --stream.")
+        stream = False
+    template = load_template(language)
+    if template:
+        print(f"   - 📦 Dùng template `{template.name}` v{template.version} ({len(template.files)} file boilerplate).")
+    if stream:
+        stream_and_commit_project(repo_name, prompt, language, model_name, template)
+    else:
+        file_tree = (call_gemini_for_code_chunked if chunked else call_gemini_for_code)(prompt, language, model_name, template)
+        flat_file_tree = flatten_file_tree(file_tree)
+        if template:
+            flat_file_tree = template.merge(flat_file_tree)
+        flat_file_tree = validate_and_repair(flat_file_tree, prompt, language, model_name)
+        (update_project if update else create_and_commit_project)(repo_name, flat_file_tree)
+
+    if secrets and all(secrets):
+        upload_secrets(repo_name, *secrets)
+    else:
+        print("--- [Genesis] ℹ️  Bỏ qua bước thêm secrets do không được cung cấp. ---")
+    
+    print(f"🎉 Dự án `{repo_name}` đã được {'cập nhật' if update else 'tạo'} thành công!")
+
+def check_request(request):
+    """Kiểm tra nhanh một request (không gọi mạng); trả về danh sách vấn đề, rỗng nếu hợp lệ."""
+    if "_error" in request:
+        return [request["_error"]]
+    problems = [f"thiếu `{field}`" for field in REQUIRED_REQUEST_FIELDS if not str(request.get(field) or "").strip()]
+    if request.get("repo_name") and not re.fullmatch(r"[A-Za-z0-9._-]{1,100}", request["repo_name"]):
+        problems.append(f"tên repo không hợp lệ: `{request['repo_name']}`")
+    try:
+        load_template(request.get("language"))
+    except ValueError as e:
+        problems.append(str(e))
+    return problems
+
+def run_check(args):
+    """--check/--dry-run: xác thực cấu hình và đầu vào rồi thoát, không import SDK và không gọi mạng."""
+    load_config()
+    if args.batch:
+        requests_to_check = [(f"dòng {line_no}", request) for line_no, request in iter_requests(args.batch)]
+    else:
+        requests_to_check = [("CLI", {"repo_name": args.repo_name, "language": args.language, "model": args.model, "prompt": args.prompt})]
+    invalid = 0
+    for label, request in requests_to_check:
+        problems = check_request(request)
+        invalid += bool(problems)
+        status = "❌ " + "; ".join(problems) if problems else f"✅ sẽ tạo `{request['repo_name']}` ({request['language']}, {request['model']})"
+        print(f"   - [{label}] {status}")
+    print(f"--- [Genesis] Kiểm tra xong: {len(requests_to_check) - invalid} hợp lệ, {invalid} không hợp lệ ---")
+    return invalid == 0
+
+def run_batch(batch_path, journal_path, workers, secrets=None, stream=False, chunked=False, update=False):
+    """Xử lý các request trong file JSONL song song; request đã `done` trong journal sẽ được bỏ qua."""
+    journal = Journal(journal_path)
+    print(f"--- [Genesis] 📦 Chạy batch từ `{batch_path}` với {workers} worker, journal: `{journal_path}` ---")
+
+    def run_one(request_id, request):
+        started = time.monotonic()
+        try:
+            if "_error" in request:
+                raise ValueError(request["_error"])
+            request_update = request.get("update", update)
+            # Lần trước thất bại sau khi đã tạo repo: tiếp tục vào repo đó thay vì tạo lại (luôn lỗi 422)
+            if not request_update and journal.status(request_id) == "failed" and repo_exists(request["repo_name"]):
+                print(f"   - ♻️ [{request_id}] Repo `{request['repo_name']}` còn lại từ lần chạy thất bại trước, chuyển sang chế độ cập nhật.")
+                request_update = True
+            generate_project(request["repo_name"], request["language"], request["model"], request["prompt"], secrets, request.get("stream", stream), request.get("chunked", chunked), request_update)
+        except Exception as e:
+            print(f"❌ [{request_id}] Thất bại: {e}\n{traceback.format_exc()}", file=sys.stderr)
+            return journal.record(request_id, "failed", time.monotonic() - started, e)
+        return journal.record(request_id, "done", time.monotonic() - started)
+
+    # Semaphore giới hạn số request đang chờ để file JSONL được đọc dần thay vì nạp hết vào bộ nhớ
+    slots = threading.BoundedSemaphore(workers * 2)
+    futures = []
+    skipped = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for line_no, request in iter_requests(batch_path):
+            request_id = str(request.get("id") or request.get("repo_name") or f"line-{line_no}")
+            if journal.is_done(request_id):
+                skipped += 1
+                continue
+            slots.acquire()
+            future = executor.submit(run_one, request_id, request)
+            future.add_done_callback(lambda _: slots.release())
+            futures.append(future)
+        results = [future.result() for future in futures]
+
+    failed = [entry for entry in results if entry["status"] == "failed"]
+    print(f"--- [Genesis] 📦 Batch xong: {len(results) - len(failed)} thành công, {len(failed)} thất bại, {skipped} đã xong từ trước ---")
+    return not failed
+
+
 # ==============================================================================
 # III. HÀM THỰC THI CHÍNH
 # ==============================================================================
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="AI Genesis Script")
-    parser.add_argument("--repo-name", required=True)
-    parser.add_argument("--language", required=True)
-    parser.add_argument("--model", required=True)
-    parser.add_argument("--prompt", required=True)
-    parser.add_argument("--keystore-b64", required=False, default="")
-    parser.add_argument("--keystore-pass", required=False, default="")
-    parser.add_argument("--key-alias", required=False, default="")
-    parser.add_argument("--key-pass", required=False, default="")
+    parser.add_argument("--repo-name")
+    parser.add_argument("--language")
+    parser.add_argument("--model")
+    parser.add_argument("--prompt")
+    # Mặc định lấy từ secrets của workflow để không phải truyền mật khẩu qua dòng lệnh
+    parser.add_argument("--keystore-b64", required=False, default=os.environ.get("RELEASE_KEYSTORE_BASE64", ""))
+    parser.add_argument("--keystore-pass", required=False, default=os.environ.get("RELEASE_KEYSTORE_PASSWORD", ""))
+    parser.add_argument("--key-alias", required=False, default=os.environ.get("RELEASE_KEY_ALIAS", ""))
+    parser.add_argument("--key-pass", required=False, default=os.environ.get("RELEASE_KEY_PASSWORD", ""))
+    parser.add_argument("--stream", action="store_true", help="Upload từng file ngay khi AI sinh xong thay vì chờ toàn bộ phản hồi")
+    parser.add_argument("--chunked", action="store_true", help="Lập danh sách file trước rồi sinh từng file song song (cho dự án lớn)")
+    parser.add_argument("--update", action="store_true", help="Sinh lại vào repo đã có: chỉ commit file thay đổi và xóa file không còn")
+    parser.add_argument("--batch", help="File JSONL, mỗi dòng một request {id, repo_name, language, model, prompt}")
+    parser.add_argument("--journal", help="File journal để tiếp tục batch bị dừng (mặc định: <batch>.journal.jsonl)")
+    parser.add_argument("--workers", type=int, default=4, help="Số app được xử lý đồng thời trong chế độ batch")
+    parser.add_argument("--check", "--dry-run", dest="check", action="store_true", help="Chỉ kiểm tra cấu hình và đầu vào rồi thoát")
     args = parser.parse_args()
+    if not args.batch and not all([args.repo_name, args.language, args.model, args.prompt]):
+        parser.error("cần --repo-name, --language, --model và --prompt (hoặc --batch)")
+    if args.check:
+        sys.exit(0 if run_check(args) else 1)
+    load_config()
+    secrets = (args.keystore_b64, args.keystore_pass, args.key_alias, args.key_pass)
 
     try:
-        print(f"✅ Đã nhận yêu cầu cho repo `{args.repo_name}`.")
-        file_tree = call_gemini_for_code(args.prompt, args.language, args.model)
-        
-        if args.language.lower() == 'flutter':
-            file_tree[".github/workflows/build.yml"] = FLUTTER_WORKFLOW_CONTENT
-        
-        flat_file_tree = flatten_file_tree(file_tree)
-        create_and_commit_project(args.repo_name, flat_file_tree)
-
-        if args.keystore_b64 and args.keystore_pass and args.key_alias and args.key_pass:
-            upload_secrets(
-                args.repo_name,
-                args.keystore_b64,
-                args.keystore_pass,
-                args.key_alias,
-                args.key_pass
-            )
+        if args.batch:
+            if not run_batch(args.batch, args.journal or f"{args.batch}.journal.jsonl", max(1, args.workers), secrets, args.stream, args.chunked, args.update):
+                sys.exit(1)
         else:
-            print("--- [Genesis] ℹ️  Bỏ qua bước thêm secrets do không được cung cấp. ---")
-        
-        print(f"🎉 Dự án `{args.repo_name}` đã được tạo thành công!")
+            generate_project(args.repo_name, args.language, args.model, args.prompt, secrets, args.stream, args.chunked, args.update)
         
     except Exception as e:
         print(f"❌ Đã xảy ra lỗi trong genesis.py: {e}\n{traceback.format_exc()}", file=sys.stderr)
         sys.exit(1)
+    finally:
+        gh.metrics.print_summary("Genesis")
+        tracer.write_summary("Genesis")
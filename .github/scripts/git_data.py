@@ -0,0 +1,181 @@
+import os
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from tracing import traced
+
+# ==============================================================================
+# Commit nhiều file bằng Git Data API: một tree, một commit, một lần cập nhật ref
+# ==============================================================================
+# Số luồng upload blob song song và ngưỡng (byte) để gửi file nhỏ trực tiếp trong tree
+BLOB_UPLOAD_WORKERS = int(os.environ.get("BLOB_UPLOAD_WORKERS", "8"))
+INLINE_CONTENT_MAX_BYTES = int(os.environ.get("INLINE_CONTENT_MAX_BYTES", "32768"))
+# Thời gian tối đa (giây) chờ repo mới tạo có branch mặc định
+REPO_READY_TIMEOUT = float(os.environ.get("REPO_READY_TIMEOUT", "60"))
+
+
+@traced("repo.wait_ref")
+def wait_for_ref(gh, repo_full_name, branch="main", timeout=REPO_READY_TIMEOUT, initial_delay=0.25, max_delay=4.0):
+    """Poll ref của branch với backoff lũy thừa; trả về ref ngay khi repo dùng được, TimeoutError nếu quá hạn."""
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    while True:
+        response = gh.get(f"/repos/{repo_full_name}/git/refs/heads/{branch}")
+        if response.status_code == 200 and isinstance(response.json(), dict) and "object" in response.json():
+            return response.json()
+        if response.status_code not in (404, 409):
+            response.raise_for_status()
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"Repo {repo_full_name} chưa có branch `{branch}` sau {timeout:.0f} giây.")
+        time.sleep(min(delay, remaining))
+        delay = min(max_delay, delay * 2)
+
+
+def build_tree_element(gh, repo_full_name, path, content):
+    # File text nhỏ được gửi trực tiếp qua `content` của git/trees, không cần tạo blob
+    if len(content.encode("utf-8")) <= INLINE_CONTENT_MAX_BYTES:
+        return {"path": path, "mode": "100644", "type": "blob", "content": content}
+    # Blob được định danh theo nội dung nên retry khi gặp 5xx là an toàn
+    blob = gh.json("POST", f"/repos/{repo_full_name}/git/blobs", idempotent=True, json={"content": content, "encoding": "utf-8"})
+    return {"path": path, "mode": "100644", "type": "blob", "sha": blob['sha']}
+
+
+class TreeBuilder:
+    """Upload blob nền trong thread pool ngay khi file được thêm vào; elements() giữ đúng thứ tự thêm vào."""
+
+    def __init__(self, gh, repo_full_name, workers=BLOB_UPLOAD_WORKERS):
+        self.gh = gh
+        self.repo_full_name = repo_full_name
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        self.futures = {}
+
+    def add(self, path, content):
+        if not isinstance(content, str):
+            return
+        # Thêm lại cùng một path sẽ thay nội dung nhưng giữ vị trí ban đầu
+        self.futures[path] = self.executor.submit(build_tree_element, self.gh, self.repo_full_name, path, content)
+
+    @traced("git.blob_upload")
+    def elements(self):
+        try:
+            tree_elements = [future.result() for future in self.futures.values()]
+        finally:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+        uploaded = sum(1 for element in tree_elements if "sha" in element)
+        print(f"   - Đã upload {uploaded} blob, gửi trực tiếp {len(tree_elements) - uploaded} file nhỏ.")
+        return tree_elements
+
+
+def build_tree_elements(gh, repo_full_name, file_tree, workers=BLOB_UPLOAD_WORKERS):
+    builder = TreeBuilder(gh, repo_full_name, workers)
+    for path, content in file_tree.items():
+        builder.add(path, content)
+    return builder.elements()
+
+
+@traced("git.commit_tree")
+def commit_tree(gh, repo_full_name, tree_elements, message, author=None, branch="main", branch_ref=None):
+    """Tạo tree + commit từ tree_elements trên nền commit mới nhất của `branch` và cập nhật ref."""
+    ref_path = f"/repos/{repo_full_name}/git/refs/heads/{branch}"
+    branch_ref = branch_ref or gh.json("GET", ref_path)
+    latest_commit_sha = branch_ref['object']['sha']
+    base_tree_sha = gh.json("GET", branch_ref['object']['url'])['tree']['sha']
+
+    new_tree = gh.json("POST", f"/repos/{repo_full_name}/git/trees", idempotent=True, json={"base_tree": base_tree_sha, "tree": tree_elements})
+    commit_data = {"message": message, "parents": [latest_commit_sha], "tree": new_tree['sha']}
+    if author:
+        commit_data["author"] = author
+    new_commit = gh.json("POST", f"/repos/{repo_full_name}/git/commits", idempotent=True, json=commit_data)
+    gh.json("PATCH", ref_path, json={"sha": new_commit['sha']})
+    return new_commit['sha']
+
+
+def commit_files(gh, repo_full_name, file_tree, message, author=None, branch="main", branch_ref=None):
+    """Ghi toàn bộ file_tree (path -> nội dung) lên `branch` trong một commit duy nhất."""
+    tree_elements = build_tree_elements(gh, repo_full_name, file_tree)
+    return commit_tree(gh, repo_full_name, tree_elements, message, author, branch, branch_ref)
+
+
+# Các file nhị phân hoặc quá lớn không được đọc nội dung khi lấy snapshot của repo
+BINARY_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".webp", ".ico", ".jks", ".keystore", ".jar", ".so", ".ttf", ".otf", ".zip", ".apk")
+SNAPSHOT_MAX_FILE_BYTES = int(os.environ.get("SNAPSHOT_MAX_FILE_BYTES", "200000"))
+
+
+# Các path có sẵn trong repo nhưng không do generator tạo ra, không bị xóa khi cập nhật
+UPDATE_KEEP_PATHS = tuple(path.strip() for path in os.environ.get("UPDATE_KEEP_PATHS", "README.md,LICENSE").split(",") if path.strip())
+
+
+def git_blob_sha(content):
+    """SHA của object blob git (giống `git hash-object`), dùng để so sánh với blob đã có trên GitHub."""
+    data = content.encode("utf-8") if isinstance(content, str) else content
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def read_blob_text(gh, repo_full_name, sha):
+    import base64
+    blob = gh.json("GET", f"/repos/{repo_full_name}/git/blobs/{sha}")
+    return base64.b64decode(blob['content']).decode('utf-8')
+
+
+@traced("git.snapshot")
+def fetch_repo_snapshot(gh, repo_full_name, branch="main", workers=BLOB_UPLOAD_WORKERS, paths=None):
+    """Lấy cây file bằng một lời gọi git/trees?recursive=1 rồi đọc song song các blob text.
+
+    Trả về dict: ref, commit_sha, tree_sha, entries (path -> {sha, size, mode}) và files (path -> nội dung).
+    `paths` giới hạn các file được đọc nội dung; mặc định đọc mọi file text không quá lớn.
+    """
+    branch_ref = gh.json("GET", f"/repos/{repo_full_name}/git/refs/heads/{branch}")
+    commit_sha = branch_ref['object']['sha']
+    tree_sha = gh.json("GET", f"/repos/{repo_full_name}/git/commits/{commit_sha}")['tree']['sha']
+    tree = gh.json("GET", f"/repos/{repo_full_name}/git/trees/{tree_sha}", params={"recursive": "1"})
+    if tree.get("truncated"):
+        print("   - ⚠️ Cây file quá lớn, GitHub trả về danh sách bị cắt bớt.")
+    entries = {item['path']: {"sha": item['sha'], "size": item.get('size', 0), "mode": item['mode']}
+               for item in tree['tree'] if item['type'] == 'blob'}
+    wanted = [path for path, entry in entries.items()
+              if (paths is None or path in paths) and entry["size"] <= SNAPSHOT_MAX_FILE_BYTES and not path.lower().endswith(BINARY_EXTENSIONS)]
+
+    def read(path):
+        try:
+            return path, read_blob_text(gh, repo_full_name, entries[path]["sha"])
+        except UnicodeDecodeError:
+            return path, None
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        files = {path: content for path, content in executor.map(read, wanted) if content is not None}
+    return {"ref": branch_ref, "commit_sha": commit_sha, "tree_sha": tree_sha, "entries": entries, "files": files}
+
+
+def diff_against_snapshot(snapshot, files, keep=UPDATE_KEEP_PATHS):
+    """So SHA blob tính cục bộ với cây hiện tại; trả về changes (path -> nội dung mới, None = xóa) cho commit_changes.
+
+    File không đổi không xuất hiện trong changes; file nhị phân và các path trong `keep` không bao giờ bị xóa.
+    """
+    entries = snapshot["entries"]
+    changes = {path: content for path, content in files.items()
+               if isinstance(content, str) and entries.get(path, {}).get("sha") != git_blob_sha(content)}
+    for path in entries:
+        if path not in files and path not in keep and not path.lower().endswith(BINARY_EXTENSIONS):
+            changes[path] = None
+    return changes
+
+
+def commit_changes(gh, repo_full_name, snapshot, changes, message, author=None, branch="main"):
+    """Commit các thay đổi (path -> nội dung mới, None = xóa) lên trên snapshot trong một tree/commit.
+
+    Ref được cập nhật không force: nếu branch đã tiến lên sau khi lấy snapshot, GitHub từ chối thay vì ghi đè.
+    """
+    builder = TreeBuilder(gh, repo_full_name)
+    deletions = []
+    for path, content in changes.items():
+        if content is None:
+            deletions.append({"path": path, "mode": snapshot["entries"].get(path, {}).get("mode", "100644"), "type": "blob", "sha": None})
+        else:
+            builder.add(path, content)
+    tree_elements = builder.elements() + deletions
+    for element in tree_elements:
+        # Giữ nguyên mode (ví dụ file thực thi 100755) của file đã tồn tại
+        element["mode"] = snapshot["entries"].get(element["path"], {}).get("mode", element["mode"])
+    return commit_tree(gh, repo_full_name, tree_elements, message, author, branch, snapshot["ref"])
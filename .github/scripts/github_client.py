@@ -0,0 +1,208 @@
+import time
+import random
+import threading
+
+from tracing import tracer
+
+# ==============================================================================
+# GitHub API client dùng chung cho tất cả các script của factory
+# ==============================================================================
+API_BASE_URL = "https://api.github.com"
+RETRYABLE_STATUS = {500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+
+class ApiMetrics:
+    """Thống kê độ trễ, số lần retry và rate limit của các lời gọi API."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = []
+        self.retries = 0
+        self.cache_hits = 0
+        self.rate_limit = {}
+
+    def record(self, method, path, status, latency):
+        with self._lock:
+            self.calls.append({"method": method, "path": path, "status": status, "latency": latency})
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def record_cache_hit(self):
+        with self._lock:
+            self.cache_hits += 1
+
+    def update_rate_limit(self, headers):
+        if "X-RateLimit-Remaining" not in headers:
+            return
+        with self._lock:
+            self.rate_limit = {
+                "limit": int(headers.get("X-RateLimit-Limit", 0)),
+                "remaining": int(headers["X-RateLimit-Remaining"]),
+                "reset": int(headers.get("X-RateLimit-Reset", 0)),
+                "resource": headers.get("X-RateLimit-Resource", "core"),
+            }
+
+    def summary(self):
+        with self._lock:
+            latencies = sorted(call["latency"] for call in self.calls)
+            return {
+                "calls": len(self.calls),
+                "retries": self.retries,
+                "cache_hits": self.cache_hits,
+                "total_latency": sum(latencies),
+                "p50_latency": latencies[len(latencies) // 2] if latencies else 0.0,
+                "max_latency": latencies[-1] if latencies else 0.0,
+                "rate_limit": dict(self.rate_limit),
+            }
+
+    def print_summary(self, prefix="GitHub API"):
+        s = self.summary()
+        remaining = s["rate_limit"].get("remaining", "?")
+        print(f"--- 📊 [{prefix}] {s['calls']} lời gọi, {s['retries']} retry, {s['cache_hits']} cache hit (304), "
+              f"tổng {s['total_latency']:.2f}s, p50 {s['p50_latency']:.2f}s, rate limit còn {remaining} ---")
+
+
+class GitHubClient:
+    """requests.Session dùng chung: keep-alive, ETag cache, retry có jitter theo Retry-After/X-RateLimit-Reset.
+
+    `requests` và session chỉ được tạo ở lời gọi API đầu tiên để script khởi động nhanh.
+    """
+
+    def __init__(self, token, base_url=API_BASE_URL, max_retries=5, pool_size=16, timeout=60, max_wait=900):
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.max_wait = max_wait
+        self.metrics = ApiMetrics()
+        self._token = token
+        self._pool_size = pool_size
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._etag_cache = {}
+        self._etag_lock = threading.Lock()
+        self._owner_types = {}   # owner -> "User" | "Organization"
+        self._owner_lock = threading.Lock()
+
+    @property
+    def session(self):
+        with self._session_lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                session.headers.update({"Authorization": f"Bearer {self._token}", "Accept": "application/vnd.github.v3+json"})
+                adapter = HTTPAdapter(pool_connections=self._pool_size, pool_maxsize=self._pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._session = session
+            return self._session
+
+    def url(self, path):
+        return path if path.startswith("http") else f"{self.base_url}/{path.lstrip('/')}"
+
+    def _retry_delay(self, response, attempt):
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after:
+                return min(self.max_wait, float(retry_after))
+            if response.headers.get("X-RateLimit-Remaining") == "0" and response.headers.get("X-RateLimit-Reset"):
+                return min(self.max_wait, max(1.0, int(response.headers["X-RateLimit-Reset"]) - time.time() + 1))
+        # Full jitter để các luồng song song không retry cùng lúc
+        return random.uniform(0, min(60, 2 ** attempt))
+
+    @staticmethod
+    def _is_rate_limited(response):
+        if response.status_code == 429:
+            return True
+        if response.status_code != 403:
+            return False
+        return response.headers.get("X-RateLimit-Remaining") == "0" or "rate limit" in response.text.lower()
+
+    def request(self, method, path, idempotent=None, **kwargs):
+        import requests
+        method = method.upper()
+        url = self.url(path)
+        kwargs.setdefault("timeout", self.timeout)
+        idempotent = method in IDEMPOTENT_METHODS if idempotent is None else idempotent
+        cache_key = None
+        if method == "GET" and not kwargs.get("stream"):
+            cache_key = (url, tuple(sorted((kwargs.get("params") or {}).items())))
+            with self._etag_lock:
+                cached = self._etag_cache.get(cache_key)
+            if cached:
+                kwargs["headers"] = {**kwargs.get("headers", {}), "If-None-Match": cached.headers["ETag"]}
+
+        response = None
+        for attempt in range(self.max_retries + 1):
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.metrics.record(method, url, None, time.monotonic() - started)
+                tracer.record_http(method, url, None, time.monotonic() - started)
+                if not idempotent or attempt == self.max_retries:
+                    raise
+                delay = self._retry_delay(None, attempt)
+                print(f"   - ⏳ Lỗi kết nối tới GitHub ({e.__class__.__name__}), thử lại sau {delay:.1f} giây...")
+                self.metrics.record_retry()
+                tracer.record_retry("github", error=e.__class__.__name__, delay=delay)
+                time.sleep(delay)
+                continue
+            latency = time.monotonic() - started
+            self.metrics.record(method, url, response.status_code, latency)
+            self.metrics.update_rate_limit(response.headers)
+            remaining = response.headers.get("X-RateLimit-Remaining")
+            tracer.record_http(method, url, response.status_code, latency, int(remaining) if remaining else None)
+
+            # Rate limit luôn có thể retry vì request chưa được xử lý; 5xx chỉ retry khi idempotent
+            retryable = self._is_rate_limited(response) or (idempotent and response.status_code in RETRYABLE_STATUS)
+            if not retryable or attempt == self.max_retries:
+                break
+            delay = self._retry_delay(response, attempt)
+            print(f"   - ⏳ GitHub API trả về {response.status_code}, thử lại sau {delay:.1f} giây...")
+            self.metrics.record_retry()
+            tracer.record_retry("github", status=response.status_code, delay=delay)
+            time.sleep(delay)
+
+        if cache_key:
+            if response.status_code == 304:
+                self.metrics.record_cache_hit()
+                return cached
+            if response.status_code == 200 and response.headers.get("ETag"):
+                with self._etag_lock:
+                    self._etag_cache[cache_key] = response
+        return response
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request("PUT", path, **kwargs)
+
+    def patch(self, path, **kwargs):
+        return self.request("PATCH", path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request("DELETE", path, **kwargs)
+
+    def json(self, method, path, **kwargs):
+        """Gọi API, raise nếu lỗi và trả về JSON."""
+        response = self.request(method, path, **kwargs)
+        response.raise_for_status()
+        return response.json() if response.content else {}
+
+    def owner_is_org(self, owner):
+        """Loại tài khoản chỉ được hỏi một lần cho mỗi owner trong tiến trình (dùng chung cho tạo repo và secrets)."""
+        with self._owner_lock:
+            owner_type = self._owner_types.get(owner)
+        if owner_type is None:
+            owner_type = self.json("GET", f"/users/{owner}").get("type", "User")
+            with self._owner_lock:
+                self._owner_types[owner] = owner_type
+        return owner_type == "Organization"
@@ -0,0 +1,37 @@
+import re
+
+# ==============================================================================
+# Đọc body của issue tạo từ form (.github/ISSUE_TEMPLATE/app_request.yml): mỗi trường là một mục `### <label>`
+# ==============================================================================
+# label trong form -> tên trường của request (giống các trường của genesis.py --batch)
+APP_REQUEST_FIELDS = {
+    "New Repository Name": "repo_name",
+    "Language or Framework": "language",
+    "Gemini Model": "model",
+    "Detailed Prompt (The Blueprint)": "prompt",
+}
+SECTION_RE = re.compile(r"^###[ \t]+(.+?)[ \t]*$", re.MULTILINE)
+# textarea có `render` được GitHub bọc trong khối code
+FENCE_RE = re.compile(r"\A```[\w.+-]*[ \t]*\n(.*?)\n?```\Z", re.DOTALL)
+EMPTY_VALUE = "_No response_"
+
+
+def parse_issue_form(body):
+    """Trả về dict label -> giá trị (đã bỏ khối code bao ngoài; trường bỏ trống là chuỗi rỗng)."""
+    body = (body or "").replace("\r\n", "\n")
+    matches = list(SECTION_RE.finditer(body))
+    sections = {}
+    for match, following in zip(matches, matches[1:] + [None]):
+        value = body[match.end(): following.start() if following else len(body)].strip()
+        fenced = FENCE_RE.match(value)
+        value = fenced.group(1).strip() if fenced else value
+        sections[match.group(1)] = "" if value == EMPTY_VALUE else value
+    return sections
+
+
+def parse_app_request(body):
+    """Request tạo app từ form, hoặc None nếu body không phải form app_request."""
+    sections = parse_issue_form(body)
+    if not any(label in sections for label in APP_REQUEST_FIELDS):
+        return None
+    return {field: sections.get(label, "") for label, field in APP_REQUEST_FIELDS.items()}
@@ -0,0 +1,202 @@
+import re
+import json
+
+# ==============================================================================
+# Tách object JSON từ phản hồi của model trong một lượt quét (không backtracking) và sửa các lỗi hay gặp
+# ==============================================================================
+# Thân chuỗi gồm cả escape (`\.`) khớp bằng một lần gọi regex, không dừng ở từng `\n` trong code
+STRING_BODY_RE = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*', re.DOTALL)
+CONTROL_RE = re.compile(r"[\x00-\x1f]")
+# Dấu ` không thể nằm ngoài chuỗi trong JSON: gặp ```json ở đó nghĩa là `{` trước đó là của văn xuôi
+TOKEN_RE = re.compile(r'[{}\[\]",:`]')
+FENCE = "```json"
+# Chỉ thử parse vài span lớn nhất để tổng chi phí vẫn tuyến tính theo độ dài phản hồi
+MAX_CANDIDATES = 5
+# Chỉ số trong mỗi frame của stack: [loại ngoặc, vị trí mở, dấu phẩy cuối, vị trí kết thúc giá trị cuối, đang chờ key]
+KIND, OPEN, LAST_COMMA, LAST_VALUE_END, EXPECT_KEY = range(5)
+
+
+class JsonExtractor:
+    """Nhận dần văn bản qua feed(); finish() trả về (object, danh sách các sửa chữa đã áp dụng).
+
+    Khi quét, extractor ghi lại các object `{...}` ở cấp ngoài cùng (tôn trọng chuỗi và escape). Nó cũng ghi
+    vị trí dấu phẩy thừa trước `}`/`]`, ký tự điều khiển thô trong chuỗi, và trạng thái ngoặc nếu phản hồi bị cắt.
+    """
+
+    def __init__(self):
+        self.parts = []
+        self.offset = 0
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.string_is_key = False
+        self.literal_pending = False   # có literal (số, true...) giữa token trước và vị trí hiện tại
+        self.last_token = None
+        self.spans = []                # (start, end, vị trí dấu phẩy thừa, có ký tự điều khiển thô)
+        self.span_start = None
+        self.trailing = []
+        self.control = False
+        self.truncated = False         # object trả về bởi finish() được đóng lại từ phản hồi bị cắt
+        self.dropped = ""              # phần dở dang bị bỏ đi khi đóng object bị cắt
+
+    def _open(self, kind, pos):
+        if self.stack:
+            self.stack[-1][EXPECT_KEY] = False
+        self.stack.append([kind, pos, -1, -1, kind == "{"])
+
+    def feed(self, text):
+        base = self.offset
+        self.parts.append(text)
+        self.offset += len(text)
+        i, n = 0, len(text)
+        while i < n:
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                    i += 1
+                    continue
+                end = STRING_BODY_RE.match(text, i).end()
+                if not self.control and CONTROL_RE.search(text, i, end):
+                    self.control = True
+                if end >= n - 1 and (end == n or text[end] == "\\"):
+                    # Chuỗi chưa đóng trong đoạn này (có thể dừng ngay sau dấu `\`)
+                    self.escape = end == n - 1
+                    break
+                i = end + 1
+                self.in_string = False
+                if self.string_is_key:
+                    self.stack[-1][EXPECT_KEY] = False
+                else:
+                    self.stack[-1][LAST_VALUE_END] = base + i
+                self.last_token, self.literal_pending = '"', False
+                continue
+            if not self.stack:
+                start = text.find("{", i)
+                if start < 0:
+                    break
+                self.span_start, self.trailing, self.control = base + start, [], False
+                self._open("{", base + start)
+                self.last_token, self.literal_pending = "{", False
+                i = start + 1
+                continue
+            match = TOKEN_RE.search(text, i)
+            end = match.start() if match else n
+            if end > i and not self.literal_pending and text[i:end].strip():
+                self.literal_pending = True
+            if not match:
+                break
+            ch, pos, i = match.group(), base + match.start(), match.end()
+            frame = self.stack[-1]
+            if ch == "`":
+                if text.startswith(FENCE, match.start()):
+                    self.stack = []
+                    i = match.start() + len(FENCE)
+                continue
+            if ch == '"':
+                self.in_string = True
+                self.string_is_key = frame[KIND] == "{" and frame[EXPECT_KEY]
+            elif ch in "{[":
+                self._open(ch, pos)
+            elif ch in "}]":
+                if self.last_token == "," and not self.literal_pending:
+                    self.trailing.append(frame[LAST_COMMA])
+                self.stack.pop()
+                if self.stack:
+                    self.stack[-1][LAST_VALUE_END] = pos + 1
+                else:
+                    self.spans.append((self.span_start, pos + 1, self.trailing, self.control))
+            elif ch == ",":
+                frame[LAST_COMMA] = pos
+                frame[EXPECT_KEY] = frame[KIND] == "{"
+            self.last_token, self.literal_pending = ch, False
+        return self
+
+    def _truncated_span(self):
+        """Span chưa đóng: cắt về phần tử hoàn chỉnh cuối cùng của ngoặc trong cùng rồi đóng mọi ngoặc còn mở."""
+        frame = self.stack[-1]
+        if frame[LAST_VALUE_END] > frame[LAST_COMMA]:
+            cut = frame[LAST_VALUE_END]
+        else:
+            cut = frame[LAST_COMMA] if frame[LAST_COMMA] >= 0 else frame[OPEN] + 1
+        closers = "".join("}" if f[KIND] == "{" else "]" for f in reversed(self.stack))
+        return self.span_start, cut, [p for p in self.trailing if p < cut], self.control, closers
+
+    def _candidates(self):
+        candidates = [(start, end, trailing, control, "") for start, end, trailing, control in self.spans]
+        if self.stack:
+            candidates.append(self._truncated_span())
+        return candidates
+
+    def finish(self):
+        text = "".join(self.parts)
+        candidates = self._candidates()
+        # Ưu tiên object ngay sau ```json, sau đó đến các object lớn nhất (object nhỏ thường là `{...}` trong văn xuôi)
+        fence = text.find(FENCE)
+        if any(start < fence < end for start, end, _, _ in self.spans):
+            fence = -1  # ```json nằm trong chuỗi của một object hoàn chỉnh (vd. README), không phải fence bọc phản hồi
+        is_fenced = lambda c: fence >= 0 and c[0] > fence and not text[fence + len(FENCE):c[0]].strip()
+        fenced = next((c for c in candidates if is_fenced(c)), None)
+        if fence >= 0 and fenced is None:
+            # `{` của văn xuôi trước fence (vd. mở một chuỗi nuốt cả fence) đã che object thật: quét lại từ fence
+            rescan = JsonExtractor()
+            rescan.offset = fence + len(FENCE)
+            candidates += rescan.feed(text[rescan.offset:])._candidates()
+            fenced = next((c for c in candidates if is_fenced(c)), None)
+        if not candidates:
+            raise ValueError("Không tìm thấy object JSON nào trong phản hồi.")
+        ordered = sorted(candidates, key=lambda c: c[1] - c[0], reverse=True)
+        if fenced:
+            ordered.remove(fenced)
+            ordered.insert(0, fenced)
+        error = None
+        for start, end, trailing, control, closers in ordered[:MAX_CANDIDATES]:
+            repairs = []
+            pieces, previous = [], start
+            for position in trailing:
+                pieces.append(text[previous:position])
+                previous = position + 1
+            pieces.append(text[previous:end])
+            if trailing:
+                repairs.append(f"bỏ {len(trailing)} dấu phẩy thừa")
+            if control:
+                repairs.append("chấp nhận ký tự xuống dòng/tab chưa escape trong chuỗi")
+            if closers:
+                dropped = "bỏ phần tử dở dang cuối cùng, " if text[end:].strip() else ""
+                repairs.append(f"phản hồi bị cắt cụt: {dropped}đóng {len(closers)} ngoặc")
+            try:
+                value = json.loads("".join(pieces) + closers, strict=False)
+            except ValueError as e:
+                error = e
+                continue
+            self.truncated = bool(closers)
+            self.dropped = text[end:].strip() if closers else ""
+            return value, repairs
+        raise ValueError(f"Không parse được object JSON nào ({error}).")
+
+
+def extract_json(text):
+    """Tách và sửa object JSON trong `text`; trả về (object, danh sách sửa chữa). ValueError nếu không có."""
+    return JsonExtractor().feed(text).finish()
+
+
+def parse_model_json(response_text, label="AI", complete=False):
+    """extract_json cho phản hồi của model: in các sửa chữa đã áp dụng, lỗi kèm một đoạn phản hồi thô.
+
+    Phản hồi không parse được hoặc bị cắt cụt được xóa khỏi cache Gemini để lần chạy lại không dùng lại nó.
+    `complete=True` (cây file): phản hồi bị cắt cụt là lỗi thay vì trả về object thiếu phần cuối.
+    """
+    from gemini_client import forget_response
+    try:
+        extractor = JsonExtractor().feed(response_text)
+        value, repairs = extractor.finish()
+    except ValueError as e:
+        forget_response(response_text)
+        raise ValueError(f"{label} không trả về JSON hợp lệ: {e} Phản hồi thô:\n{response_text[:2000]}")
+    if extractor.truncated:
+        forget_response(response_text)
+        if complete:
+            detail = f"bỏ phần dở dang {extractor.dropped[:200]!r}" if extractor.dropped else "thiếu ngoặc đóng"
+            raise ValueError(f"{label} trả về JSON bị cắt cụt (vượt giới hạn output?): {detail}.")
+    if repairs:
+        print(f"   - 🩹 Đã sửa JSON của {label}: {'; '.join(repairs)}.")
+    return value
@@ -0,0 +1,212 @@
+import re
+
+from json_extract import FENCE
+# ==============================================================================
+# Parser JSON tăng dần cho cây file lồng nhau: trả về từng file ngay khi chuỗi nội dung của nó hoàn tất
+# ==============================================================================
+ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+STRING_SPECIAL_RE = re.compile(r'["\\]')
+WHITESPACE = " \t\r\n"
+
+
+class FileTreeStreamParser:
+    """Nhận dần các đoạn văn bản của model qua feed(); mỗi lần trả về danh sách (path, content) đã hoàn tất.
+
+    Bỏ qua phần văn bản trước object gốc: object ngay sau ```json, hoặc `{` đầu tiên nếu chưa gặp fence. Khi
+    chưa trả về file nào mà gặp lỗi cú pháp, `{` đó được coi là của văn xuôi và parser đồng bộ lại từ sau nó
+    (giống json_extract). Giống json.loads(strict=False), ký tự điều khiển thô bên trong chuỗi được chấp nhận.
+    Giá trị không phải chuỗi/object được bỏ qua.
+    """
+
+    def __init__(self):
+        self.result = None
+        self.done = False
+        self._stack = []          # mỗi phần tử: [container, key đang chờ, path]
+        self._state = "prefix"
+        self._string = []         # các mảnh của chuỗi đang đọc
+        self._string_is_key = False
+        self._escape = None       # None, "" (vừa gặp \) hoặc "uXXX" đang đọc dở
+        self._has_surrogates = False
+        self._literal = []
+        self._replay = []         # văn bản từ `{` gốc đang thử (hoặc phần mở đầu); None khi đã trả về file
+
+    # --- Các hàm trợ giúp cho stack ---------------------------------------------------------
+    def _open(self, container):
+        if self._stack:
+            parent, key, path = self._stack[-1]
+            # Object nằm trong mảng không phải là thư mục của cây file nên không có path
+            child_path = path + (key,) if isinstance(parent, dict) and path is not None else None
+            self._store(container)
+        else:
+            self.result = container
+            child_path = ()
+        self._stack.append([container, None, child_path])
+        self._state = "key_or_end" if isinstance(container, dict) else "value_or_end"
+
+    def _store(self, value):
+        container, key, _ = self._stack[-1]
+        if isinstance(container, dict):
+            container[key] = value
+        else:
+            container.append(value)
+
+    def _close(self):
+        self._stack.pop()
+        if self._stack:
+            self._state = "comma_or_end"
+        else:
+            self.done = True
+            self._state = "done"
+
+    def _finish_value(self, value, emitted):
+        container, key, path = self._stack[-1]
+        self._store(value)
+        if isinstance(container, dict) and path is not None and isinstance(value, str):
+            emitted.append(("/".join(path + (key,)), value))
+        self._state = "comma_or_end"
+
+    def _finish_literal(self, emitted):
+        token = "".join(self._literal).strip()
+        self._literal = []
+        value = {"true": True, "false": False, "null": None}.get(token, token)
+        if isinstance(value, str):
+            try:
+                value = float(token) if any(c in token for c in ".eE") else int(token)
+            except ValueError:
+                raise ValueError(f"Giá trị JSON không hợp lệ: {token[:40]!r}")
+        self._finish_value(value, emitted)
+
+    # --- Đọc chuỗi ---------------------------------------------------------------------------
+    def _read_string(self, text, i, emitted):
+        n = len(text)
+        while i < n:
+            if self._escape is not None:
+                if self._escape == "":
+                    ch = text[i]
+                    i += 1
+                    if ch == "u":
+                        self._escape = "u"
+                        continue
+                    self._string.append(ESCAPES.get(ch, ch))
+                    self._escape = None
+                    continue
+                take = min(5 - len(self._escape), n - i)
+                self._escape += text[i:i + take]
+                i += take
+                if len(self._escape) == 5:
+                    code = int(self._escape[1:], 16)
+                    self._has_surrogates |= 0xD800 <= code <= 0xDFFF
+                    self._string.append(chr(code))
+                    self._escape = None
+                continue
+            match = STRING_SPECIAL_RE.search(text, i)
+            if not match:
+                self._string.append(text[i:])
+                return n
+            self._string.append(text[i:match.start()])
+            i = match.end()
+            if match.group() == "\\":
+                self._escape = ""
+                continue
+            value = "".join(self._string)
+            self._string = []
+            if self._has_surrogates:
+                # Ghép các cặp surrogate \uD83D\uDE00 thành một ký tự như json.loads
+                value = value.encode("utf-16", "surrogatepass").decode("utf-16")
+                self._has_surrogates = False
+            if self._string_is_key:
+                self._stack[-1][1] = value
+                self._state = "colon"
+            else:
+                self._finish_value(value, emitted)
+            return i
+        return i
+
+    @staticmethod
+    def _find_start(text):
+        """Vị trí `{` gốc: ngay sau ```json nếu fence đứng trước `{` đầu tiên; -1 nếu cần chờ thêm văn bản."""
+        fence, brace = text.find(FENCE), text.find("{")
+        if fence >= 0 and (brace < 0 or fence < brace):
+            return text.find("{", fence + len(FENCE))
+        return brace
+
+    def feed(self, text):
+        if self._replay is None:
+            return self._parse(text)
+        self._replay.append(text)
+        while True:
+            if self._state == "prefix":
+                buffered = "".join(self._replay)
+                start = self._find_start(buffered)
+                if start < 0:
+                    self._replay = [buffered]
+                    return []
+                self._replay = [buffered[start:]]
+                self._open({})
+                text = buffered[start + 1:]
+            try:
+                emitted = self._parse(text)
+                if self.done and not emitted:
+                    raise ValueError("object đóng mà không có file nào")
+            except ValueError:
+                # Chưa trả về file nào nên chưa có gì bị upload: `{` vừa thử là của văn xuôi, thử lại từ sau nó
+                replay = "".join(self._replay)[1:]
+                self.__init__()
+                self._replay = [replay]
+                text = ""
+                continue
+            if emitted:
+                self._replay = None
+            return emitted
+
+    def _parse(self, text):
+        emitted = []
+        i, n = 0, len(text)
+        while i < n and not self.done:
+            state = self._state
+            if state == "string":
+                i = self._read_string(text, i, emitted)
+                continue
+            ch = text[i]
+            if state == "literal":
+                if ch in ",}]" or ch in WHITESPACE:
+                    self._finish_literal(emitted)
+                    continue
+                self._literal.append(ch)
+                i += 1
+                continue
+            i += 1
+            if ch in WHITESPACE:
+                continue
+            if state == "key_or_end":
+                if ch == "}":
+                    self._close()
+                elif ch == '"':
+                    self._state, self._string_is_key = "string", True
+                else:
+                    raise ValueError(f"JSON không hợp lệ: mong đợi key nhưng gặp {ch!r}")
+            elif state == "colon":
+                if ch != ":":
+                    raise ValueError(f"JSON không hợp lệ: mong đợi ':' nhưng gặp {ch!r}")
+                self._state = "value"
+            elif state in ("value", "value_or_end"):
+                if ch == "]" and state == "value_or_end":
+                    self._close()
+                elif ch == '"':
+                    self._state, self._string_is_key = "string", False
+                elif ch == "{":
+                    self._open({})
+                elif ch == "[":
+                    self._open([])
+                else:
+                    self._state = "literal"
+                    self._literal = [ch]
+            elif state == "comma_or_end":
+                container = self._stack[-1][0]
+                if ch == ",":
+                    self._state = "key_or_end" if isinstance(container, dict) else "value"
+                elif ch in "}]":
+                    self._close()
+                else:
+                    raise ValueError(f"JSON không hợp lệ: mong đợi ',' nhưng gặp {ch!r}")
+        return emitted
@@ -0,0 +1,153 @@
+import os
+import re
+from collections import deque
+
+from ci_logs import iter_member_lines, open_run_logs, pick_log_member, tail_member
+from rate_limit import estimate_tokens
+from tracing import traced
+
+# ==============================================================================
+# Rút gọn log CI: chỉ giữ các đoạn quanh lỗi thật sự, trong giới hạn token cho prompt
+# ==============================================================================
+LOG_TOKEN_BUDGET = int(os.environ.get("LOG_TOKEN_BUDGET", "6000"))
+CONTEXT_BEFORE = 5
+CONTEXT_AFTER = 15
+MAX_BLOCK_LINES = 200
+
+# Dấu thời gian GitHub Actions thêm vào đầu mỗi dòng, bỏ đi để tiết kiệm token
+TIMESTAMP_RE = re.compile(r"^\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(\.\d+)?Z ")
+# (mức độ ưu tiên, pattern): số càng lớn càng gần nguyên nhân gốc
+ERROR_SIGNATURES = [
+    (5, re.compile(r"\.dart:\d+:\d+: Error:")),
+    (5, re.compile(r"^e: (file://)?\S+\.kts?:\d+:\d+")),
+    (5, re.compile(r"^Traceback \(most recent call last\):")),
+    (4, re.compile(r"^\S+\.(kt|java|dart|py|xml|gradle|kts):\d+(:\d+)?:? ([Ee]rror|[Ww]arning: \[?error)")),
+    (4, re.compile(r"^(\w+\.)*\w+(Error|Exception)(: |$)")),
+    (4, re.compile(r"^\* What went wrong:")),
+    (3, re.compile(r"^FAILURE: ")),
+    (3, re.compile(r"^> Task \S+ FAILED")),
+    (3, re.compile(r"Target \S+ failed")),
+    (2, re.compile(r"##\[error\]")),
+    (2, re.compile(r"\berror:", re.IGNORECASE)),
+]
+# Các dòng stack frame: chỉ giữ lần xuất hiện đầu tiên trên toàn bộ log
+STACK_FRAME_RE = re.compile(r'^\s*(at \S+\(.*\)|#\d+\s+\S+|File ".+", line \d+|\.\.\. \d+ more)')
+NUMBER_RE = re.compile(r"\d+")
+
+
+def strip_timestamp(line):
+    return TIMESTAMP_RE.sub("", line, count=1)
+
+
+def error_priority(line):
+    stripped = line.strip()
+    return next((priority for priority, pattern in ERROR_SIGNATURES if pattern.search(stripped)), 0)
+
+
+def signature_key(line):
+    """Chuẩn hóa dòng lỗi để nhận ra cùng một lỗi lặp lại ở nhiều file log."""
+    return NUMBER_RE.sub("N", line.strip())
+
+
+def find_error_blocks(lines, before=CONTEXT_BEFORE, after=CONTEXT_AFTER):
+    """Quét log một lượt; trả về các block (priority, first_line_no, hit_line, lines) quanh mỗi lỗi."""
+    history = deque(maxlen=before)
+    blocks = []
+    current = None
+    remaining_after = 0
+    for line_no, raw in enumerate(lines):
+        line = strip_timestamp(raw)
+        priority = error_priority(line)
+        if priority:
+            if current is None:
+                current = {"priority": priority, "start": line_no - len(history), "hit": line, "lines": list(history)}
+            elif priority > current["priority"]:
+                current["priority"], current["hit"] = priority, line
+            remaining_after = after
+        if current is not None:
+            current["lines"].append(line)
+            if not priority:
+                remaining_after -= 1
+            if remaining_after <= 0 or len(current["lines"]) >= MAX_BLOCK_LINES:
+                blocks.append(current)
+                current = None
+                history.clear()
+        else:
+            history.append(line)
+    if current is not None:
+        blocks.append(current)
+    return blocks
+
+
+def compact_block(lines, seen_frames):
+    """Bỏ stack frame đã gặp và gộp các dòng trùng liên tiếp."""
+    result = []
+    skipped = 0
+    for line in lines:
+        if STACK_FRAME_RE.match(line):
+            key = line.strip()
+            if key in seen_frames:
+                skipped += 1
+                continue
+            seen_frames.add(key)
+        if result and result[-1] == line:
+            continue
+        if skipped:
+            result.append(f"    ... ({skipped} stack frame trùng lặp đã lược bỏ)")
+            skipped = 0
+        result.append(line)
+    if skipped:
+        result.append(f"    ... ({skipped} stack frame trùng lặp đã lược bỏ)")
+    return result
+
+
+def condense_archive(archive, token_budget=LOG_TOKEN_BUDGET):
+    """Quét tất cả file log trong archive, trả về đoạn log tập trung vào lỗi hoặc None nếu không tìm thấy lỗi nào."""
+    candidates = []
+    seen_signatures = set()
+    for member in archive.namelist():
+        if member.endswith("/"):
+            continue
+        for block in find_error_blocks(iter_member_lines(archive, member)):
+            key = signature_key(block["hit"])
+            if key in seen_signatures:
+                continue
+            seen_signatures.add(key)
+            block["member"] = member
+            candidates.append(block)
+    if not candidates:
+        return None
+
+    # Ưu tiên lỗi nghiêm trọng nhất; cùng mức thì lỗi xuất hiện sau (gần thời điểm fail) trước
+    candidates.sort(key=lambda b: (-b["priority"], -b["start"]))
+    seen_frames = set()
+    selected = []
+    used = 0
+    for block in candidates:
+        text = "\n".join(compact_block(block["lines"], seen_frames))
+        cost = estimate_tokens(text)
+        if used + cost > token_budget:
+            if selected:
+                continue
+            text = text[: token_budget * 4]
+            cost = token_budget
+        selected.append((block["member"], block["start"], text))
+        used += cost
+
+    # Trình bày lại theo thứ tự xuất hiện trong log để model đọc tự nhiên
+    selected.sort(key=lambda item: (item[0], item[1]))
+    return "\n\n".join(f"=== {member} (dòng {start + 1}) ===\n{text}" for member, start, text in selected)
+
+
+def condense_or_tail(archive, name_hint, fallback_lines, token_budget=LOG_TOKEN_BUDGET):
+    condensed = condense_archive(archive, token_budget)
+    if condensed:
+        return condensed
+    print("   - Không tìm thấy dấu hiệu lỗi rõ ràng, dùng các dòng cuối của log.")
+    return tail_member(archive, pick_log_member(archive, name_hint), fallback_lines)
+
+
+@traced("ci.fetch_log")
+def fetch_condensed_log(gh, repo_full_name, run_id, name_hint, fallback_lines):
+    with open_run_logs(gh, repo_full_name, run_id) as archive:
+        return condense_or_tail(archive, name_hint, fallback_lines)
@@ -0,0 +1,199 @@
+import os
+import json
+import time
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+
+from gemini_client import CACHE_DIR, cached_text, generate_text
+from rate_limit import estimate_tokens, get_limiter, is_rate_limit_error
+from tracing import percentile, tracer
+
+# ==============================================================================
+# Chọn model theo loại tác vụ, kích thước prompt và độ trễ đã đo; hedge sau mốc p95 đo được, fallback khi timeout/5xx
+# ==============================================================================
+# Thứ tự ưu tiên (chất lượng) cho từng loại tác vụ; model người dùng chọn luôn được xếp đầu
+TASK_MODELS = {
+    "generate": ("gemini-1.5-flash-latest", "gemini-1.5-pro-latest"),
+    "plan": ("gemini-1.5-flash-latest", "gemini-1.5-pro-latest"),
+    "file": ("gemini-1.5-flash-latest", "gemini-1.5-pro-latest"),
+    "repair": ("gemini-1.5-flash-latest", "gemini-1.5-pro-latest"),
+    "debug": ("gemini-1.5-pro-latest", "gemini-1.5-flash-latest"),
+}
+# Thống kê nằm cạnh cache phản hồi để được giữ lại giữa các lần chạy bằng cùng bước actions/cache
+MODEL_STATS_FILE = os.environ.get("MODEL_STATS_FILE", str(CACHE_DIR / "model_stats.json"))
+MODEL_HEDGING = os.environ.get("MODEL_HEDGING", "1") != "0"
+# Giới hạn dưới của mốc hedge để không gửi trùng các lời gọi vốn nhanh
+HEDGE_MIN_DELAY = 5.0
+# Số lời gọi hedge chạy đồng thời tối đa trong tiến trình (lời gọi thua không hủy được nên vẫn tốn token)
+MAX_CONCURRENT_HEDGES = int(os.environ.get("MODEL_MAX_HEDGES", "2"))
+hedge_slots = threading.BoundedSemaphore(max(1, MAX_CONCURRENT_HEDGES))
+MIN_SAMPLES = 5
+WINDOW = 50
+# Model có p50 gần đây vượt ngưỡng này (giây) hoặc vừa lỗi liên tiếp bị xếp xuống cuối
+MODEL_SLOW_SECONDS = float(os.environ.get("MODEL_SLOW_SECONDS", "120"))
+FAILURE_COOLDOWN = 300.0
+FAILURES_BEFORE_COOLDOWN = 2
+RETRYABLE_ERRORS = ("DeadlineExceeded", "ServiceUnavailable", "InternalServerError", "GatewayTimeout", "TimeoutError", "ReadTimeout", "ConnectionError")
+RETRYABLE_MARKERS = (" 500", " 502", " 503", " 504", "timed out", "Deadline Exceeded")
+
+
+def is_retryable_model_error(error):
+    """Lỗi tạm thời phía model (timeout, 5xx, hết quota) thì thử model khác; lỗi do prompt/SDK thì không."""
+    text = f" {error}"
+    return error.__class__.__name__ in RETRYABLE_ERRORS or is_rate_limit_error(error) or any(marker in text for marker in RETRYABLE_MARKERS)
+
+
+class ModelStats:
+    """Độ trễ gần nhất theo (model, tác vụ) và chuỗi lỗi liên tiếp theo model; lưu xuống file JSON."""
+
+    def __init__(self, path=MODEL_STATS_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self._data = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError, TypeError):
+                self._data = {}
+            self._data.setdefault("latency", {})
+            self._data.setdefault("failures", {})
+        return self._data
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.data, f)
+        os.replace(tmp, self.path)
+
+    def latencies(self, model_name, task):
+        with self.lock:
+            return list(self.data["latency"].get(f"{model_name}|{task}", []))
+
+    def record_success(self, model_name, task, latency):
+        with self.lock:
+            samples = self.data["latency"].setdefault(f"{model_name}|{task}", [])
+            samples.append(round(latency, 3))
+            del samples[:-WINDOW]
+            self.data["failures"].pop(model_name, None)
+            self.save()
+
+    def record_failure(self, model_name):
+        with self.lock:
+            streak = self.data["failures"].get(model_name, {"count": 0})
+            self.data["failures"][model_name] = {"count": streak["count"] + 1, "at": time.time()}
+            self.save()
+
+    def cooling_down(self, model_name):
+        with self.lock:
+            streak = self.data["failures"].get(model_name)
+        return bool(streak and streak["count"] >= FAILURES_BEFORE_COOLDOWN and time.time() - streak["at"] < FAILURE_COOLDOWN)
+
+    def slow(self, model_name, task):
+        samples = self.latencies(model_name, task)[-10:]
+        return len(samples) >= MIN_SAMPLES and percentile(samples, 0.5) > MODEL_SLOW_SECONDS
+
+    def hedge_delay(self, model_name, task, timeout=None):
+        """Mốc p95 đã đo để hedge, hoặc None khi chưa đủ mẫu (không hedge theo mốc đoán)."""
+        samples = self.latencies(model_name, task)
+        if len(samples) < MIN_SAMPLES:
+            return None
+        delay = max(HEDGE_MIN_DELAY, percentile(samples, 0.95))
+        return min(delay, timeout / 2) if timeout else delay
+
+
+model_stats = ModelStats()
+
+
+def candidate_models(task, prompt, preferred=None):
+    """Danh sách model theo thứ tự thử; model người dùng chọn luôn đứng đầu, dù chậm hay vượt TPM.
+
+    Các model dự phòng còn lại bỏ model có TPM nhỏ hơn prompt và đẩy model đang lỗi/quá chậm xuống cuối.
+    """
+    others = [m for m in dict.fromkeys(TASK_MODELS.get(task, TASK_MODELS["generate"])) if m != preferred]
+    tokens = estimate_tokens(prompt)
+    others = [m for m in others if get_limiter(m).tokens.capacity >= tokens] or ([] if preferred else others)
+    others.sort(key=lambda m: model_stats.cooling_down(m) or model_stats.slow(m, task))
+    return [preferred, *others] if preferred else others
+
+
+def launch(model_name, task, prompt, timeout, generation_config, on_done=None):
+    """Gọi model trong thread daemon (lời gọi bị bỏ dở không giữ tiến trình lại khi thoát); trả về Future."""
+    future = Future()
+
+    def run():
+        started = time.monotonic()
+        try:
+            text = generate_text(model_name, prompt, timeout=timeout, generation_config=generation_config)
+        except BaseException as e:
+            if is_retryable_model_error(e):
+                model_stats.record_failure(model_name)
+            future.set_exception(e)
+        else:
+            model_stats.record_success(model_name, task, time.monotonic() - started)
+            future.set_result(text)
+        finally:
+            if on_done:
+                on_done()
+
+    threading.Thread(target=run, name=f"model-{model_name}", daemon=True).start()
+    return future
+
+
+def generate(task, prompt, timeout=None, preferred=None, generation_config=None):
+    """Như generate_text nhưng tự chọn model; gửi thêm model dự phòng khi quá mốc p95 và lấy kết quả về trước.
+
+    Không hedge khi người dùng đã chọn model (`preferred`) hoặc khi chưa đủ mẫu độ trễ; model khác chỉ được
+    dùng khi model đầu tiên lỗi tạm thời.
+    """
+    candidates = candidate_models(task, prompt, preferred)
+    # Model người dùng chọn: không trả về phản hồi cache của model dự phòng (vd. flash được cache khi pro lỗi trước đó)
+    for model_name in candidates[:1] if preferred else candidates:
+        cached = cached_text(model_name, prompt, generation_config)
+        if cached is not None:
+            return cached
+    queue = list(candidates)
+    pending = {}
+    errors = []
+
+    def start(model_name, reason, on_done=None):
+        tracer.emit({"type": "model_route", "task": task, "model": model_name, "reason": reason})
+        pending[launch(model_name, task, prompt, timeout, generation_config, on_done)] = model_name
+
+    primary = queue.pop(0)
+    start(primary, "primary")
+    hedge_delay = model_stats.hedge_delay(primary, task, timeout) if MODEL_HEDGING and not preferred else None
+    hedge_at = time.monotonic() + hedge_delay if hedge_delay is not None else None
+    while pending:
+        hedge_wait = hedge_at - time.monotonic() if hedge_at is not None and queue and len(pending) == 1 else None
+        done, _ = wait(list(pending), timeout=max(0.0, hedge_wait) if hedge_wait is not None else None, return_when=FIRST_COMPLETED)
+        if not done:
+            hedge_at = None  # Mỗi lời gọi hedge tối đa một lần
+            if not hedge_slots.acquire(blocking=False):
+                print(f"   - 🐢 {primary} chưa trả lời sau {hedge_delay:.1f}s nhưng đã đủ {MAX_CONCURRENT_HEDGES} lời gọi hedge đang chạy, tiếp tục chờ.")
+                continue
+            print(f"   - 🐢 {primary} chưa trả lời sau {hedge_delay:.1f}s (mốc p95), gửi song song cho {queue[0]}.")
+            start(queue.pop(0), "hedge", hedge_slots.release)
+            continue
+        for future in done:
+            model_name = pending.pop(future)
+            error = future.exception()
+            if error is None:
+                if model_name != primary:
+                    print(f"   - ✅ Dùng kết quả của {model_name}.")
+                return future.result()
+            errors.append(error)
+            if not is_retryable_model_error(error):
+                if not pending:
+                    raise error
+                continue
+            print(f"   - ⚠️ {model_name} lỗi ({error.__class__.__name__}: {str(error)[:120]}).")
+            if queue and not pending:
+                start(queue.pop(0), "fallback")
+    raise errors[-1]
@@ -0,0 +1,145 @@
+import re
+
+# ==============================================================================
+# Áp dụng unified diff do model trả về lên nội dung file trong bộ nhớ (có fuzz như `patch -F`)
+# ==============================================================================
+HUNK_HEADER_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+MAX_FUZZ = 2
+MAX_OFFSET = 200
+
+
+class PatchError(Exception):
+    pass
+
+
+def _strip_prefix(path):
+    path = path.split("\t")[0].strip()
+    if path == "/dev/null":
+        return None
+    return path[2:] if path[:2] in ("a/", "b/") else path
+
+
+def parse_unified_diff(diff_text):
+    """Tách diff thành danh sách {old_path, new_path, hunks}; mỗi hunk là (old_start, [(tag, text)])."""
+    patches = []
+    current = None
+    hunk = None
+    counted = {}              # id(body) -> số dòng đầu của hunk thuộc phạm vi header @@
+    old_left = new_left = 0   # số dòng cũ/mới header @@ còn chờ
+    lines = diff_text.replace("\r\n", "\n").split("\n")
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if hunk is not None and (old_left > 0 or new_left > 0):
+            # Còn dòng theo header @@: dòng bị xóa có nội dung `-- ...` (thành `--- `) không phải header file mới
+            if line.startswith("\\ No newline"):
+                i += 1
+                continue
+            tag = line[:1] if line[:1] in (" ", "-", "+") else " " if line == "" else None
+            # Trừ khi ngay sau là `+++ ` rồi `@@`: trong hunk đếm đúng không thể có dòng `@@` trần, nên header @@ đếm dư
+            new_file = i + 2 < len(lines) and line.startswith("--- ") and lines[i + 1].startswith("+++ ") and HUNK_HEADER_RE.match(lines[i + 2])
+            if tag is not None and not new_file:
+                hunk[1].append((tag, line[1:]))
+                old_left -= tag != "+"
+                new_left -= tag != "-"
+                counted[id(hunk[1])] = len(hunk[1])
+                i += 1
+                continue
+            old_left = new_left = 0  # Số dòng trong header sai: quay lại cách nhận dạng thông thường
+        if line.startswith("--- ") and i + 1 < len(lines) and lines[i + 1].startswith("+++ "):
+            current = {"old_path": _strip_prefix(line[4:]), "new_path": _strip_prefix(lines[i + 1][4:]), "hunks": []}
+            patches.append(current)
+            hunk = None
+            i += 2
+            continue
+        match = HUNK_HEADER_RE.match(line)
+        if match and current is not None:
+            hunk = (int(match.group(1)), [])
+            current["hunks"].append(hunk)
+            old_left = int(match.group(2)) if match.group(2) is not None else 1
+            new_left = int(match.group(4)) if match.group(4) is not None else 1
+        elif hunk is not None and line[:1] in (" ", "-", "+"):
+            hunk[1].append((line[0], line[1:]))
+        elif hunk is not None and line == "":
+            # Model hay bỏ mất dấu cách đầu dòng của dòng context trống
+            hunk[1].append((" ", ""))
+        elif line.startswith("\\ No newline"):
+            pass
+        i += 1
+    for patch in patches:
+        # Dòng trống thừa ở cuối hunk (do split) không phải là context thật, trừ khi header @@ tính cả nó
+        for _, body in patch["hunks"]:
+            while len(body) > counted.get(id(body), 0) and body[-1] == (" ", ""):
+                body.pop()
+    if not patches:
+        raise PatchError("Không tìm thấy file nào trong diff (thiếu dòng ---/+++).")
+    return patches
+
+
+def _find(lines, needle, expected, normalize):
+    """Tìm vị trí của `needle` trong `lines`, ưu tiên gần vị trí mong đợi nhất."""
+    if not needle:
+        return min(max(expected, 0), len(lines))
+    key = [normalize(line) for line in needle]
+    last = len(lines) - len(needle)
+    for offset in range(0, max(MAX_OFFSET, len(lines)) + 1):
+        for start in ((expected - offset, expected + offset) if offset else (expected,)):
+            if 0 <= start <= last and all(normalize(lines[start + k]) == key[k] for k in range(len(key))):
+                return start
+    return None
+
+
+def apply_hunks(original, hunks, path="<file>"):
+    lines = original.split("\n") if original else []
+    trailing_newline = original.endswith("\n") or not original
+    if original.endswith("\n"):
+        lines.pop()
+    shift = 0
+    for hunk_no, (old_start, body) in enumerate(hunks, 1):
+        old = [text for tag, text in body if tag != "+"]
+        new = [text for tag, text in body if tag != "-"]
+        expected = max(old_start - 1, 0) + shift
+        position = None
+        # Thử khớp chính xác, sau đó bỏ qua khoảng trắng cuối dòng, rồi giảm dần context ở hai đầu (fuzz)
+        for fuzz in range(MAX_FUZZ + 1):
+            lead = min(fuzz, next((k for k, (tag, _) in enumerate(body) if tag != " "), 0))
+            tail = min(fuzz, next((k for k, (tag, _) in enumerate(reversed(body)) if tag != " "), 0))
+            trimmed_old = old[lead:len(old) - tail]
+            trimmed_new = new[lead:len(new) - tail]
+            for normalize in (lambda s: s, lambda s: s.rstrip()):
+                position = _find(lines, trimmed_old, expected + lead, normalize)
+                if position is not None:
+                    break
+            if position is not None:
+                break
+        if position is None:
+            raise PatchError(f"Hunk {hunk_no} của `{path}` không khớp với nội dung hiện tại.")
+        lines[position:position + len(trimmed_old)] = trimmed_new
+        shift = position - lead - (old_start - 1) + len(new) - len(old)
+    return "\n".join(lines) + ("\n" if trailing_newline else "")
+
+
+def apply_unified_diff(diff_text, files):
+    """Áp dụng diff lên `files` (path -> nội dung). Trả về dict thay đổi: path -> nội dung mới (None = xóa file)."""
+    changes = {}
+    for patch in parse_unified_diff(diff_text):
+        old_path, new_path = patch["old_path"], patch["new_path"]
+        if new_path is None:
+            if old_path not in files:
+                raise PatchError(f"Không thể xóa `{old_path}`: file không tồn tại.")
+            changes[old_path] = None
+            continue
+        if old_path is None:
+            if not patch["hunks"]:
+                raise PatchError(f"File mới `{new_path}` không có nội dung.")
+            changes[new_path] = apply_hunks("", patch["hunks"], new_path)
+            continue
+        source = changes.get(old_path, files.get(old_path))
+        if source is None:
+            raise PatchError(f"Không tìm thấy file `{old_path}` trong repo.")
+        updated = apply_hunks(source, patch["hunks"], old_path)
+        if old_path != new_path:
+            changes[old_path] = None
+        changes[new_path] = updated
+    # Bỏ các file thực tế không thay đổi để commit chỉ chứa thay đổi thật
+    return {path: content for path, content in changes.items() if content is None or content != files.get(path)}
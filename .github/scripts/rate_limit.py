@@ -0,0 +1,122 @@
+import os
+import time
+import random
+import threading
+
+from tracing import tracer
+
+# ==============================================================================
+# Giới hạn tốc độ gọi Gemini: token bucket theo RPM/TPM + backoff thích ứng khi gặp 429
+# ==============================================================================
+# (requests/phút, tokens/phút) mặc định cho từng model, có thể ghi đè bằng GEMINI_RPM / GEMINI_TPM
+MODEL_QUOTAS = {
+    "gemini-1.5-flash": (15, 1_000_000),
+    "gemini-1.5-flash-latest": (15, 1_000_000),
+    "gemini-1.5-pro": (2, 32_000),
+    "gemini-1.5-pro-latest": (2, 32_000),
+}
+DEFAULT_QUOTA = (15, 1_000_000)
+MAX_RATE_LIMIT_RETRIES = 6
+
+
+def estimate_tokens(text):
+    # Ước lượng thô ~4 ký tự/token, đủ để điều tiết mà không cần gọi count_tokens
+    return len(text) // 4 + 1
+
+
+def is_rate_limit_error(error):
+    return error.__class__.__name__ in ("ResourceExhausted", "TooManyRequests") or "429" in str(error)
+
+
+class TokenBucket:
+    """Bucket nạp lại liên tục `rate` đơn vị/giây, tối đa `capacity`."""
+
+    def __init__(self, capacity, rate):
+        self.capacity = float(capacity)
+        self.rate = float(rate)
+        self.level = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount):
+        """Trừ `amount` và trả về số giây cần chờ trước khi được dùng."""
+        amount = min(float(amount), self.capacity)
+        with self.lock:
+            self._refill()
+            self.level -= amount
+            return 0.0 if self.level >= 0 else -self.level / self.rate
+
+    def charge(self, amount):
+        """Trừ thêm phần đã dùng thực tế (ví dụ token output) sau khi gọi xong."""
+        with self.lock:
+            self._refill()
+            self.level -= float(amount)
+
+
+class GeminiRateLimiter:
+    """Điều tiết theo cả RPM và TPM; khi gặp 429 thì tạm dừng toàn bộ các luồng với backoff tăng dần."""
+
+    def __init__(self, rpm, tpm):
+        self.requests = TokenBucket(rpm, rpm / 60.0)
+        self.tokens = TokenBucket(tpm, tpm / 60.0)
+        self.lock = threading.Lock()
+        self.backoff = 0.0
+        self.paused_until = 0.0
+
+    def acquire(self, tokens):
+        wait = max(self.requests.reserve(1), self.tokens.reserve(tokens))
+        with self.lock:
+            wait = max(wait, self.paused_until - time.monotonic())
+        if wait > 0:
+            time.sleep(wait)
+
+    def on_success(self, output_tokens=0):
+        if output_tokens:
+            self.tokens.charge(output_tokens)
+        with self.lock:
+            self.backoff = self.backoff / 2 if self.backoff > 1 else 0.0
+
+    def on_rate_limited(self):
+        with self.lock:
+            self.backoff = min(120.0, max(2.0, self.backoff * 2))
+            delay = self.backoff + random.uniform(0, self.backoff / 2)
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+            return delay
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(model_name):
+    with _limiters_lock:
+        if model_name not in _limiters:
+            rpm, tpm = MODEL_QUOTAS.get(model_name, DEFAULT_QUOTA)
+            rpm = int(os.environ.get("GEMINI_RPM", rpm))
+            tpm = int(os.environ.get("GEMINI_TPM", tpm))
+            _limiters[model_name] = GeminiRateLimiter(rpm, tpm)
+        return _limiters[model_name]
+
+
+def call_with_rate_limit(model_name, prompt_text, call):
+    """Gọi `call()` dưới sự điều tiết của limiter của model, retry khi bị 429."""
+    limiter = get_limiter(model_name)
+    for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+        limiter.acquire(estimate_tokens(prompt_text))
+        try:
+            response = call()
+        except Exception as e:
+            if not is_rate_limit_error(e) or attempt == MAX_RATE_LIMIT_RETRIES:
+                raise
+            delay = limiter.on_rate_limited()
+            print(f"   - ⏳ Gemini ({model_name}) báo vượt quota, tạm dừng {delay:.1f} giây...")
+            tracer.record_retry("gemini", model=model_name, delay=delay)
+            continue
+        usage = getattr(response, "usage_metadata", None)
+        limiter.on_success(getattr(usage, "candidates_token_count", 0) or 0)
+        return response
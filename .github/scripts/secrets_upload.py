@@ -0,0 +1,121 @@
+import os
+import time
+import base64
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from tracing import traced
+
+# ==============================================================================
+# Mã hóa và upload GitHub Actions secrets song song, cache public key, dùng secret cấp org khi có thể
+# ==============================================================================
+PUBLIC_KEY_TTL = int(os.environ.get("PUBLIC_KEY_TTL", "3600"))
+SECRET_UPLOAD_WORKERS = int(os.environ.get("SECRET_UPLOAD_WORKERS", "4"))
+
+
+class SecretUploader:
+    """Dùng chung trong một tiến trình (kể cả batch) để public key và SealedBox chỉ được lấy/tạo một lần."""
+
+    def __init__(self, gh, workers=SECRET_UPLOAD_WORKERS, key_ttl=PUBLIC_KEY_TTL):
+        from nacl import encoding, public  # pynacl chỉ cần khi thật sự upload secrets
+        self._encoding, self._public = encoding, public
+        self.gh = gh
+        self.workers = max(1, workers)
+        self.key_ttl = key_ttl
+        self.lock = threading.Lock()
+        self._keys = {}          # scope -> (thời điểm lấy, key_data)
+        self._boxes = {}         # key_id -> SealedBox
+        self._org_secrets = {}   # (org, tên secret) -> (giá trị, visibility) đã upload thành công trong tiến trình
+        self._org_locks = {}     # (org, tên secret) -> lock; thread khác chờ lần upload đầu tiên xong
+
+    def public_key(self, scope):
+        """scope: `repos/<owner>/<repo>` hoặc `orgs/<org>`."""
+        with self.lock:
+            cached = self._keys.get(scope)
+            if cached and time.monotonic() - cached[0] < self.key_ttl:
+                return cached[1]
+        key_data = self.gh.json("GET", f"/{scope}/actions/secrets/public-key")
+        with self.lock:
+            self._keys[scope] = (time.monotonic(), key_data)
+        return key_data
+
+    def encrypt(self, key_data, value):
+        with self.lock:
+            box = self._boxes.get(key_data['key_id'])
+            if box is None:
+                box = self._public.SealedBox(self._public.PublicKey(key_data['key'], self._encoding.Base64Encoder()))
+                self._boxes[key_data['key_id']] = box
+        return base64.b64encode(box.encrypt(value.encode("utf-8"))).decode("utf-8")
+
+    def _put_all(self, calls):
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return [future.result() for future in [executor.submit(call) for call in calls]]
+
+    def upload_repo_secrets(self, repo_full_name, secrets):
+        key_data = self.public_key(f"repos/{repo_full_name}")
+        self._put_all([
+            lambda name=name, value=value: self.gh.json("PUT", f"/repos/{repo_full_name}/actions/secrets/{name}",
+                                                        json={"encrypted_value": self.encrypt(key_data, value), "key_id": key_data['key_id']})
+            for name, value in secrets.items()
+        ])
+
+    def org_secret_access(self, org, name):
+        """(visibility, id các repo được cấp quyền) của secret org; (None, []) nếu secret chưa tồn tại."""
+        response = self.gh.get(f"/orgs/{org}/actions/secrets/{name}")
+        if response.status_code == 404:
+            return None, []
+        response.raise_for_status()
+        visibility = response.json().get("visibility")
+        if visibility != "selected":
+            return visibility, []
+        repo_ids, page = [], 1
+        while True:
+            repositories = self.gh.json("GET", f"/orgs/{org}/actions/secrets/{name}/repositories", params={"per_page": 100, "page": page}).get("repositories", [])
+            repo_ids += [repo["id"] for repo in repositories]
+            if len(repositories) < 100:
+                return visibility, repo_ids
+            page += 1
+
+    def upload_org_secret(self, org, name, value, repo_id):
+        """Ghi secret org (lần đầu trong tiến trình) và cấp quyền cho repo; False nếu secret org không tới được repo này.
+
+        Lần đầu giữ visibility và danh sách repo đã có (thêm repo này vào); sau đó chỉ cấp quyền cho repo khi
+        visibility là `selected` (`all` đã gồm mọi repo, endpoint cấp quyền trả về 409 với visibility khác).
+        """
+        with self.lock:
+            secret_lock = self._org_locks.setdefault((org, name), threading.Lock())
+        with secret_lock:
+            uploaded = self._org_secrets.get((org, name))
+            if uploaded is None or uploaded[0] != value:
+                visibility, repo_ids = self.org_secret_access(org, name)
+                # `private` chỉ cấp cho repo private/internal, không tới được repo public genesis tạo ra:
+                # không ghi đè secret đang dùng của các repo đó, upload secret cấp repo thay thế
+                if visibility != "private":
+                    key_data = self.public_key(f"orgs/{org}")
+                    body = {"encrypted_value": self.encrypt(key_data, value), "key_id": key_data['key_id'], "visibility": visibility or "selected"}
+                    # Ghi lại toàn bộ danh sách: PUT secret thay thế selected_repository_ids, bỏ repo cũ sẽ thu hồi quyền của chúng
+                    if body["visibility"] == "selected":
+                        body["selected_repository_ids"] = sorted({*repo_ids, repo_id})
+                    self.gh.json("PUT", f"/orgs/{org}/actions/secrets/{name}", json=body)
+                self._org_secrets[(org, name)] = (value, visibility or "selected")
+                return visibility != "private"
+        if uploaded[1] == "selected":
+            self.gh.json("PUT", f"/orgs/{org}/actions/secrets/{name}/repositories/{repo_id}")
+        return uploaded[1] != "private"
+
+    def upload_org_secrets(self, org, repo_full_name, secrets):
+        """Secret cấp org chỉ được mã hóa/upload một lần mỗi tiến trình; các repo sau chỉ cần được cấp quyền truy cập."""
+        repo_id = self.gh.json("GET", f"/repos/{repo_full_name}")["id"]
+        reached = self._put_all([lambda name=name, value=value: self.upload_org_secret(org, name, value, repo_id) for name, value in secrets.items()])
+        repo_only = {name: value for (name, value), ok in zip(secrets.items(), reached) if not ok}
+        if repo_only:
+            self.upload_repo_secrets(repo_full_name, repo_only)
+
+    @traced("secrets.upload")
+    def upload(self, repo_full_name, secrets):
+        owner = repo_full_name.split("/")[0]
+        # Tài khoản cá nhân không có Actions secret dùng chung nên phải upload theo từng repo
+        if self.gh.owner_is_org(owner):
+            self.upload_org_secrets(owner, repo_full_name, secrets)
+        else:
+            self.upload_repo_secrets(repo_full_name, secrets)
@@ -0,0 +1,103 @@
+import sys
+import json
+import argparse
+import threading
+from pathlib import Path
+
+from git_data import git_blob_sha
+
+# ==============================================================================
+# Kho template theo ngôn ngữ: file boilerplate cố định + manifest có SHA blob git tính sẵn
+# ==============================================================================
+TEMPLATES_DIR = Path(__file__).resolve().parent.parent / "templates"
+LANGUAGE_ALIASES = {"flutter": "flutter", "dart": "flutter", "python": "python", "android": "android", "kotlin": "android"}
+
+
+class Template:
+    """Một phiên bản template: files (path -> nội dung), shas (path -> blob sha), overridable (path AI được phép ghi đè)."""
+
+    def __init__(self, name, manifest, files):
+        self.name = name
+        self.version = manifest["version"]
+        self.files = files
+        self.shas = {path: entry["sha"] for path, entry in manifest["files"].items()}
+        self.overridable = set(manifest.get("overridable", []))
+
+    def locked_paths(self):
+        return sorted(path for path in self.files if path not in self.overridable)
+
+    def prompt_note(self):
+        """Đoạn prompt báo cho model biết các file boilerplate đã có sẵn để không sinh lại."""
+        note = "Các file sau ĐÃ CÓ SẴN từ template, KHÔNG tạo lại:\n" + "\n".join(f"- {path}" for path in self.locked_paths())
+        if self.overridable:
+            note += "\nCác file sau có sẵn bản mặc định, chỉ tạo lại nếu cần thay đổi: " + ", ".join(sorted(self.overridable))
+        return note
+
+    def merge(self, generated):
+        """Ghép output của model với template; file boilerplate luôn lấy từ template trừ các path `overridable`."""
+        dropped = [path for path in generated if path in self.files and path not in self.overridable]
+        merged = dict(self.files)
+        merged.update({path: content for path, content in generated.items() if path not in dropped})
+        if dropped:
+            print(f"   - Bỏ {len(dropped)} file boilerplate do AI sinh lại, dùng bản template: {', '.join(dropped)}")
+        return merged
+
+
+def manifest_path(name):
+    return TEMPLATES_DIR / name / "manifest.json"
+
+
+def read_template_files(name):
+    root = TEMPLATES_DIR / name / "files"
+    return {path.relative_to(root).as_posix(): path.read_text(encoding="utf-8") for path in sorted(root.rglob("*")) if path.is_file()}
+
+
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+def load_template(language):
+    """Template cho ngôn ngữ (đọc từ đĩa một lần mỗi tiến trình); None nếu ngôn ngữ chưa có template."""
+    name = LANGUAGE_ALIASES.get((language or "").strip().lower())
+    if not name or not manifest_path(name).exists():
+        return None
+    with _templates_lock:
+        if name not in _templates:
+            manifest = json.loads(manifest_path(name).read_text(encoding="utf-8"))
+            files = {path: (TEMPLATES_DIR / name / "files" / path).read_text(encoding="utf-8") for path in manifest["files"]}
+            stale = [path for path, content in files.items() if git_blob_sha(content) != manifest["files"][path]["sha"]]
+            if stale:
+                raise ValueError(f"Manifest của template `{name}` đã cũ ({', '.join(stale)}); chạy `template_store.py --rebuild`.")
+            _templates[name] = Template(name, manifest, files)
+        return _templates[name]
+
+
+def rebuild_manifest(name):
+    """Tính lại SHA cho mọi file của template; tăng version nếu nội dung thay đổi. Trả về True nếu có thay đổi."""
+    path = manifest_path(name)
+    old = json.loads(path.read_text(encoding="utf-8")) if path.exists() else {"version": 0, "files": {}}
+    files = {file_path: {"sha": git_blob_sha(content), "size": len(content.encode("utf-8"))} for file_path, content in read_template_files(name).items()}
+    if files == old["files"]:
+        return False
+    manifest = {"version": old["version"] + 1, "language": name, "overridable": old.get("overridable", []), "files": files}
+    path.write_text(json.dumps(manifest, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Quản lý kho template")
+    parser.add_argument("--rebuild", action="store_true", help="Tính lại SHA và version trong manifest.json của mọi template")
+    args = parser.parse_args()
+    names = sorted(path.name for path in TEMPLATES_DIR.iterdir() if (path / "files").is_dir())
+    stale = []
+    for name in names:
+        if args.rebuild:
+            changed = rebuild_manifest(name)
+            print(f"{'🔄' if changed else '✅'} {name}: {'đã cập nhật manifest' if changed else 'không thay đổi'}")
+        else:
+            manifest = json.loads(manifest_path(name).read_text(encoding="utf-8")) if manifest_path(name).exists() else {"files": {}}
+            current = {path: git_blob_sha(content) for path, content in read_template_files(name).items()}
+            ok = current == {path: entry["sha"] for path, entry in manifest["files"].items()}
+            stale += [] if ok else [name]
+            print(f"{'✅' if ok else '❌'} {name} v{manifest.get('version', 0)}: {len(current)} file")
+    sys.exit(1 if stale else 0)
@@ -0,0 +1,164 @@
+import os
+import re
+import json
+import time
+import threading
+import functools
+from collections import defaultdict
+from contextlib import contextmanager
+
+# ==============================================================================
+# Tracing nhẹ: span theo từng giai đoạn, thời gian từng lời gọi HTTP/model -> file JSONL + bảng tóm tắt
+# ==============================================================================
+# Để trống TRACE_FILE để tắt ghi file (vẫn tổng hợp trong bộ nhớ cho bảng tóm tắt)
+TRACE_FILE = os.environ.get("TRACE_FILE", ".cache/trace.jsonl")
+# Gom các path API theo route để bảng tóm tắt không bị chia nhỏ theo từng repo/sha
+ROUTE_RES = [
+    (re.compile(r"^https?://[^/]+"), ""),
+    (re.compile(r"^/repos/[^/]+/[^/]+"), "/repos/:repo"),
+    (re.compile(r"^/(users|orgs)/[^/]+"), r"/\1/:owner"),
+    (re.compile(r"/[0-9a-f]{40}\b"), "/:sha"),
+    (re.compile(r"/\d+\b"), "/:id"),
+    (re.compile(r"(/git/refs/heads)/.+$"), r"\1/:branch"),
+    (re.compile(r"(/contents|/actions/secrets)/.+$"), r"\1/:name"),
+]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def route_of(url):
+    for pattern, replacement in ROUTE_RES:
+        url = pattern.sub(replacement, url)
+    return url.split("?")[0]
+
+
+class Tracer:
+    """Ghi sự kiện ra file JSONL (append, thread-safe) và giữ số liệu tổng hợp cho bảng tóm tắt."""
+
+    def __init__(self, path=TRACE_FILE):
+        self.path = path
+        self.run_id = f"{os.getpid()}-{int(time.time())}"
+        self._lock = threading.Lock()
+        self._file = None
+        self._local = threading.local()
+        self._next_id = 0
+        self.spans = defaultdict(list)          # tên span -> [thời lượng]
+        self.span_errors = defaultdict(int)
+        self.http = defaultdict(list)           # (method, route) -> [độ trễ]
+        self.http_errors = defaultdict(int)
+        self.retries = 0
+        self.rate_limit_remaining = None
+        self.models = defaultdict(lambda: {"calls": 0, "cache_hits": 0, "prompt_tokens": 0, "output_tokens": 0, "latencies": []})
+
+    def emit(self, record):
+        if not self.path:
+            return
+        record = {"run": self.run_id, "ts": round(time.time(), 3), **record}
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line)
+            self._file.flush()
+
+    @contextmanager
+    def span(self, name, **attrs):
+        stack = self._local.__dict__.setdefault("stack", [])
+        with self._lock:
+            self._next_id += 1
+            span_id = self._next_id
+        parent = stack[-1] if stack else None
+        stack.append(span_id)
+        started = time.monotonic()
+        status = "ok"
+        try:
+            yield attrs
+        except BaseException as e:
+            status = f"error: {e.__class__.__name__}"
+            raise
+        finally:
+            stack.pop()
+            duration = time.monotonic() - started
+            with self._lock:
+                self.spans[name].append(duration)
+                if status != "ok":
+                    self.span_errors[name] += 1
+            self.emit({"type": "span", "id": span_id, "parent": parent, "name": name, "duration": round(duration, 4),
+                       "status": status, "thread": threading.current_thread().name, "attrs": attrs})
+
+    def record_http(self, method, url, status, latency, rate_limit_remaining=None):
+        route = route_of(url)
+        with self._lock:
+            self.http[(method, route)].append(latency)
+            if status is None or status >= 400:
+                self.http_errors[(method, route)] += 1
+            if rate_limit_remaining is not None:
+                self.rate_limit_remaining = rate_limit_remaining
+        self.emit({"type": "http", "method": method, "route": route, "status": status, "latency": round(latency, 4),
+                   "rate_limit_remaining": rate_limit_remaining})
+
+    def record_retry(self, kind, **attrs):
+        with self._lock:
+            self.retries += 1
+        self.emit({"type": "retry", "kind": kind, **attrs})
+
+    def record_model(self, model_name, prompt_tokens, output_tokens, latency, cached=False):
+        with self._lock:
+            stats = self.models[model_name]
+            if cached:
+                stats["cache_hits"] += 1
+            else:
+                stats["calls"] += 1
+                stats["prompt_tokens"] += prompt_tokens
+                stats["output_tokens"] += output_tokens
+                stats["latencies"].append(latency)
+        self.emit({"type": "model", "model": model_name, "prompt_tokens": prompt_tokens, "output_tokens": output_tokens,
+                   "latency": round(latency, 4), "cached": cached})
+
+    def summary_markdown(self, title):
+        with self._lock:
+            lines = [f"### ⏱️ {title}: trace", "", "| Giai đoạn | Số lần | Tổng (s) | p50 (s) | p95 (s) | Lỗi |", "|---|---:|---:|---:|---:|---:|"]
+            for name, durations in sorted(self.spans.items(), key=lambda item: -sum(item[1])):
+                lines.append(f"| `{name}` | {len(durations)} | {sum(durations):.2f} | {percentile(durations, 0.5):.2f} | {percentile(durations, 0.95):.2f} | {self.span_errors[name]} |")
+            if self.http:
+                lines += ["", f"**GitHub API:** {sum(map(len, self.http.values()))} lời gọi, {self.retries} retry, rate limit còn {self.rate_limit_remaining if self.rate_limit_remaining is not None else '?'}", "",
+                          "| Route | Số lần | Tổng (s) | p95 (s) | Lỗi |", "|---|---:|---:|---:|---:|"]
+                for (method, route), latencies in sorted(self.http.items(), key=lambda item: -sum(item[1]))[:15]:
+                    lines.append(f"| `{method} {route}` | {len(latencies)} | {sum(latencies):.2f} | {percentile(latencies, 0.95):.2f} | {self.http_errors[(method, route)]} |")
+            if self.models:
+                lines += ["", "| Model | Lời gọi | Cache hit | Token vào | Token ra | p95 (s) |", "|---|---:|---:|---:|---:|---:|"]
+                for model_name, stats in sorted(self.models.items()):
+                    lines.append(f"| `{model_name}` | {stats['calls']} | {stats['cache_hits']} | {stats['prompt_tokens']} | {stats['output_tokens']} | {percentile(stats['latencies'], 0.95):.2f} |")
+        return "\n".join(lines) + "\n"
+
+    def write_summary(self, title):
+        """In bảng tóm tắt và ghi thêm vào $GITHUB_STEP_SUMMARY khi chạy trong GitHub Actions."""
+        markdown = self.summary_markdown(title)
+        print(markdown)
+        summary_path = os.environ.get("GITHUB_STEP_SUMMARY")
+        if summary_path:
+            with open(summary_path, "a", encoding="utf-8") as f:
+                f.write(markdown)
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+tracer = Tracer()
+span = tracer.span
+
+
+def traced(name):
+    """Decorator: bọc toàn bộ hàm trong một span."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,199 @@
+import os
+import re
+import json
+import posixpath
+
+# ==============================================================================
+# Kiểm tra cục bộ trước khi commit: bắt lỗi cú pháp hiển nhiên mà không tốn một vòng build CI
+# ==============================================================================
+VALIDATION_RETRIES = int(os.environ.get("VALIDATION_RETRIES", "2"))
+BRACE_CHECKED_EXTENSIONS = (".dart", ".kt", ".kts", ".java", ".gradle")
+PAIRS = {")": "(", "]": "[", "}": "{"}
+
+DART_IMPORT_RE = re.compile(r"^\s*(?:import|export|part)\s+['\"]([^'\"]+)['\"]", re.MULTILINE)
+KOTLIN_PACKAGE_RE = re.compile(r"^\s*package\s+([\w.]+)", re.MULTILINE)
+KOTLIN_IMPORT_RE = re.compile(r"^\s*import\s+([\w.]+)(?:\s+as\s+\w+)?\s*$", re.MULTILINE)
+PUBSPEC_NAME_RE = re.compile(r"^name:\s*([\w\-]+)", re.MULTILINE)
+PUBSPEC_ASSET_RE = re.compile(r"^\s*-\s*(?:asset:\s*)?((?:assets|fonts|images)/[^\s#]*)", re.MULTILINE)
+ANDROID_COMPONENT_RE = re.compile(r"<(activity|service|receiver|provider|application)\b[^>]*?android:name=\"([\w.$]+)\"", re.DOTALL)
+
+
+def check_brackets(text, path):
+    """Quét một lượt, bỏ qua chuỗi và comment (kiểu C/Dart/Kotlin); trả về mô tả lỗi đầu tiên hoặc None."""
+    stack = []
+    i, line, n = 0, 1, len(text)
+    while i < n:
+        c = text[i]
+        if c == "\n":
+            line += 1
+        elif text.startswith("//", i):
+            end = text.find("\n", i)
+            i = n if end == -1 else end
+            continue
+        elif text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            if end == -1:
+                return f"comment `/*` mở ở dòng {line} không được đóng"
+            line += text.count("\n", i, end)
+            i = end + 2
+            continue
+        elif c in "\"'":
+            quote = text[i:i + 3] if text[i:i + 3] in ('"""', "'''") else c
+            # Chuỗi raw của Dart (`r'C:\path\'`): `\` và `${` không có nghĩa đặc biệt
+            raw = i > 0 and text[i - 1] == "r" and not (i > 1 and (text[i - 2].isalnum() or text[i - 2] in "_$"))
+            start_line = line
+            i += len(quote)
+            while i < n and not text.startswith(quote, i):
+                if text[i] == "\\" and not raw:
+                    i += 1
+                elif text.startswith("${", i) and not raw:
+                    # Biểu thức nội suy có thể chứa dấu nháy lồng nhau: `'${map['key']}'`
+                    depth, i = 1, i + 2
+                    while i < n and depth:
+                        depth += {"{": 1, "}": -1}.get(text[i], 0)
+                        i += 1
+                    continue
+                elif text[i] == "\n":
+                    if len(quote) == 1 and not path.endswith(".gradle"):
+                        return f"chuỗi mở ở dòng {start_line} không được đóng trên cùng dòng"
+                    line += 1
+                i += 1
+            if i >= n:
+                return f"chuỗi mở ở dòng {start_line} không được đóng"
+            i += len(quote)
+            continue
+        elif c in "([{":
+            stack.append((c, line))
+        elif c in ")]}":
+            if not stack or stack[-1][0] != PAIRS[c]:
+                return f"`{c}` ở dòng {line} không khớp" + (f" với `{stack[-1][0]}` mở ở dòng {stack[-1][1]}" if stack else "")
+            stack.pop()
+        i += 1
+    if stack:
+        return f"`{stack[-1][0]}` mở ở dòng {stack[-1][1]} không được đóng"
+    return None
+
+
+def check_syntax(path, content):
+    """Kiểm tra cú pháp theo loại file; trả về thông báo lỗi hoặc None."""
+    lower = path.lower()
+    try:
+        if lower.endswith(".json"):
+            json.loads(content)
+        elif lower.endswith((".yaml", ".yml")):
+            try:
+                import yaml  # PyYAML là tùy chọn; không có thì chỉ kiểm tra thụt lề bằng tab
+            except ImportError:
+                tab_line = next((no for no, text in enumerate(content.split("\n"), 1) if text[:len(text) - len(text.lstrip())].count("\t")), None)
+                return f"YAML không cho phép thụt lề bằng tab (dòng {tab_line})" if tab_line else None
+            list(yaml.safe_load_all(content))
+        elif lower.endswith(".xml"):
+            import xml.etree.ElementTree as ET
+            ET.fromstring(content.encode("utf-8"))
+        elif lower.endswith(".py"):
+            compile(content, path, "exec")
+        elif lower.endswith(BRACE_CHECKED_EXTENSIONS):
+            return check_brackets(content, lower)
+    except SyntaxError as e:
+        return f"lỗi cú pháp ở dòng {e.lineno}: {e.msg}" if e.lineno else f"lỗi cú pháp: {e}"
+    except Exception as e:
+        return f"{e.__class__.__name__}: {e}".split("\n")[0]
+    return None
+
+
+def check_dart_imports(path, content, files, package):
+    problems = []
+    for spec in DART_IMPORT_RE.findall(content):
+        if spec.startswith("package:"):
+            name, _, rest = spec[len("package:"):].partition("/")
+            if name != package:
+                continue
+            target = f"lib/{rest}"
+        elif spec.startswith("dart:"):
+            continue
+        else:
+            target = posixpath.normpath(posixpath.join(posixpath.dirname(path), spec))
+        if target not in files:
+            problems.append(f"import `{spec}` trỏ tới `{target}` không tồn tại")
+    return problems
+
+
+def kotlin_symbols(files):
+    """package -> toàn bộ nội dung các file Kotlin/Java khai báo package đó."""
+    packages = {}
+    for path, content in files.items():
+        if path.endswith((".kt", ".java")) and isinstance(content, str):
+            match = KOTLIN_PACKAGE_RE.search(content)
+            if match:
+                packages.setdefault(match.group(1), []).append(content)
+    return {package: "\n".join(contents) for package, contents in packages.items()}
+
+
+def check_kotlin_imports(content, packages):
+    problems = []
+    for name in KOTLIN_IMPORT_RE.findall(content):
+        package, _, symbol = name.rpartition(".")
+        # Chỉ kiểm tra import trỏ vào package của chính dự án; thư viện ngoài không thể kiểm tra cục bộ
+        if package in packages and symbol != "*" and not re.search(
+                rf"\b(class|interface|object|fun|val|var|typealias|enum class|data class)\s+(<[^>]*>\s*)?{re.escape(symbol)}\b", packages[package]):
+            problems.append(f"import `{name}`: không tìm thấy `{symbol}` trong package `{package}` của dự án")
+    return problems
+
+
+def check_manifests(files):
+    """File cấu hình phải trỏ tới file có thật: asset trong pubspec, activity trong AndroidManifest, lib/main.dart."""
+    problems = []
+    pubspec = files.get("pubspec.yaml")
+    if isinstance(pubspec, str):
+        if "flutter:" in pubspec and "lib/main.dart" not in files:
+            problems.append(("pubspec.yaml", "dự án Flutter thiếu `lib/main.dart`"))
+        for asset in PUBSPEC_ASSET_RE.findall(pubspec):
+            if not (asset in files or (asset.endswith("/") and any(path.startswith(asset) for path in files))):
+                problems.append(("pubspec.yaml", f"asset `{asset}` không tồn tại trong repo"))
+    for path, content in files.items():
+        if not path.endswith("AndroidManifest.xml") or not isinstance(content, str):
+            continue
+        package_match = re.search(r'\bpackage="([\w.]+)"', content)
+        for tag, name in ANDROID_COMPONENT_RE.findall(content):
+            if name.startswith(("android.", "androidx.", "io.flutter.", "com.google.")):
+                continue
+            if name.startswith("."):
+                name = (package_match.group(1) if package_match else "") + name
+            class_name = name.rsplit(".", 1)[-1]
+            source_files = [p for p in files if p.endswith((f"/{class_name}.kt", f"/{class_name}.java"))]
+            # Khi không có file Kotlin/Java nào (ví dụ template Flutter chưa sinh), không thể kết luận
+            if not source_files and any(p.endswith((".kt", ".java")) for p in files):
+                problems.append((path, f"<{tag}> `{name}` không có file nguồn tương ứng"))
+    return problems
+
+
+def validate_files(files, paths=None, baseline=None):
+    """Kiểm tra `files` (path -> nội dung; giá trị không phải str như file nhị phân chỉ được dùng để đối chiếu tồn tại). `paths` giới hạn các file được kiểm tra cú pháp/import
+    (ví dụ chỉ các file vừa bị sửa), nhưng tham chiếu luôn được đối chiếu với toàn bộ `files`.
+    Lỗi tham chiếu đã có sẵn trong `baseline` (nội dung trước khi sửa) được bỏ qua.
+    Trả về danh sách (path, thông báo), rỗng nếu không phát hiện vấn đề."""
+    paths = list(files) if paths is None else [path for path in paths if path in files]
+    problems = []
+    match = PUBSPEC_NAME_RE.search(files.get("pubspec.yaml") or "")
+    dart_package = match.group(1) if match else None
+    packages = None
+    for path in paths:
+        content = files[path]
+        if not isinstance(content, str):
+            continue
+        error = check_syntax(path, content)
+        if error:
+            problems.append((path, error))
+            continue
+        if path.endswith(".dart"):
+            problems.extend((path, message) for message in check_dart_imports(path, content, files, dart_package))
+        elif path.endswith((".kt", ".java")):
+            packages = kotlin_symbols(files) if packages is None else packages
+            problems.extend((path, message) for message in check_kotlin_imports(content, packages))
+    known = set(check_manifests(baseline)) if baseline else set()
+    problems.extend(problem for problem in check_manifests(files) if problem not in known)
+    return problems
+
+
+def format_problems(problems):
+    return "\n".join(f"- `{path}`: {message}" for path, message in problems)
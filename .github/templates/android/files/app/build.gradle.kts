@@ -0,0 +1,3 @@
+plugins{id("com.android.application");id("org.jetbrains.kotlin.android")}
+android{namespace="com.example.aifactoryapp";compileSdk=34;defaultConfig{applicationId="com.example.aifactoryapp";minSdk=24;targetSdk=34;versionCode=1;versionName="1.0"};buildTypes{release{isMinifyEnabled=false;proguardFiles(getDefaultProguardFile("proguard-android-optimize.txt"),"proguard-rules.pro")}};compileOptions{sourceCompatibility=JavaVersion.VERSION_1_8;targetCompatibility=JavaVersion.VERSION_1_8};kotlinOptions{jvmTarget="1.8"}}
+dependencies{implementation("androidx.core:core-ktx:1.12.0");implementation("androidx.appcompat:appcompat:1.6.1");implementation("com.google.android.material:material:1.11.0");implementation("androidx.constraintlayout:constraintlayout:2.1.4")}